@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from pathlib import Path
+from libparser import file_digest
+from vparser import PARSER_VERSION
+from csrgraph import CSRGraph, SNAPSHOT_VERSION
+
+CACHE_DIR = "graph_data/build_cache"
+# 默认的磁盘预算
+MAX_BYTES = 1 << 30
+# 建图规则的版本。HeterDiG_GateWireNodePinEdge.build 得到的图结构有改动时要加一。
+BUILD_VERSION = 1
+
+def vlib_digest(vlib):
+    """
+    工艺库 (vlib) 的摘要。vlib 可以是路径、方向表 (dict) 或它们的列表，与 vparser.read_vlib 的参数相同。
+    """
+    h = hashlib.sha1()
+    if vlib is None:
+        h.update(b"none")
+    elif isinstance(vlib, dict):
+        h.update(json.dumps(vlib, sort_keys=True).encode())
+    elif isinstance(vlib, (str, Path)):
+        h.update(file_digest(vlib).encode())
+    else:
+        for v in vlib:
+            h.update(vlib_digest(v).encode())
+    return h.hexdigest()
+
+def _dir_size(path):
+    return sum(f.stat().st_size for f in Path(path).iterdir() if f.is_file())
+
+class BuildCache:
+    """
+    按内容寻址的建图缓存：键由 verilog 文件内容的哈希、解析器/建图/快照格式的版本号和 vlib 的哈希组成，
+    值是建好的图的快照 (csrgraph.CSRGraph.save 的格式)。命中时直接读快照，不再解析 verilog.
+
+    缓存放在 cache_dir 下，每个条目一个 <key>.snap 目录，以其中 meta.json 的修改时间作为最近一次使用的时间。
+    总大小超过 max_bytes 时按 LRU 淘汰。
+
+    Parameters
+    ----------
+    cache_dir : str or pathlib.Path
+            缓存目录。
+    max_bytes : int
+            磁盘预算（字节）。
+
+    属性
+    ---------
+    + stats : {"hits", "misses", "stores", "evictions"}, 本对象的命中统计。累计的统计存放在 cache_dir/stats.json 中，见 total_stats.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def __repr__(self):
+        return f"BuildCache({self.cache_dir}, {len(self.entries())} entries, {self.size()/2**20:.1f}/{self.max_bytes/2**20:.0f} MB, {self.stats})"
+
+    def key(self, path, vlib=None):
+        """verilog 文件 path 和工艺库 vlib 对应的缓存键。"""
+        h = hashlib.sha1()
+        h.update(file_digest(path).encode())
+        h.update(f"parser={PARSER_VERSION};build={BUILD_VERSION};snapshot={SNAPSHOT_VERSION}".encode())
+        h.update(vlib_digest(vlib).encode())
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return self.cache_dir / f"{key}.snap"
+
+    def entries(self):
+        """所有完整的缓存条目, list of (pathlib.Path 条目目录, float 最近使用时间, int 字节数)，最久未用的在前。"""
+        if not self.cache_dir.is_dir():
+            return []
+        result = []
+        for d in self.cache_dir.glob("*.snap"):
+            meta = d / "meta.json"
+            try:
+                result.append((d, meta.stat().st_mtime, _dir_size(d)))
+            except OSError:
+                continue    # 正在写入或已被别的进程删除
+        result.sort(key=lambda x: x[1])
+        return result
+
+    def size(self):
+        return sum(x[2] for x in self.entries())
+
+    def get(self, key, mmap=True):
+        """
+        Returns
+        -------
+        (CSRGraph, dict) or None
+                命中时返回图和写入时附带的信息 (例如模块名)，未命中返回 None.
+        """
+        entry = self._entry(key)
+        try:
+            graph = CSRGraph.load(entry, mmap=mmap)
+            with open(entry / "entry.json") as f:
+                info = json.load(f)
+        except (OSError, ValueError, KeyError):
+            self._count("misses")
+            return None
+        os.utime(entry / "meta.json")     # 记录最近一次使用
+        self._count("hits")
+        return graph, info
+
+    def put(self, key, graph, **info):
+        """把图 (CSRGraph) 存入缓存，info 会原样存下并在命中时返回。存完后按 LRU 淘汰超出预算的条目。"""
+        entry = self._entry(key)
+        tmp = self.cache_dir / f"{key}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        graph.save(tmp)
+        with open(tmp / "entry.json", "w") as f:
+            json.dump(info, f)
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)   # 别的进程已经写好了同一个条目
+        self._count("stores")
+        self.evict(keep=entry)
+
+    def evict(self, keep=None):
+        """淘汰最久未使用的条目，直到总大小不超过 max_bytes. 条目 keep 不会被淘汰。"""
+        entries = self.entries()
+        total = sum(x[2] for x in entries)
+        for d, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            if d == keep:
+                continue
+            shutil.rmtree(d, ignore_errors=True)
+            total -= size
+            self._count("evictions")
+
+    def clear(self):
+        """删除所有缓存条目。"""
+        for d, _, _ in self.entries():
+            shutil.rmtree(d, ignore_errors=True)
+
+    def _count(self, what):
+        self.stats[what] += 1
+        # 累计统计只是尽力而为，多个进程同时写时可能丢几次计数
+        path = self.cache_dir / "stats.json"
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            total = self.total_stats()
+            total[what] = total.get(what, 0) + 1
+            with open(path, "w") as f:
+                json.dump(total, f)
+        except OSError:
+            pass
+
+    def total_stats(self):
+        """cache_dir 下所有进程累计的命中统计。"""
+        try:
+            with open(self.cache_dir / "stats.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+if __name__ == "__main__":
+    import sys
+    from graphize import HeterDiG_GateWireNodePinEdge
+
+    # python buildcache.py [xxx.v]  比较不用缓存、缓存未命中和缓存命中时的建图耗时
+    file_name = sys.argv[1] if len(sys.argv) > 1 else Path(__file__).parent / "benchmarks/TAU19/s1196/design/s1196.v"
+    cache = BuildCache(Path(CACHE_DIR) / "bench")
+    cache.clear()
+    for backend in ("networkx", "csr"):
+        for label, c in (("不用缓存", None), ("未命中", cache), ("命中", cache)):
+            if label == "未命中":
+                cache.clear()
+            netlist = HeterDiG_GateWireNodePinEdge(backend=backend)
+            t0 = time.perf_counter()
+            netlist.build(file_name, cache=c)
+            print(f"{backend:8s} {label}: {time.perf_counter()-t0:.3f} s")
+    print(cache)
+    cache.clear()
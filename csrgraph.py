@@ -0,0 +1,714 @@
+import json
+import pickle
+import numpy as np
+from pathlib import Path
+from collections.abc import Mapping, MutableMapping
+
+# 按列存放的节点属性和边属性，其余的属性放在稀疏的 extra 字典里
+NODE_COLUMNS = ("type", "subtype", "function", "spec", "iotype")
+EDGE_COLUMNS = ("type", "subtype")
+# 由边推导出来的 gate 属性 {引脚名: wire}, 不单独存放
+DERIVED_ATTRS = ("fanin", "fanout")
+
+# 快照格式的版本号，格式有不兼容的改动时要加一
+SNAPSHOT_VERSION = 2
+_SNAPSHOT_ARRAYS = ("names", "out_ptr", "out_dst", "in_ptr", "in_src", "in_eid", "node_order")
+
+class StringTable:
+    """字符串驻留表：每个不同的字符串只存一份，列中只存它的 int32 编号。"""
+
+    def __init__(self, values=()):
+        self.values = []
+        self.codes = dict()
+        for v in values:
+            self.code(v)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def code(self, value):
+        c = self.codes.get(value)
+        if c is None:
+            c = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+    def encode(self, values):
+        """把一串字符串（None 表示缺失）编码成 int32 数组，缺失为 -1."""
+        return np.fromiter((-1 if v is None else self.code(v) for v in values), dtype=np.int32)
+
+class _NodeAttrs(MutableMapping):
+    # 单个节点的属性字典视图，读写都直接落到 CSRGraph 的列上
+    __slots__ = ("g", "i")
+
+    def __init__(self, g, i):
+        self.g = g
+        self.i = i
+
+    def _is_cell(self):
+        c = self.g.node_cols["type"][self.i]
+        return c >= 0 and self.g.node_tables["type"][c] in ("gate", "flipflop")
+
+    def __getitem__(self, key):
+        g, i = self.g, self.i
+        if key in g.node_cols:
+            c = g.node_cols[key][i]
+            if c < 0:
+                raise KeyError(key)
+            return g.node_tables[key][c]
+        if key in DERIVED_ATTRS and self._is_cell():
+            return g.pin_map(i, key == "fanout")
+        return g.node_extra[i][key]
+
+    def __setitem__(self, key, value):
+        g, i = self.g, self.i
+        if key in g.node_cols:
+            g.node_cols[key][i] = -1 if value is None else g.node_tables[key].code(value)
+        elif key in DERIVED_ATTRS:
+            raise TypeError(f"'{key}' is derived from the edges of a CSRGraph and cannot be assigned")
+        else:
+            g.node_extra.setdefault(i, dict())[key] = value
+
+    def __delitem__(self, key):
+        g, i = self.g, self.i
+        if key in g.node_cols:
+            if g.node_cols[key][i] < 0:
+                raise KeyError(key)
+            g.node_cols[key][i] = -1
+        else:
+            del g.node_extra[i][key]
+            if not g.node_extra[i]:
+                del g.node_extra[i]
+
+    def __iter__(self):
+        g, i = self.g, self.i
+        for key, col in g.node_cols.items():
+            if col[i] >= 0:
+                yield key
+        if self._is_cell():
+            yield from DERIVED_ATTRS
+        yield from g.node_extra.get(i, ())
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class _NodeView(Mapping):
+    # 仿照 networkx 的 G.nodes: 可以迭代、取属性、以及 G.nodes(data=...) 的调用形式
+    __slots__ = ("g",)
+
+    def __init__(self, g):
+        self.g = g
+
+    def __getitem__(self, n):
+        return _NodeAttrs(self.g, self.g.id(n))
+
+    def __iter__(self):
+        return iter(self.g)
+
+    def __len__(self):
+        return len(self.g)
+
+    def __contains__(self, n):
+        return n in self.g
+
+    def __call__(self, data=False, default=None):
+        g = self.g
+        if data is False:
+            return iter(g)
+        if data is True:
+            return ((n, _NodeAttrs(g, i)) for i, n in enumerate(g))
+        if data in g.node_cols:
+            col, table = g.node_cols[data], g.node_tables[data]
+            return ((n, default if c < 0 else table[c]) for n, c in zip(g, col.tolist()))
+        return ((n, _NodeAttrs(g, i).get(data, default)) for i, n in enumerate(g))
+
+class _AdjView(Mapping):
+    # 仿照 networkx 的 G.succ / G.pred: G.succ[u] -> {v: {key: 边属性}}
+    __slots__ = ("g", "reverse")
+
+    def __init__(self, g, reverse):
+        self.g = g
+        self.reverse = reverse
+
+    def __getitem__(self, n):
+        g = self.g
+        result = dict()
+        for j, e in zip(*g.neighbor_ids(g.id(n), self.reverse)):
+            keys = result.setdefault(g.names[j].decode(), dict())
+            keys[len(keys)] = g.edge_attrs(e)
+        return result
+
+    def __iter__(self):
+        return iter(self.g)
+
+    def __len__(self):
+        return len(self.g)
+
+class CSRGraph:
+    """
+    紧凑的只读有向多重图，可以代替 networkx.MultiDiGraph 作为 Netlist 的后端（见 Netlist 的 backend 参数）。
+
+    + 节点名按字典序排成一个定长 bytes 数组 (names), 节点的编号就是它在数组中的下标，查找用二分法；
+    + fanout/fanin 邻接关系存成 CSR: out_ptr/out_dst 和 in_ptr/in_src (int32), in_eid 把每条入边映射回出边的编号；
+      每个节点的出边和入边都保持建图时的先后顺序，node_order 记下节点原来的插入顺序，to_networkx 按它们还原出与原图顺序相同的图；
+    + 节点属性 type/subtype/function/spec/iotype 和边属性 type/subtype(引脚名) 都是 int32 编码的 NumPy 列 (-1 表示缺失)，
+      编码对应的字符串放在 StringTable 里；其余零散的属性（例如 rc）放在稀疏的 extra 字典里。
+
+    它实现了 Netlist 用到的 networkx 接口的只读子集 (nodes, succ, pred, predecessors, successors, get_edge_data, edges 等)，
+    节点属性可以修改，但图的结构不能修改，需要编辑时用 to_networkx() 转回去。
+    """
+
+    def __init__(self, names, out_ptr, out_dst, edge_cols, edge_tables, node_cols, node_tables,
+                 node_extra=None, edge_extra=None, in_csr=None, node_order=None, in_rank=None):
+        self.names = names
+        self.out_ptr = out_ptr
+        self.out_dst = out_dst
+        self.edge_cols = edge_cols
+        self.edge_tables = edge_tables
+        self.node_cols = node_cols
+        self.node_tables = node_tables
+        self.node_extra = node_extra if node_extra is not None else dict()
+        self.edge_extra = edge_extra if edge_extra is not None else dict()
+        # 节点在原图中的插入顺序 (节点编号的数组)，没有时就是字典序
+        self.node_order = node_order if node_order is not None else np.arange(len(names), dtype=np.int32)
+        if in_csr is None:
+            self._build_in_csr(in_rank)
+        else:
+            self.in_ptr, self.in_src, self.in_eid = in_csr
+
+    def _build_in_csr(self, in_rank=None):
+        # 入边按终点排序；终点相同的按 in_rank (每条出边在终点的入边中的次序) 排，没有时按出边的编号
+        n = len(self.names)
+        src = np.repeat(np.arange(n, dtype=np.int32), np.diff(self.out_ptr))
+        order = np.lexsort((in_rank, self.out_dst)) if in_rank is not None else np.argsort(self.out_dst, kind="stable")
+        self.in_eid = order.astype(np.int32)
+        self.in_src = src[order]
+        self.in_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.out_dst, minlength=n), out=self.in_ptr[1:])
+
+    @classmethod
+    def from_arrays(cls, names, src, dst, edge_attrs, node_attrs, node_extra=None, edge_extra=None, in_rank=None):
+        """
+        由节点名和边数组建图。
+
+        Parameters
+        ----------
+        names : list of str
+                所有节点名（不要求有序），按原图中的插入顺序排列。
+        src, dst : array of int
+                每条边两端的节点在 names 中的下标。
+        edge_attrs : {属性名: list of str or None}
+                每条边的属性，与 src/dst 一一对应。
+        node_attrs : {属性名: list of str or None}
+                每个节点的属性，与 names 一一对应。
+        node_extra, edge_extra : {下标: dict}
+                其余的节点属性和边属性。
+        in_rank : array of int (可以为空)
+                每条边在终点的所有入边中的次序，决定 pred 的顺序。默认按边在 src/dst 中的先后顺序。
+        """
+        names = list(names)
+        order = np.array(sorted(range(len(names)), key=names.__getitem__), dtype=np.int64)
+        rank = np.empty(len(names), dtype=np.int32)
+        rank[order] = np.arange(len(names), dtype=np.int32)
+        encoded = np.array([names[i].encode() for i in order], dtype=bytes) if names else np.zeros(0, dtype="S1")
+
+        src = rank[np.asarray(src, dtype=np.int64)]
+        dst = rank[np.asarray(dst, dtype=np.int64)]
+        eorder = np.lexsort((np.arange(len(src)), src))     # 按起点排序，起点相同的保持原顺序
+        out_dst = dst[eorder]
+        out_ptr = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(names)), out=out_ptr[1:])
+
+        edge_tables = {k: StringTable() for k in EDGE_COLUMNS}
+        edge_cols = {k: edge_tables[k].encode(edge_attrs.get(k, [None] * len(src)))[eorder] for k in EDGE_COLUMNS}
+        node_tables = {k: StringTable() for k in NODE_COLUMNS}
+        node_cols = {k: node_tables[k].encode(node_attrs.get(k, [None] * len(names)))[order] for k in NODE_COLUMNS}
+
+        einv = np.empty(len(src), dtype=np.int64)
+        einv[eorder] = np.arange(len(src))
+        node_extra = {int(rank[i]): d for i, d in (node_extra or {}).items()}
+        edge_extra = {int(einv[e]): d for e, d in (edge_extra or {}).items()}
+        in_rank = np.arange(len(src)) if in_rank is None else np.asarray(in_rank, dtype=np.int64)
+        return cls(encoded, out_ptr, out_dst.astype(np.int32), edge_cols, edge_tables, node_cols, node_tables,
+                   node_extra, edge_extra, node_order=rank, in_rank=in_rank[eorder])
+
+    @classmethod
+    def from_networkx(cls, graph):
+        """
+        把 networkx 的 (Multi)DiGraph 转成 CSRGraph. gate 的 fanin/fanout 属性由边推导，不会单独保存。
+        节点顺序、每个节点的 succ/pred 顺序都会保存下来；gate 的出边和入边按 fanout/fanin 中引脚的顺序排，这样 to_networkx 还原出的引脚顺序也不变。
+        """
+        names = list(graph)
+        index = {n: i for i, n in enumerate(names)}
+        node_attrs = {k: [] for k in NODE_COLUMNS}
+        node_extra = dict()
+        fanin, fanout = [], []      # 多引脚 gate 的 (编号, 引脚顺序)
+        for i, (n, data) in enumerate(graph.nodes(data=True)):
+            for k in NODE_COLUMNS:
+                node_attrs[k].append(data.get(k))
+            extra = {k: v for k, v in data.items() if k not in NODE_COLUMNS and k not in DERIVED_ATTRS}
+            if extra:
+                node_extra[i] = extra
+            for pins, key in ((fanin, "fanin"), (fanout, "fanout")):
+                if len(data.get(key) or ()) > 1:
+                    pins.append((i, data[key]))
+
+        def pin_order(edges, ends, pins):
+            # edges 按图中顺序排列，同一端点 (ends 升序) 的边是连续的一段；把多引脚 gate 那一段按引脚在 fanin/fanout 中的位置重排
+            ptr = np.searchsorted(ends, np.arange(len(names) + 1)).tolist()
+            for i, order in pins:
+                lo, hi = ptr[i], ptr[i + 1]
+                if hi - lo < 2:
+                    continue
+                position = {p: j for j, p in enumerate(order)}
+                key = [position.get(data.get("subtype"), len(position)) for _, _, data in edges[lo:hi]]
+                if key != sorted(key):
+                    span = edges[lo:hi]
+                    edges[lo:hi] = [span[j] for j in sorted(range(hi - lo), key=key.__getitem__)]
+
+        from vparser import gc_paused
+
+        with gc_paused():
+            # 直接 list(view) 会先调 len(view)，又把边全走一遍
+            out_edges = list(iter(graph.edges(data=True)))
+            src = [index[u] for u, _, _ in out_edges]     # 重排只在同一个 u 的一段内进行，src 不变
+            pin_order(out_edges, src, fanout)
+            dst = [index[v] for _, v, _ in out_edges]
+            edge_attrs = {k: [data.get(k) for _, _, data in out_edges] for k in EDGE_COLUMNS}
+            edge_extra = dict()
+            for e, (_, _, data) in enumerate(out_edges):
+                extra = {k: x for k, x in data.items() if k not in EDGE_COLUMNS}
+                if extra:
+                    edge_extra[e] = extra
+            # 每条边的属性字典都是单独的对象，用它的 id 把入边对应回出边
+            eid = {id(data): e for e, (_, _, data) in enumerate(out_edges)}
+            in_edges = list(iter(graph.in_edges(data=True)))
+            pin_order(in_edges, [index[v] for _, v, _ in in_edges], fanin)
+            in_rank = np.empty(len(src), dtype=np.int64)
+            in_rank[[eid[id(data)] for _, _, data in in_edges]] = np.arange(len(in_edges))
+        return cls.from_arrays(names, src, dst, edge_attrs, node_attrs, node_extra, edge_extra, in_rank)
+
+    def to_networkx(self):
+        """
+        转回 networkx.MultiDiGraph（包括由边推导出的 gate fanin/fanout 属性）。
+        节点按 node_order 的顺序插入，succ 按出边、pred 和 gate 的 fanin 按入边的顺序，与原来的图顺序相同。
+        """
+        import networkx as nx
+        from vparser import gc_paused
+
+        graph = nx.MultiDiGraph()
+        # 与 HeterDiG_GateWireNodePinEdge.build 一样，直接填 networkx 的内部字典，而不是逐条 add_edge
+        node, succ, pred = graph._node, graph._succ, graph._pred
+        with gc_paused():
+            names = self.decode(slice(None))
+            cols = [(k, col.tolist(), self.node_tables[k].values) for k, col in self.node_cols.items()]
+            for i in self.node_order.tolist():
+                n = names[i]
+                attr = {k: values[c[i]] for k, c, values in cols if c[i] >= 0}
+                if attr.get("type") in ("gate", "flipflop"):
+                    attr["fanin"] = dict()
+                    attr["fanout"] = dict()
+                attr.update(self.node_extra.get(i, ()))
+                node[n] = attr
+                succ[n] = dict()
+                pred[n] = dict()
+
+            # 按节点编号取各自的字典，省掉按名字查找
+            succs, preds = [succ[n] for n in names], [pred[n] for n in names]
+            fanins, fanouts = [node[n].get("fanin") for n in names], [node[n].get("fanout") for n in names]
+            # 入边顺序与出边编号顺序一致的节点，pred 和 fanin 在遍历出边时顺带填好；其余节点 (moved) 之后按入边单独填
+            dst = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.in_ptr))
+            moved = np.zeros(len(self), dtype=bool)
+            moved[dst[np.lexsort((np.arange(len(self.in_eid)), self.out_dst)) != self.in_eid]] = True
+            redo = moved[dst]
+            moved = moved.tolist()
+            src = np.repeat(np.arange(len(self), dtype=np.int32), np.diff(self.out_ptr)).tolist()
+            etype, epin = self.edge_cols["type"].tolist(), self.edge_cols["subtype"].tolist()
+            type_values, pin_values = self.edge_tables["type"].values, self.edge_tables["subtype"].values
+            edge_extra = self.edge_extra
+            for e, (u, v) in enumerate(zip(src, self.out_dst.tolist())):
+                un, vn = names[u], names[v]
+                data = dict()
+                if etype[e] >= 0:
+                    data["type"] = type_values[etype[e]]
+                if epin[e] >= 0:
+                    pin = data["subtype"] = pin_values[epin[e]]
+                    if fanouts[u] is not None:
+                        fanouts[u][pin] = vn
+                    if fanins[v] is not None and not moved[v]:
+                        fanins[v][pin] = un
+                if e in edge_extra:
+                    data.update(edge_extra[e])
+                keydict = succs[u].get(vn)
+                if keydict is None:
+                    keydict = succs[u][vn] = dict()
+                    if not moved[v]:
+                        preds[v][un] = keydict
+                keydict[len(keydict)] = data
+
+            # pred 与 succ 共享同一个 keydict, 按入边的顺序插入
+            for v, u, e in zip(dst[redo].tolist(), self.in_src[redo].tolist(), self.in_eid[redo].tolist()):
+                un = names[u]
+                if un not in preds[v]:
+                    preds[v][un] = succs[u][names[v]]
+                if epin[e] >= 0 and fanins[v] is not None:
+                    fanins[v][pin_values[epin[e]]] = un
+        return graph
+
+    def copy(self):
+        return CSRGraph(self.names.copy(), self.out_ptr.copy(), self.out_dst.copy(),
+                        {k: v.copy() for k, v in self.edge_cols.items()}, self.edge_tables,
+                        {k: v.copy() for k, v in self.node_cols.items()}, {k: StringTable(t.values) for k, t in self.node_tables.items()},
+                        {i: dict(d) for i, d in self.node_extra.items()}, {e: dict(d) for e, d in self.edge_extra.items()},
+                        in_csr=(self.in_ptr.copy(), self.in_src.copy(), self.in_eid.copy()), node_order=self.node_order.copy())
+
+    def save(self, path):
+        """
+        把图存成一个快照目录：每个数组一个 .npy 文件，字符串表等元数据在 meta.json 中，
+        零散的 extra 属性（如果有）用 pickle 存在 extra.pkl 中。
+
+        Parameters
+        ----------
+        path : str or pathlib.Path
+                快照目录，不存在时会自动创建。
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for k in _SNAPSHOT_ARRAYS:
+            np.save(path / f"{k}.npy", np.ascontiguousarray(getattr(self, k)))
+        for k, col in self.node_cols.items():
+            np.save(path / f"node.{k}.npy", np.ascontiguousarray(col))
+        for k, col in self.edge_cols.items():
+            np.save(path / f"edge.{k}.npy", np.ascontiguousarray(col))
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "nodes": len(self),
+            "edges": self.number_of_edges(),
+            "node_tables": {k: t.values for k, t in self.node_tables.items()},
+            "edge_tables": {k: t.values for k, t in self.edge_tables.items()},
+        }
+        extra = path / "extra.pkl"
+        if self.node_extra or self.edge_extra:
+            with open(extra, "wb") as f:
+                pickle.dump((self.node_extra, self.edge_extra), f, pickle.HIGHEST_PROTOCOL)
+        elif extra.exists():
+            extra.unlink()
+        # meta.json 最后写，它存在就说明快照是完整的
+        with open(path / "meta.json", "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        读入 save 写出的快照。mmap 为 True 时数组通过 numpy.memmap 以写时复制的方式映射，打开只需几毫秒，
+        数据在用到时才从磁盘调入；修改节点属性只会改内存中的副本，不会写回快照。
+
+        Raises
+        ------
+        ValueError
+                快照的版本与当前代码不一致。
+        """
+        path = Path(path)
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        if meta.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot version {meta.get('version')} is not supported (expected {SNAPSHOT_VERSION}), please rebuild it")
+        mode = "c" if mmap else None
+        arrays = {k: np.load(path / f"{k}.npy", mmap_mode=mode) for k in _SNAPSHOT_ARRAYS}
+        node_tables = {k: StringTable(v) for k, v in meta["node_tables"].items()}
+        edge_tables = {k: StringTable(v) for k, v in meta["edge_tables"].items()}
+        node_cols = {k: np.load(path / f"node.{k}.npy", mmap_mode=mode) for k in node_tables}
+        edge_cols = {k: np.load(path / f"edge.{k}.npy", mmap_mode=mode) for k in edge_tables}
+        node_extra, edge_extra = dict(), dict()
+        if (path / "extra.pkl").exists():
+            with open(path / "extra.pkl", "rb") as f:
+                node_extra, edge_extra = pickle.load(f)
+        return cls(arrays["names"], arrays["out_ptr"], arrays["out_dst"], edge_cols, edge_tables, node_cols, node_tables,
+                   node_extra, edge_extra, in_csr=(arrays["in_ptr"], arrays["in_src"], arrays["in_eid"]), node_order=arrays["node_order"])
+
+    @property
+    def nbytes(self):
+        """所有数组占用的字节数（不含字符串表和 extra 字典）。"""
+        arrays = [self.names, self.out_ptr, self.out_dst, self.in_ptr, self.in_src, self.in_eid, self.node_order]
+        arrays += list(self.node_cols.values()) + list(self.edge_cols.values())
+        return sum(a.nbytes for a in arrays)
+
+    # 节点编号和节点名之间的转换
+    def id(self, n):
+        """节点名 -> 编号，不存在时报 KeyError."""
+        key = n.encode() if isinstance(n, str) else n
+        i = int(np.searchsorted(self.names, key))
+        if i < len(self.names) and self.names[i] == key:
+            return i
+        raise KeyError(n)
+
+    def ids(self, ns):
+        """一串节点名 -> 编号数组，不存在时报 KeyError."""
+        keys = np.array([n.encode() for n in ns], dtype=self.names.dtype if len(ns) else "S1")
+        idx = np.searchsorted(self.names, keys)
+        idx = np.minimum(idx, len(self.names) - 1)
+        bad = self.names[idx] != keys
+        if bad.any():
+            raise KeyError(ns[int(np.argmax(bad))])
+        return idx.astype(np.int32)
+
+    def name(self, i):
+        return self.names[i].decode()
+
+    def decode(self, ids):
+        """编号数组 -> 节点名列表。"""
+        return [x.decode() for x in self.names[ids].tolist()]
+
+    # networkx 风格的只读接口
+    def __contains__(self, n):
+        try:
+            self.id(n)
+            return True
+        except (KeyError, AttributeError, TypeError):
+            return False
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return (x.decode() for x in self.names.tolist())
+
+    def number_of_edges(self):
+        return len(self.out_dst)
+
+    def is_directed(self):
+        return True
+
+    def is_multigraph(self):
+        return True
+
+    @property
+    def nodes(self):
+        return _NodeView(self)
+
+    @property
+    def succ(self):
+        return _AdjView(self, False)
+
+    @property
+    def pred(self):
+        return _AdjView(self, True)
+
+    adj = succ
+    _succ = succ
+    _pred = pred
+
+    def neighbor_ids(self, i, reverse=False):
+        """节点 i 的 (邻居编号, 边编号) 两个数组。reverse 为 True 时是前驱，否则是后继。"""
+        if reverse:
+            a, b = self.in_ptr[i], self.in_ptr[i + 1]
+            return self.in_src[a:b], self.in_eid[a:b]
+        a, b = self.out_ptr[i], self.out_ptr[i + 1]
+        return self.out_dst[a:b], np.arange(a, b)
+
+    def successors(self, n):
+        i = self.id(n)
+        names = self.names
+        return (names[j].decode() for j in dict.fromkeys(self.out_dst[self.out_ptr[i]:self.out_ptr[i + 1]].tolist()))
+
+    def predecessors(self, n):
+        i = self.id(n)
+        names = self.names
+        return (names[j].decode() for j in dict.fromkeys(self.in_src[self.in_ptr[i]:self.in_ptr[i + 1]].tolist()))
+
+    neighbors = successors
+
+    def edge_attrs(self, e):
+        attrs = {k: self.edge_tables[k][c] for k, c in ((k, self.edge_cols[k][e]) for k in EDGE_COLUMNS) if c >= 0}
+        attrs.update(self.edge_extra.get(int(e), ()))
+        return attrs
+
+    def get_edge_data(self, u, v, key=None, default=None):
+        try:
+            data = self.succ[u][v]
+        except KeyError:
+            return default
+        if key is None:
+            return data
+        return data.get(key, default)
+
+    def edges(self, nbunch=None, data=False):
+        ids = range(len(self)) if nbunch is None else [self.id(n) for n in ([nbunch] if isinstance(nbunch, str) else nbunch)]
+        for i in ids:
+            u = self.name(i)
+            for j, e in zip(*self.neighbor_ids(i)):
+                if data:
+                    yield u, self.name(j), self.edge_attrs(e)
+                else:
+                    yield u, self.name(j)
+
+    out_edges = edges
+
+    def in_edges(self, nbunch=None, data=False):
+        ids = range(len(self)) if nbunch is None else [self.id(n) for n in ([nbunch] if isinstance(nbunch, str) else nbunch)]
+        for i in ids:
+            v = self.name(i)
+            for j, e in zip(*self.neighbor_ids(i, True)):
+                if data:
+                    yield self.name(j), v, self.edge_attrs(e)
+                else:
+                    yield self.name(j), v
+
+    def pin_map(self, i, fanout):
+        """gate 节点 i 的 {引脚名: wire}, fanout 为 True 时是输出引脚，否则是输入引脚。"""
+        nbrs, eids = self.neighbor_ids(i, reverse=not fanout)
+        col, table = self.edge_cols["subtype"], self.edge_tables["subtype"]
+        return {table[col[e]]: self.name(j) for j, e in zip(nbrs, eids) if col[e] >= 0}
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("CSRGraph is read-only, convert it with to_networkx() (or Netlist.to_networkx()) before editing")
+
+    add_node = add_nodes_from = add_edge = add_edges_from = _read_only
+    remove_node = remove_nodes_from = remove_edge = remove_edges_from = _read_only
+
+    # 基于数组的快速遍历
+    def node_mask(self, attr, value):
+        """attr 属性等于 value 的节点的布尔掩码。"""
+        c = self.node_tables[attr].codes.get(value)
+        if c is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.node_cols[attr] == c
+
+    def attr_index(self, attrs):
+        """{属性名: {属性值: {节点: None}}} 形式的倒排索引，和 Netlist 中的 _attr_index 格式一致。"""
+        index = dict()
+        for a in attrs:
+            col, table = self.node_cols[a], self.node_tables[a]
+            order = np.argsort(col, kind="stable")
+            bounds = np.searchsorted(col[order], np.arange(len(table) + 1))
+            index[a] = {table[c]: dict.fromkeys(self.decode(order[bounds[c]:bounds[c + 1]]))
+                        for c in range(len(table)) if bounds[c + 1] > bounds[c]}
+        return index
+
+    def reachable_ids(self, sources, reverse=False):
+        """从 sources (编号数组) 出发能到达的所有节点（不含 sources 本身，除非它在环上）的布尔掩码，逐层用 NumPy 扩展。"""
+        ptr, nbr = (self.in_ptr, self.in_src) if reverse else (self.out_ptr, self.out_dst)
+        seen = np.zeros(len(self), dtype=bool)
+        frontier = np.asarray(sources, dtype=np.int64)
+        while len(frontier):
+            starts, ends = ptr[frontier], ptr[frontier + 1]
+            counts = ends - starts
+            if not counts.sum():
+                break
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            nxt = nbr[offsets]
+            nxt = np.unique(nxt[~seen[nxt]])
+            seen[nxt] = True
+            frontier = nxt
+        return seen
+
+    def descendants(self, n):
+        return set(self.decode(np.flatnonzero(self.reachable_ids([self.id(n)])))) - {n}
+
+    def ancestors(self, n):
+        return set(self.decode(np.flatnonzero(self.reachable_ids([self.id(n)], reverse=True)))) - {n}
+
+    def levelize_ids(self, cut=None):
+        """
+        按层做 Kahn 拓扑排序。cut 是节点的布尔掩码，这些节点的出边在排序时视为断开（例如 flipflop）。
+
+        Returns
+        -------
+        numpy.ndarray of int32
+                每个节点的级数；处在组合环上的节点为 -1.
+        """
+        n = len(self)
+        src = np.repeat(np.arange(n, dtype=np.int32), np.diff(self.out_ptr))
+        keep = np.ones(len(src), dtype=bool) if cut is None else ~cut[src]
+        indegree = np.bincount(self.out_dst[keep], minlength=n)
+        level = np.full(n, -1, dtype=np.int32)
+        frontier = np.flatnonzero(indegree == 0)
+        l = 0
+        while len(frontier):
+            level[frontier] = l
+            if cut is not None:
+                frontier = frontier[~cut[frontier]]
+            starts, ends = self.out_ptr[frontier], self.out_ptr[frontier + 1]
+            counts = ends - starts
+            total = counts.sum()
+            if not total:
+                break
+            offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+            nxt = self.out_dst[offsets]
+            np.subtract.at(indegree, nxt, 1)
+            nxt = np.unique(nxt)
+            frontier = nxt[indegree[nxt] == 0]
+            l += 1
+        return level
+
+def benchmark(path, repeat=3):
+    """
+    在 path 处的 verilog 网表上比较 networkx 后端和 CSR 后端的内存占用和遍历速度。
+    """
+    import gc
+    import time
+    import pickle
+    import tracemalloc
+    from netlist import Netlist
+    from graphize import HeterDiG_GateWireNodePinEdge
+
+    netlist = HeterDiG_GateWireNodePinEdge("bench")
+    netlist.build(path)
+    graph = netlist.graph
+    blob = pickle.dumps(graph, pickle.HIGHEST_PROTOCOL)
+
+    gc.collect()
+    tracemalloc.start()
+    nx_graph = pickle.loads(blob)
+    nx_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del nx_graph
+
+    gc.collect()
+    tracemalloc.start()
+    csr = CSRGraph.from_networkx(graph)
+    csr_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"{len(graph)} 个节点, {graph.number_of_edges()} 条边")
+    print(f"内存: networkx {nx_bytes/2**20:.1f} MB, CSR {csr_bytes/2**20:.1f} MB (其中数组 {csr.nbytes/2**20:.1f} MB)")
+
+    def best(f):
+        ts = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            f()
+            ts.append(time.perf_counter() - t0)
+        return min(ts)
+
+    import networkx as nx
+    inputs = [n for n, t in graph.nodes(data="iotype") if t == "input"]
+    csr_netlist = Netlist("bench", graph=graph, backend="csr")
+    names = list(graph)[:10000]
+    results = [
+        ("遍历所有节点的 fanout", lambda: [list(graph._succ[n]) for n in graph],
+                                  lambda: [csr.out_dst[csr.out_ptr[i]:csr.out_ptr[i + 1]] for i in range(len(csr))]),
+        ("从所有 input 出发的可达集", lambda: set().union(*(nx.descendants(graph, n) for n in inputs)),
+                                     lambda: csr.reachable_ids(csr.ids(inputs))),
+        ("Netlist.levelize", lambda: (netlist.invalidate(), netlist.levelize()),
+                             lambda: (csr_netlist.invalidate(), csr_netlist.levelize())),
+        ("Netlist.filter_ntype", lambda: (netlist.invalidate(), netlist.filter_ntype(["gate", "flipflop"])),
+                                 lambda: (csr_netlist.invalidate(), csr_netlist.filter_ntype(["gate", "flipflop"]))),
+        ("Netlist.fanout 逐个查询 1 万个节点", lambda: [netlist.fanout(n) for n in names],
+                                               lambda: [csr_netlist.fanout(n) for n in names]),
+    ]
+    for name, f_nx, f_csr in results:
+        t_nx, t_csr = best(f_nx), best(f_csr)
+        print(f"{name}: networkx {t_nx*1000:.2f} ms, CSR {t_csr*1000:.2f} ms, 加速 {t_nx/t_csr:.1f}x")
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+
+    # python csrgraph.py [xxx.v]
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else Path(__file__).parent / "benchmarks/TAU19/s1196/design/s1196.v")
@@ -1,24 +1,60 @@
 import networkx as nx
-from vparser import verilog_parser
+from vparser import verilog_parser, gc_paused
 from netlist import Netlist
+from csrgraph import CSRGraph, NODE_COLUMNS
+from buildcache import BuildCache
 from networkx.drawing.nx_agraph import to_agraph
 import graphviz
 from pathlib import Path
 import matplotlib.pyplot as plt
 import re
+import copy
+from functools import lru_cache
+import numpy as np
+from itertools import chain
+
+# 没有指定 vlib 时用来猜引脚方向的模式。与逐个 re.match 各模式等价，但每个引脚只需匹配一次。
+guess_in_pattern = re.compile("|".join([r"CK", r"A\d?", r"a\d?", r"B\d?", r"b\d?", r"C\d?", r"c\d?",
+                                        r"D\d?", r"d\d?", r"SE", r"E", r"I", r"[a-zA-Z]I", r"RN",
+                                        r"IN", r"G", r"EN", r"OE", r"GN", r"S"]))
+guess_out_pattern = re.compile("|".join([r"GCK",r"Z[a-zA-z0-9]?", r"Q", r"QN", r"CO", r"o"]))
+
+@lru_cache(maxsize=None)
+def _networkx_internals_ok():
+    """
+    用一个小例子检查 _fill_networkx 直接填出来的图，与公共接口建出来的、以及之后再用公共接口增删边的结果是否完全一样。
+    networkx 改了 MultiDiGraph 的内部结构时返回 False, 建图退回到 add_nodes_from/add_edges_from.
+    """
+    nodes = {"a": {"type": "wire", "iotype": "input"}, "b": {"type": "wire"}}
+    gates = [("g", {"type": "gate", "fanin": {"A": "a", "B": "a"}, "fanout": {"Z": "b"}}), ("h", {"type": "gate"})]
+    edges = (["a", "a", "g", "c"], ["g", "g", "b", "h"], ["fanin", "fanin", "fanout", "fanin"], ["A", "B", "Z", "A"])
+    try:
+        fast = HeterDiG_GateWireNodePinEdge._fill_networkx(copy.deepcopy(nodes), copy.deepcopy(gates), *edges)
+        slow = nx.MultiDiGraph()
+        slow.add_nodes_from(copy.deepcopy(nodes).items())
+        slow.add_edges_from((u, v, {"type": t, "subtype": p}) for u, v, t, p in zip(*edges))
+        slow.add_nodes_from(copy.deepcopy(gates))
+        for g in (fast, slow):
+            g.add_edge("a", "g", type="fanin", subtype="C")
+            g.remove_edge("g", "b")
+        return (list(fast.nodes(data=True)) == list(slow.nodes(data=True))
+                and list(fast.edges(keys=True, data=True)) == list(slow.edges(keys=True, data=True))
+                and all(list(fast.pred[n].items()) == list(slow.pred[n].items()) for n in slow))
+    except (AttributeError, TypeError, KeyError):
+        return False
 
 class HeterDiG_GateWireNodePinEdge(Netlist):
     """
     HeterDiG_GateWireNodePinEdge 类描述了一个异构图，其中 gate 和 wire 都表示成 node, 而 pin 表示为 edge.
     """
     
-    def __init__(self, name = "netlist", io_flag=1, load_path = None, statool = None, statool_type = None, statool_flag = 0):
+    def __init__(self, name = "netlist", io_flag=1, load_path = None, statool = None, statool_type = None, statool_flag = 0, backend = "networkx"):
         
         self.inputs_raw = []
         self.outputs_raw = []
         self.wires_raw = []
         self.gates_raw = []
-        super().__init__(name=name, io_flag=io_flag, load_path=load_path, statool = statool, statool_type=statool_type, statool_flag=statool_flag)
+        super().__init__(name=name, io_flag=io_flag, load_path=load_path, statool = statool, statool_type=statool_type, statool_flag=statool_flag, backend=backend)
         
     def clean(self):
         """
@@ -26,109 +62,213 @@ class HeterDiG_GateWireNodePinEdge(Netlist):
         """
         del self.inputs_raw, self.outputs_raw, self.wires_raw, self.gates_raw
         
-    def build(self, path, io_flag=1, vlib=None):
+    def build(self, path, io_flag=1, vlib=None, cache=None):
         """
-        建立图的基本结构。不涉及 lib 库和 verilog 库。
+        建立图的基本结构。
+        如果指定了 vlib (verilog 工艺库、Liberty 库或 read_vlib 读好的引脚方向表)，引脚方向直接查表得到；
+        否则只能按引脚名去猜，而这是猜不准的（例如 Nangate 库里的 S 引脚）。
         注意，这个操作会先删除当前的 graph 对象，因此不要随意使用。
+
+        所有节点和引脚边会先收集起来，再一次性插入：networkx 后端直接填 nx.MultiDiGraph 的内部字典,
+        csr 后端则直接填 CSRGraph 的数组，不经过 networkx. 得到的图与逐个 add_node 建出来的完全一样。
+
+        cache 为 True 或一个 buildcache.BuildCache 时启用建图缓存：verilog 文件、vlib 和解析器版本都没变时直接读入上次建好的图，
+        不再解析。这时 self.gates_raw 为空列表，inputs_raw/outputs_raw/wires_raw 由图中的节点得到。
         """
         
+        if cache is not None and cache is not False:
+            if cache is True:
+                cache = BuildCache()
+            key = cache.key(path, vlib)
+            hit = cache.get(key, mmap=self.backend == "csr")
+            if hit is not None:
+                graph, info = hit
+                self.name = info["name"]
+                self.graph = graph if self.backend == "csr" else graph.to_networkx()
+                self.inputs_raw = self.filter_niotype("input")
+                self.outputs_raw = self.filter_niotype("output")
+                self.wires_raw = self.filter_ntype("wire")
+                self.gates_raw = []
+                return
+            self.build(path, io_flag, vlib)
+            graph = self.graph if isinstance(self.graph, CSRGraph) else CSRGraph.from_networkx(self.graph)
+            cache.put(key, graph, name=self.name, source=str(path))
+            return
+        
         self.name, self.inputs_raw, self.outputs_raw, self.wires_raw, self.gates_raw = verilog_parser(path, io_flag, vlib)
         
-        self.graph = nx.MultiDiGraph()
+        # 先收集各种 wire 节点，并为其赋予 iotype
+        nodes = dict()
+        for n in self.wires_raw:
+            nodes.setdefault(n, dict())["type"] = "wire"
+        for n in self.inputs_raw:
+            nodes.setdefault(n, dict())["iotype"] = "input"
+        for n in self.outputs_raw:
+            nodes.setdefault(n, dict())["iotype"] = "output"
         
-        # 先添加各种 wire 节点，并为其赋予 iotype
-        self.graph.add_nodes_from(self.wires_raw, type="wire") 
-        self.graph.add_nodes_from(self.inputs_raw, iotype="input") 
-        self.graph.add_nodes_from(self.outputs_raw, iotype="output")
+        # 接下来收集门器件和它们的引脚边
+        gates = []
+        edge_u, edge_v, edge_type, edge_pin = [], [], [], []
+        guessed = dict()     # 没有 vlib 时，按引脚名序列缓存猜测的结果
         
-        # 接下来添加门器件
-        for x in self.gates_raw:
-            # 如果读过 verilog 库了，x 会形如  ['inst_19', ('CLKBUF', '2'), ('A', 'net_17', 'in'), ('Z', 'net_18', 'out')]
-            # 如果没读过，x 会形如  ['inst_19', ('CLKBUF', '2'), ('A', 'net_17'), ('Z', 'net_18')]
-            fanin = dict()
-            fanin_n = []
-            fanout = dict()
-            fanout_n = []
+        # 建图过程中会创建大量小对象，暂停 GC 可以避免反复的全量扫描
+        with gc_paused():
+            for x in self.gates_raw:
+                # 如果读过 verilog 库了，x 会形如  ['inst_19', 'CLKBUF_X2', ('CLKBUF', '2'), ('A', 'net_17', 'in'), ('Z', 'net_18', 'out')]
+                # 如果没读过，x 会形如  ['inst_19', 'CLKBUF_X2', ('CLKBUF', '2'), ('A', 'net_17'), ('Z', 'net_18')]
+                pins = x[3:]
+                if pins and len(pins[-1]) == 3:
+                    # 看来读过 verilog 库，直接按库里的方向分类
+                    directions = [p[2] == 'out' for p in pins]
+                else:
+                    key = tuple(p[0] for p in pins)
+                    directions = guessed.get(key)
+                    if directions is None:
+                        directions = guessed[key] = self.guess_pin_directions(key, x[0], x[1])
             
-            if len(x[-1]) == 3:
-                # 看来读过 verilog 库
-                for i in range(3,len(x)):
-                    pin_name = x[i][0]
-                    if x[i][2] == 'in':
-                        fanin_n.append(pin_node)  # 添加 fanin 节点名称
-                        fanin[pin_name] = pin_node
-                    else:
-                        fanout_n.append(pin_node)  # 添加 fanout 节点名称
-                        fanout[pin_name] = pin_node
-            else:
-                # 没读过 verilog 库，那节点的输入输出就只能猜了。如果猜不透了，就看看现在还缺哪个。如果都不缺，就猜是 fanin 节点。
-                # 但是 Nangate 库里引脚名 S 有可能是 input 也有可能是 output，逆天我只能说。
-                # 所以说根本不可能仅仅靠简单的猜测就正确分类所有引脚
-                guess_in_pattern = [r"CK", r"A\d?", r"a\d?", r"B\d?", r"b\d?", r"C\d?", r"c\d?", 
-                                    r"D\d?", r"d\d?", r"SE", r"E", r"I", r"[a-zA-Z]I", r"RN", 
-                                    r"IN", r"G", r"EN", r"OE", r"GN", r"S"]
-                guess_out_pattern = [r"GCK",r"Z[a-zA-z0-9]?", r"Q", r"QN", r"CO", r"o"]
-                fail_guess_id = []
-                
-                # 开始猜
-                for i in range(3,len(x)):
-                    pin_name = x[i][0]
-                    pin_node = x[i][1]
-                    guess_in = [y for y in guess_in_pattern if bool(re.match(y, pin_name))]
-                    guess_out = [y for y in guess_out_pattern if bool(re.match(y, pin_name))]
-                    
-                    if guess_in:
-                        fanin_n.append(pin_node)   # 添加 fanin 节点名称
-                        fanin[pin_name] = pin_node
-                    elif guess_out:
-                        fanout_n.append(pin_node)  # 添加 fanout 节点名称
-                        fanout[pin_name] = pin_node
-                    else:
-                        fail_guess_id.append(i)
-                
-                # 处理那些没猜出来的
-                for i in fail_guess_id:
-                    pin_name = x[i][0]
-                    pin_node = x[i][1]
-                    if not fanin:
-                        # 如果 fanin 还是空的，果断分配给 fanin
-                        fanin_n.append(pin_node)  # 添加 fanin 节点名称
-                        fanin[pin_name] = pin_node
-                    elif not fanout:
-                        # 如果 fanout 还是空的，果断分配给 fanout
-                        fanout_n.append(pin_node)  # 添加 fanout 节点名称
-                        fanout[pin_name] = pin_node
+                fanin = dict()
+                fanout = dict()
+                for pin, is_out in zip(pins, directions):
+                    if is_out:
+                        fanout[pin[0]] = pin[1]
                     else:
-                        # 还踏马有猜剩下来的，只好猜是 fanin 节点。
-                        print(f"名为 {x[0]} 的 {x[1]} 型门器件的 {pin_name} 引脚 IO 类型未知，已默认其输入输入引脚")
-                        fanin_n.append(pin_node)  # 添加 fanin 节点名称
-                        fanin[pin_name] = pin_node
-
-                        
-            # 清算的时候来了，该分出 gate 和 flipflop 了
-            if ("FF" in x[1]) or ("ms" in x[1]):
-                # flipflop
+                        fanin[pin[0]] = pin[1]
+            
+                # add_node 是先连 fanin 再连 fanout 的，这里保持同样的边顺序
+                for pin_name, pin_node in fanin.items():
+                    edge_u.append(pin_node)
+                    edge_v.append(x[0])
+                    edge_type.append("fanin")
+                    edge_pin.append(pin_name)
+                for pin_name, pin_node in fanout.items():
+                    edge_u.append(x[0])
+                    edge_v.append(pin_node)
+                    edge_type.append("fanout")
+                    edge_pin.append(pin_name)
+            
+                # 清算的时候来了，该分出 gate 和 flipflop 了
                 attr = {
-                    "type": "flipflop",
+                    "type": "flipflop" if ("FF" in x[1]) or ("ms" in x[1]) else "gate",
                     "function": x[2][0],    # INV
                     "spec" : x[2][1],       # 2
                     "subtype" : x[1],       # INV_X2
                     "fanin": fanin,
                     "fanout": fanout
                 }
+                gates.append((x[0], attr))
+        
+            if self.backend == "csr":
+                self.graph = self._bulk_csr(nodes, gates, edge_u, edge_v, edge_type, edge_pin)
             else:
-                # 普通 gate
-                attr = {
-                    "type": "gate",
-                    "function": x[2][0],
-                    "spec" : x[2][1],
-                    "subtype" : x[1],
-                    "fanin": fanin,
-                    "fanout": fanout
-                }
-            
-            #self.add_node(x[0],fanin_n,fanout_n,**attr)
-            self.add_node(x[0],fanin_nodes=fanin,fanout_nodes=fanout,**attr)
+                self.graph = self._bulk_networkx(nodes, gates, edge_u, edge_v, edge_type, edge_pin)
+
+    @staticmethod
+    def _bulk_networkx(nodes, gates, edge_u, edge_v, edge_type, edge_pin):
+        # 以公共接口 add_nodes_from/add_edges_from 建出来的图为准。MultiDiGraph.add_edges_from 内部仍是逐条 add_edge,
+        # 每条边都要查 key、拷贝属性，大约慢一倍，所以只要当前 networkx 的内部字典和预期的一样 (见 _networkx_internals_ok)，
+        # 就直接填 _node, _succ, _pred
+        if _networkx_internals_ok():
+            return HeterDiG_GateWireNodePinEdge._fill_networkx(nodes, gates, edge_u, edge_v, edge_type, edge_pin)
+        graph = nx.MultiDiGraph()
+        graph.add_nodes_from(nodes.items())
+        graph.add_edges_from((u, v, {"type": t, "subtype": p}) for u, v, t, p in zip(edge_u, edge_v, edge_type, edge_pin))
+        graph.add_nodes_from(gates)
+        return graph
+
+    @staticmethod
+    def _fill_networkx(nodes, gates, edge_u, edge_v, edge_type, edge_pin):
+        # 结构与 add_edge 建出来的完全相同：平行边的 key 依次为 0, 1, ..., 同一对节点的 keydict 由 _succ 和 _pred 共享。
+        graph = nx.MultiDiGraph()
+        node, succ, pred = graph._node, graph._succ, graph._pred
+        for n, attr in nodes.items():
+            node[n] = attr
+            succ[n] = dict()
+            pred[n] = dict()
+        for u, v, t, p in zip(edge_u, edge_v, edge_type, edge_pin):
+            # 和 add_node 一样，边上不存在的节点（例如常数）会被自动创建
+            if u not in node:
+                node[u] = dict()
+                succ[u] = dict()
+                pred[u] = dict()
+            if v not in node:
+                node[v] = dict()
+                succ[v] = dict()
+                pred[v] = dict()
+            keydict = succ[u].get(v)
+            if keydict is None:
+                keydict = succ[u][v] = pred[v][u] = dict()
+            keydict[len(keydict)] = {"type": t, "subtype": p}
+        for n, attr in gates:
+            if n not in node:
+                node[n] = attr
+                succ[n] = dict()
+                pred[n] = dict()
+            else:
+                node[n].update(attr)
+        return graph
+
+    @staticmethod
+    def _bulk_csr(nodes, gates, edge_u, edge_v, edge_type, edge_pin):
+        # 直接由收集好的数据填 CSRGraph 的数组，gate 的 fanin/fanout 属性由边推导，不需要存
+        index = dict()
+        for n in nodes:
+            index[n] = len(index)
+        for u, v in zip(edge_u, edge_v):
+            if u not in index:
+                index[u] = len(index)
+            if v not in index:
+                index[v] = len(index)
+        for n, _ in gates:
+            if n not in index:
+                index[n] = len(index)
+        
+        node_attrs = {k: [None] * len(index) for k in NODE_COLUMNS}
+        for n, attr in chain(nodes.items(), gates):
+            i = index[n]
+            for k, v in attr.items():
+                if k in node_attrs:
+                    node_attrs[k][i] = v
+        src = np.fromiter((index[u] for u in edge_u), dtype=np.int64, count=len(edge_u))
+        dst = np.fromiter((index[v] for v in edge_v), dtype=np.int64, count=len(edge_v))
+        return CSRGraph.from_arrays(list(index), src, dst, {"type": edge_type, "subtype": edge_pin}, node_attrs)
+
+    @staticmethod
+    def guess_pin_directions(pin_names, inst="", cell=""):
+        """
+        没有 vlib 时按引脚名猜测方向。如果猜不透了，就看看现在还缺哪个。如果都不缺，就猜是 fanin 节点。
+        但是 Nangate 库里引脚名 S 有可能是 input 也有可能是 output，逆天我只能说。
+        所以说根本不可能仅仅靠简单的猜测就正确分类所有引脚，最好还是指定 vlib.
+
+        Returns
+        -------
+        list of bool
+                每个引脚是否为输出引脚。
+        """
+        directions = [None] * len(pin_names)
+        fail_guess = []
+        
+        # 开始猜
+        for i, pin_name in enumerate(pin_names):
+            if guess_in_pattern.match(pin_name):
+                directions[i] = False
+            elif guess_out_pattern.match(pin_name):
+                directions[i] = True
+            else:
+                fail_guess.append(i)
+        
+        # 处理那些没猜出来的
+        for i in fail_guess:
+            if False not in directions:
+                # 如果 fanin 还是空的，果断分配给 fanin
+                directions[i] = False
+            elif True not in directions:
+                # 如果 fanout 还是空的，果断分配给 fanout
+                directions[i] = True
+            else:
+                # 还踏马有猜剩下来的，只好猜是 fanin 节点。
+                print(f"名为 {inst} 的 {cell} 型门器件的 {pin_names[i]} 引脚 IO 类型未知，已默认其输入输入引脚")
+                directions[i] = False
+        return directions
             
     def draw(self):
         # 创建一个 AGraph 对象，用于绘图
@@ -0,0 +1,414 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+
+# 缓存文件格式的版本号。改动了 Liberty 里存了哪些列之后要加一，旧缓存会自动失效。
+CACHE_VERSION = 1
+CACHE_DIR = "graph_data/lib_cache"
+
+PIN_DIRECTIONS = ("input", "output", "inout", "internal")
+TIMING_SENSES = ("positive_unate", "negative_unate", "non_unate")
+# 每条 timing arc 最多带 6 张查找表，它们在 arc_tables 中的列号就是在这个元组中的下标
+TABLE_KINDS = ("cell_rise", "cell_fall", "rise_transition", "fall_transition", "rise_constraint", "fall_constraint")
+
+# 查找表统一整理成 (输入 slew, 负载电容) 或 (被约束引脚 slew, 相关引脚 slew) 的顺序。
+# 模板里 variable_1 是 _SECOND_AXIS 中的变量时（例如 TAU15 simple 库），读入时会被转置。
+_SECOND_AXIS = ("total_output_net_capacitance", "related_pin_transition")
+
+_COMMENT = re.compile(r"/\*.*?\*/|//[^\n]*", re.DOTALL)
+_TOKEN = re.compile(r'(\w+)\s*\(([^)]*)\)\s*(\{)?\s*;?|(\w+)\s*:\s*("[^"]*"|[^;\n]*?)\s*;|(\})')
+_QUOTED = re.compile(r'"([^"]*)"')
+
+class LibertyGroup:
+    """Liberty 文件中的一个分组，例如 cell ("INV_X1") { ... }."""
+
+    __slots__ = ("type", "names", "attrs", "groups")
+
+    def __init__(self, type, names):
+        self.type = type
+        self.names = names        # 分组名，例如 ["INV_X1"]；pin (A1, A2) 这样的分组会有多个名字
+        self.attrs = dict()       # 简单属性 "direction": "input" 和复杂属性 "index_1": '"1, 2, 3"'
+        self.groups = []          # 子分组
+
+    def __repr__(self):
+        return f"LibertyGroup({self.type}, {self.names})"
+
+def parse_liberty_groups(text):
+    """
+    把 Liberty 文本解析成分组树，返回最顶层的 library 分组。
+    这里只认 分组、简单属性、复杂属性 三种语法，足以覆盖 TAU15/TAU19 和 Nangate 的库文件。
+    """
+    text = _COMMENT.sub("", text).replace("\\\n", " ")
+    root = LibertyGroup("root", [])
+    stack = [root]
+    for m in _TOKEN.finditer(text):
+        name, args, brace, attr, value, close = m.groups()
+        if close:
+            if len(stack) > 1:
+                stack.pop()
+        elif attr is not None:
+            stack[-1].attrs[attr] = value.strip('"')
+        elif brace:
+            group = LibertyGroup(name, [x.strip().strip('"') for x in args.split(",")] if args.strip() else [])
+            stack[-1].groups.append(group)
+            stack.append(group)
+        else:
+            stack[-1].attrs[name] = args
+    return root.groups[0] if root.groups else root
+
+def _floats(s):
+    """把 "1.0, 2.0, 3.0" 这样的字符串转成一维数组。"""
+    return np.array(s.replace('"', " ").replace(",", " ").split(), dtype=float)
+
+class LibertyCell:
+    """
+    Liberty 中一个 cell 的轻量视图，真正的数据都存放在 Liberty 的列式数组里。
+    通过 Liberty.cell("INV_X1") 或 Netlist.lib_cell(n) 获得。
+    """
+
+    __slots__ = ("lib", "index")
+
+    def __init__(self, lib, index):
+        self.lib = lib
+        self.index = index
+
+    def __repr__(self):
+        return f"LibertyCell({self.name})"
+
+    @property
+    def name(self):
+        return str(self.lib.cell_name[self.index])
+
+    @property
+    def area(self):
+        return float(self.lib.cell_area[self.index])
+
+    @property
+    def is_sequential(self):
+        """有时钟引脚的 cell 被视作时序单元。"""
+        return bool(self.lib.cell_sequential[self.index])
+
+    @property
+    def pins(self):
+        """{str pin: int 引脚在 Liberty 引脚数组中的下标}"""
+        return self.lib.pin_index[self.name]
+
+    def direction(self, pin):
+        """引脚方向，"input", "output", "inout" 或 "internal"."""
+        return PIN_DIRECTIONS[self.lib.pin_direction[self.pins[pin]]]
+
+    def is_clock(self, pin):
+        """引脚是否带有 clock : true 属性。"""
+        return bool(self.lib.pin_clock[self.pins[pin]])
+
+    def capacitance(self, pin):
+        """引脚电容。"""
+        return float(self.lib.pin_capacitance[self.pins[pin]])
+
+    def arcs(self, to_pin=None, from_pin=None):
+        """
+        返回这个 cell 的 timing arc 在 Liberty arc 数组中的下标，可以按终点引脚和起点引脚过滤。
+
+        Returns
+        -------
+        numpy.ndarray of int
+        """
+        lib = self.lib
+        start = lib.cell_arc_start[self.index]
+        arcs = np.arange(start, start + lib.cell_arc_count[self.index])
+        if to_pin is not None:
+            arcs = arcs[lib.arc_to[arcs] == self.pins[to_pin]]
+        if from_pin is not None:
+            arcs = arcs[lib.arc_from[arcs] == self.pins[from_pin]]
+        return arcs
+
+class Liberty:
+    """
+    Liberty (.lib) 工艺库。所有数据都以 NumPy 数组按列存放，便于批量查表，也便于整体存成二进制缓存。
+
+    一般通过 read_liberty(path) 获得。第一次读取时解析文本，并把数组存成以文件哈希命名的 .npz 缓存；
+    之后再读同一个（内容未变的）文件时直接加载缓存，只需几毫秒。
+
+    列式数组
+    ---------
+    cell:  cell_name, cell_area, cell_sequential, cell_pin_start/cell_pin_count, cell_arc_start/cell_arc_count
+           每个 cell 的引脚和 arc 在下面的数组中都是连续存放的。
+    pin:   pin_cell, pin_name, pin_direction (PIN_DIRECTIONS 中的下标), pin_capacitance, pin_clock
+    arc:   arc_cell, arc_from, arc_to (引脚下标, 没有 related_pin 时 arc_from 为 -1),
+           arc_sense (TIMING_SENSES 中的下标, 未指定时为 -1), arc_type (timing_types 中的下标),
+           arc_tables (每个 arc 一行, 每列对应 TABLE_KINDS 中的一种查找表, 值为查找表下标, 没有则为 -1)
+    lut:   lut_index_1, lut_index_2, lut_values, lut_shape
+           所有 NLDM 查找表补齐到相同大小后堆叠在一起（多出来的部分复制边缘值），lut_shape 记录真实大小。
+           轴 0 总是输入 slew（或被约束引脚的 slew），轴 1 总是负载电容（或相关引脚的 slew）。
+    """
+
+    _COLUMNS = ("cell_name", "cell_area", "cell_sequential", "cell_pin_start", "cell_pin_count", "cell_arc_start", "cell_arc_count",
+                "pin_cell", "pin_name", "pin_direction", "pin_capacitance", "pin_clock",
+                "arc_cell", "arc_from", "arc_to", "arc_sense", "arc_type", "arc_tables",
+                "lut_index_1", "lut_index_2", "lut_values", "lut_shape")
+
+    def __init__(self, name="library"):
+        self.name = name
+        self.path = None
+        self.attrs = dict()            # library 分组的简单属性，例如 time_unit
+        self.timing_types = []         # arc_type 的取值表
+        self.cell_index = dict()       # {cell: cell 下标}
+        self.pin_index = dict()        # {cell: {pin: 引脚下标}}
+
+    def __repr__(self):
+        return f"Liberty({self.name}, {len(self.cell_name)} cells, {len(self.arc_cell)} arcs, {len(self.lut_values)} tables)"
+
+    def __contains__(self, cell):
+        return cell in self.cell_index
+
+    def __len__(self):
+        return len(self.cell_index)
+
+    def cell(self, name):
+        """返回名为 name 的 cell 的视图 (LibertyCell). cell 不存在时报 KeyError."""
+        return LibertyCell(self, self.cell_index[name])
+
+    @property
+    def cells(self):
+        """所有 cell 名。"""
+        return list(self.cell_index)
+
+    def pin_directions(self):
+        """
+        返回 vparser.read_vlib 格式的引脚方向表 {cell_type: {pin: direction}}，direction 取 "in", "out", "inout", "internal".
+        """
+        short = ("in", "out", "inout", "internal")
+        return {cell: {pin: short[self.pin_direction[i]] for pin, i in pins.items()} for cell, pins in self.pin_index.items()}
+
+    def _build_index(self):
+        self.cell_index = {str(c): i for i, c in enumerate(self.cell_name)}
+        self.pin_index = dict()
+        for cell, i in self.cell_index.items():
+            start = self.cell_pin_start[i]
+            self.pin_index[cell] = {str(self.pin_name[p]): p for p in range(start, start + self.cell_pin_count[i])}
+
+    @classmethod
+    def from_text(cls, text):
+        """从 Liberty 文本解析出一个 Liberty 对象。文本里没有 library(...) 分组时报 ValueError."""
+        root = parse_liberty_groups(text)
+        if root.type != "library":
+            raise ValueError("No library(...) group found in Liberty text")
+        lib = cls(root.names[0] if root.names else "library")
+        lib.attrs = dict(root.attrs)
+
+        templates = dict()
+        for g in root.groups:
+            if g.type == "lu_table_template" and g.names:
+                templates[g.names[0]] = g.attrs
+
+        cells = dict(cell_name=[], cell_area=[], cell_sequential=[], cell_pin_start=[], cell_pin_count=[], cell_arc_start=[], cell_arc_count=[])
+        pins = dict(pin_cell=[], pin_name=[], pin_direction=[], pin_capacitance=[], pin_clock=[])
+        arcs = dict(arc_cell=[], arc_from=[], arc_to=[], arc_sense=[], arc_type=[], arc_tables=[])
+        luts = []        # (index_1, index_2, values)
+        timing_types = dict()
+
+        def add_table(g):
+            # 读入一张查找表，按模板把轴的顺序统一好，返回其下标
+            template = templates.get(g.names[0] if g.names else "scalar", dict())
+            values = [_floats(row) for row in _QUOTED.findall(g.attrs.get("values", '"0"'))]
+            index_1 = _floats(g.attrs.get("index_1", template.get("index_1", '"0"')))
+            index_2 = _floats(g.attrs["index_2"] if "index_2" in g.attrs else template.get("index_2", '"0"'))
+            if len(values) == 1 and len(index_1) > 1 and "index_2" not in g.attrs and "variable_2" not in template:
+                # 一维表：所有值写在同一个字符串里
+                values = np.array(values[0], dtype=float).reshape(-1, 1)
+                index_2 = np.zeros(1)
+            else:
+                values = np.array(values, dtype=float).reshape(len(values), -1)
+            if len(index_1) != values.shape[0]:
+                index_1 = np.zeros(values.shape[0]) if values.shape[0] == 1 else index_1[:values.shape[0]]
+            if len(index_2) != values.shape[1]:
+                index_2 = np.zeros(values.shape[1]) if values.shape[1] == 1 else index_2[:values.shape[1]]
+            if template.get("variable_1") in _SECOND_AXIS:
+                index_1, index_2, values = index_2, index_1, values.T
+            luts.append((index_1, index_2, values))
+            return len(luts) - 1
+
+        for cg in root.groups:
+            if cg.type != "cell" or not cg.names:
+                continue
+            ci = len(cells["cell_name"])
+            cells["cell_name"].append(cg.names[0])
+            cells["cell_area"].append(float(cg.attrs.get("area", "nan")))
+            cells["cell_pin_start"].append(len(pins["pin_name"]))
+            cells["cell_arc_start"].append(len(arcs["arc_cell"]))
+
+            pin_groups = []
+            local = dict()      # 本 cell 内 引脚名 -> 引脚下标
+            for pg in cg.groups:
+                if pg.type != "pin":
+                    continue
+                for pin in pg.names:
+                    local[pin] = len(pins["pin_name"])
+                    pins["pin_cell"].append(ci)
+                    pins["pin_name"].append(pin)
+                    direction = pg.attrs.get("direction", "input")
+                    pins["pin_direction"].append(PIN_DIRECTIONS.index(direction) if direction in PIN_DIRECTIONS else 0)
+                    cap = pg.attrs.get("capacitance")
+                    if cap is None:
+                        cap = max(float(pg.attrs.get("rise_capacitance", 0)), float(pg.attrs.get("fall_capacitance", 0)))
+                    pins["pin_capacitance"].append(float(cap))
+                    pins["pin_clock"].append(pg.attrs.get("clock", "false") == "true")
+                    pin_groups.append((pin, pg))
+
+            for pin, pg in pin_groups:
+                for tg in pg.groups:
+                    if tg.type != "timing":
+                        continue
+                    tables = [-1] * len(TABLE_KINDS)
+                    for g in tg.groups:
+                        if g.type in TABLE_KINDS:
+                            tables[TABLE_KINDS.index(g.type)] = add_table(g)
+                    sense = tg.attrs.get("timing_sense")
+                    ttype = timing_types.setdefault(tg.attrs.get("timing_type", "combinational"), len(timing_types))
+                    related = tg.attrs.get("related_pin", "").split()
+                    for rp in related or [None]:
+                        arcs["arc_cell"].append(ci)
+                        arcs["arc_from"].append(local.get(rp, -1))
+                        arcs["arc_to"].append(local[pin])
+                        arcs["arc_sense"].append(TIMING_SENSES.index(sense) if sense in TIMING_SENSES else -1)
+                        arcs["arc_type"].append(ttype)
+                        arcs["arc_tables"].append(tables)
+
+            cells["cell_pin_count"].append(len(pins["pin_name"]) - cells["cell_pin_start"][-1])
+            cells["cell_arc_count"].append(len(arcs["arc_cell"]) - cells["cell_arc_start"][-1])
+            cells["cell_sequential"].append(any(pins["pin_clock"][cells["cell_pin_start"][-1]:]) or any(g.type in ("ff", "latch") for g in cg.groups))
+
+        lib.cell_name = np.array(cells["cell_name"], dtype=str)
+        lib.cell_area = np.array(cells["cell_area"], dtype=float)
+        lib.cell_sequential = np.array(cells["cell_sequential"], dtype=bool)
+        for k in ("cell_pin_start", "cell_pin_count", "cell_arc_start", "cell_arc_count"):
+            setattr(lib, k, np.array(cells[k], dtype=np.int32))
+        lib.pin_cell = np.array(pins["pin_cell"], dtype=np.int32)
+        lib.pin_name = np.array(pins["pin_name"], dtype=str)
+        lib.pin_direction = np.array(pins["pin_direction"], dtype=np.int8)
+        lib.pin_capacitance = np.array(pins["pin_capacitance"], dtype=float)
+        lib.pin_clock = np.array(pins["pin_clock"], dtype=bool)
+        lib.arc_cell = np.array(arcs["arc_cell"], dtype=np.int32)
+        lib.arc_from = np.array(arcs["arc_from"], dtype=np.int32)
+        lib.arc_to = np.array(arcs["arc_to"], dtype=np.int32)
+        lib.arc_sense = np.array(arcs["arc_sense"], dtype=np.int8)
+        lib.arc_type = np.array(arcs["arc_type"], dtype=np.int8)
+        lib.arc_tables = np.array(arcs["arc_tables"], dtype=np.int32).reshape(-1, len(TABLE_KINDS))
+        lib.timing_types = list(timing_types)
+
+        # 把所有查找表补齐到同样大小后堆叠起来
+        n1 = max((len(t[0]) for t in luts), default=1)
+        n2 = max((len(t[1]) for t in luts), default=1)
+        lib.lut_index_1 = np.array([np.pad(t[0], (0, n1 - len(t[0])), mode="edge") for t in luts], dtype=float).reshape(-1, n1)
+        lib.lut_index_2 = np.array([np.pad(t[1], (0, n2 - len(t[1])), mode="edge") for t in luts], dtype=float).reshape(-1, n2)
+        lib.lut_values = np.array([np.pad(t[2], ((0, n1 - t[2].shape[0]), (0, n2 - t[2].shape[1])), mode="edge") for t in luts], dtype=float).reshape(-1, n1, n2)
+        lib.lut_shape = np.array([t[2].shape for t in luts], dtype=np.int32).reshape(-1, 2)
+
+        lib._build_index()
+        return lib
+
+    def save(self, file):
+        """把列式数组存成 .npz 二进制文件。"""
+        meta = json.dumps({"version": CACHE_VERSION, "name": self.name, "attrs": self.attrs, "timing_types": self.timing_types})
+        np.savez(file, _meta=np.array(meta), **{k: getattr(self, k) for k in self._COLUMNS})
+
+    @classmethod
+    def load(cls, file):
+        """从 save 存下的 .npz 文件中读取。版本不符时报 ValueError."""
+        with np.load(file, allow_pickle=False) as data:
+            meta = json.loads(str(data["_meta"]))
+            if meta.get("version") != CACHE_VERSION:
+                raise ValueError(f"Liberty cache {file} has version {meta.get('version')}, expected {CACHE_VERSION}.")
+            lib = cls(meta["name"])
+            lib.attrs = meta["attrs"]
+            lib.timing_types = meta["timing_types"]
+            for k in cls._COLUMNS:
+                setattr(lib, k, data[k])
+        lib._build_index()
+        return lib
+
+def file_digest(path):
+    """文件内容的 sha1 摘要，用作缓存的键。"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def read_liberty(path, cache_dir=CACHE_DIR, use_cache=True):
+    """
+    读取 Liberty (.lib) 工艺库。
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+            Liberty 文件路径。
+    cache_dir : str or pathlib.Path
+            二进制缓存的存放目录。缓存文件名中带有源文件内容的哈希，源文件改动后会自动重新解析。
+    use_cache : bool
+            是否读写缓存。
+
+    Returns
+    -------
+    Liberty
+
+    Raises
+    ------
+    ValueError
+            文件里没有 library(...) 分组 (比如只是一个占位文件)，这时不会写缓存。
+    """
+    path = Path(path)
+    cache_file = None
+    if use_cache:
+        cache_file = Path(cache_dir) / f"{path.name}.{file_digest(path)[:16]}.npz"
+        if cache_file.exists():
+            try:
+                lib = Liberty.load(cache_file)
+                if len(lib.cell_index):     # 旧版本会把占位文件缓存成空库，这种缓存不能用
+                    lib.path = path
+                    return lib
+            except (ValueError, KeyError, OSError):
+                pass    # 缓存损坏或版本过旧，重新解析
+
+    with open(path, 'r') as f:
+        text = f.read()
+    try:
+        lib = Liberty.from_text(text)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+    lib.path = path
+
+    if cache_file is not None:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # 先写到临时文件再改名，同时解析同一个库的线程或进程不会读到写了一半的缓存
+        tmp = cache_file.with_name(f"{cache_file.stem}.tmp-{os.getpid()}-{threading.get_ident()}.npz")
+        try:
+            lib.save(tmp)
+            os.replace(tmp, cache_file)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+    return lib
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    # python libparser.py [xxx.lib] 会分别测一次冷启动（解析文本）和热启动（读缓存）的耗时
+    if len(sys.argv) > 1:
+        file_name = sys.argv[1]
+    else:
+        file_name = Path(__file__).parent / "benchmarks/TAU15/simple/simple_Late.lib"
+
+    t0 = time.perf_counter()
+    lib = read_liberty(file_name, use_cache=False)
+    t1 = time.perf_counter()
+    read_liberty(file_name)
+    t2 = time.perf_counter()
+    lib = read_liberty(file_name)
+    t3 = time.perf_counter()
+    print(lib)
+    print(f"解析文本 {t1-t0:.3f} s, 读缓存 {(t3-t2)*1000:.2f} ms")
@@ -1,13 +1,37 @@
-from functools import reduce, cached_property
-from itertools import combinations, product, chain
+from functools import cached_property
+from itertools import combinations, chain
 from collections.abc import Iterable
+from collections import deque
+import heapq
+import re
+import sys
+import time
 import warnings
 from inspect import *
 import networkx as nx
+import numpy as np
 import pathlib 
 from statool import PT_session
+from libparser import read_liberty
+from spefparser import read_spef
+from csrgraph import CSRGraph
 import pickle
 
+# 会建立倒排索引的节点属性, 见 Netlist.filter_ntype 等
+INDEXED_ATTRS = ("type", "subtype", "function", "iotype")
+
+# cone_bitsets 每一批的比特矩阵最多占用的内存 (字节)，批量查询 transitive fanin/fanout 时按它给查询节点分批
+BITSET_BYTES = 1 << 28
+
+# reconvergence 每一批的 stem 最多占用的比特数
+RECONV_BITS = 1 << 8
+
+# 修改记录 (Netlist._dirty) 最多保留的条数，超过它和网表节点数中较大的一个时清空记录并视为整体修改，Timer 下次整体重做
+DIRTY_LOG_LIMIT = 1 << 16
+
+# 没有读入 Liberty 库时，按引脚名判断 flipflop 的时钟引脚；其余的输入引脚都视为数据引脚
+CLOCK_PIN_PATTERN = re.compile(r"CKN?|CLKN?|CPN?|GN?|GATE", re.I)
+
 GeneratorDualWarn = "You are using one generator to create another dependent one! Please make sure there's only one generator to avoid possible error!"
 
 class Netlist:
@@ -29,14 +53,14 @@ class Netlist:
     
     初始化方法：
     ------------
-    `netlist = Netlist(self, name="netlist", io_flag = 1, graph=nx.MultiDiGraph(), load_path = None, statool = None, statool_type = None, statool_flag = 0)`
+    `netlist = Netlist(self, name="netlist", io_flag = 1, graph=None, load_path = None, statool = None, statool_type = None, statool_flag = 0, backend = "networkx")`
     
     传入参数
     ----------
     name : str
             网表名，即顶层模块名。
-    graph : networkx.MultiDiGraph
-            网表对应的有向图。如果一开始就传入，则相当于用传入的 graph 来创建一个同样的 Netlist.
+    graph : networkx.MultiDiGraph or csrgraph.CSRGraph
+            网表对应的有向图。如果一开始就传入，则相当于用传入的 graph 来创建一个同样的 Netlist. 不传时创建一个空图。
     io_flag : bool
             进行网表内数据 IO 时所默认采用的数据类型。如不指定，则默认为 io_flag = 1, 即使用 列表类型。否则为 生成器 类型。
     load_path : str or pathlib.Path
@@ -47,6 +71,9 @@ class Netlist:
             用于指定使用 statool.py 中的何种工具类。如果没有显式传入 statool 但却指定了 statool_type, 则会根据指定的 statool_type 来初始化一个工具类对象。
     statool_flag : bool
             用于初始化工具类时作为传入的 flag, 它将会控制外部 sta timer 是否要在交互时自动打印输出。默认为不自动打印。你也可以通过修改 self.tool.flag 的值来改变它。
+    backend : str
+            图的存储方式。"networkx" (默认) 使用 nx.MultiDiGraph, 可以任意编辑；
+            "csr" 使用 csrgraph.CSRGraph, 节点名驻留、邻接关系为 int32 CSR 数组、属性按列存放，内存小得多、批量遍历也快得多，但图结构只读。
 
     类属性
     ---------
@@ -71,7 +98,7 @@ class Netlist:
     
     """
 
-    def __init__(self, name="netlist", io_flag = 1, graph=nx.MultiDiGraph(), load_path = None, statool = None, statool_type = None, statool_flag = 0):
+    def __init__(self, name="netlist", io_flag = 1, graph=None, load_path = None, statool = None, statool_type = None, statool_flag = 0, backend = "networkx"):
         """
         创建一个新的网表 Netlist (带 Networkx Graph)
 
@@ -91,6 +118,8 @@ class Netlist:
                 用于指定使用 statool.py 中的何种工具类。如果没有显式传入 statool 但却指定了 statool_type, 则会根据指定的 statool_type 来初始化一个工具类对象。
         statool_flag : bool
                 用于初始化工具类时作为传入的 flag, 它将会控制外部 sta timer 是否要在交互时自动打印输出。默认为不自动打印。你也可以通过修改 self.tool.flag 的值来改变它。
+        backend : str
+                "networkx" 或 "csr", 见类的说明。
 
         类属性
         ---------
@@ -98,8 +127,21 @@ class Netlist:
         + self.name = "netlist"
         + self.graph = nx.MultiDiGraph()
         + self.default_io_flag = 1
+        + self.backend = "networkx"
         + self.tool = None
         + self.tool_type = None
+        + self.liberty = None      (由 read_liberty 读入的 Liberty 工艺库)
+        + self.spef = None         (由 read_spef 读入的、按需加载的 SPEF 寄生参数)
+
+        缓存的索引（给 self.graph 重新赋值时会自动清空，通过 add_node/connect/disconnect/remove_nodes 修改网表时会增量修复）：
+        + self._level = None       ({节点: 逻辑级数}, 见 levelize)
+        + self._level_sets = None  (每一级的节点，按加入的先后排列的 dict.fromkeys 集合，与哈希种子无关)
+        + self._cyclic = None      (is_cyclic 的结果，是否有组合环)
+        + self._attr_index = None  ({属性名: {属性值: 节点}}, type/subtype/function/iotype 的倒排索引，供 filter_* 使用)
+        + self._topo = None        (按拓扑顺序编号的 DAG 边数组，供 cone_bitsets 使用；网表一有修改就丢弃，下次用到时重建)
+        + self._timing_points = None (startpoints/endpoints 以及 flipflop 的输出 net 和数据引脚 net，同样在网表修改后重建)
+        + self._dirty = []         (按修改顺序记下的被修改过的节点，供 Timer 做增量时序更新，见 mark_dirty/dirty_since；超过 DIRTY_LOG_LIMIT 条时清空)
+        + self._epoch = 0          (每次整体失效 (invalidate, read_spef) 加一，Timer 发现它变了就整体重做时序分析)
         
         通过 @property 获得的只读属性：
         + self.nodes
@@ -118,9 +160,13 @@ class Netlist:
         """
         
         assert isinstance(name, str), "name must be a string"
-        assert isinstance(graph, nx.MultiDiGraph), "graph must be a networkx.MultiDiGraph"
+        assert backend in ("networkx", "csr"), "backend must be 'networkx' or 'csr'"
+        if graph is None:
+            graph = nx.MultiDiGraph()
+        assert isinstance(graph, (nx.MultiDiGraph, CSRGraph)), "graph must be a networkx.MultiDiGraph or a CSRGraph"
         
         self.name = name
+        self.backend = backend
         self.graph = graph
         self.default_io_flag = io_flag
         
@@ -138,7 +184,151 @@ class Netlist:
                     self.tool = PT_session(statool_flag)
                     
         self.tool = statool    # statool 应当是定义在 statool 中的某一个类的实例
+        self.liberty = None
+        self.spef = None
         
+    @property
+    def graph(self):
+        return self._graph
+
+    @graph.setter
+    def graph(self, graph):
+        # 换了一张图，之前建立的索引就都作废了
+        if getattr(self, "backend", "networkx") == "csr" and isinstance(graph, nx.MultiDiGraph) and len(graph):
+            graph = CSRGraph.from_networkx(graph)
+        self._graph = graph
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        清空所有缓存的索引。如果绕过 add_node/connect/disconnect/remove_nodes 直接修改了 self.graph 的结构，
+        或者修改了节点的 type 属性，需要手动调用它。
+        """
+        self._level = None
+        self._level_sets = None
+        self._cyclic = None
+        self._attr_index = None
+        self._topo = None
+        self._timing_points = None
+        self.mark_dirty()
+
+    def mark_dirty(self, ns=None):
+        """
+        记下 ns 中的节点被修改过（连接关系、库单元或寄生参数变了），Timer 据此只对受影响的部分做增量时序更新。
+        add_node, connect, disconnect, remove_nodes, set_node_attr 和 apply_spef_delta 会自动调用它。
+
+        Parameters
+        ----------
+        ns : str or iterable of str (可以为空)
+                被修改的节点。为空时表示整个网表都可能变了，之后的时序分析会整体重做。
+                记录的条数超过 DIRTY_LOG_LIMIT 和节点数中较大的一个时，也按整体修改处理，不再继续增长。
+        """
+        if ns is None:
+            self._epoch = getattr(self, "_epoch", 0) + 1
+            self._dirty = []
+            return
+        if isinstance(ns, str):
+            self._dirty.append(ns)
+        else:
+            self._dirty.extend(ns)
+        # 记录只增不减，太长时 (改动已经比整个网表还多) 直接当作整体修改，旧的标记随之失效
+        if len(self._dirty) > max(DIRTY_LOG_LIMIT, len(self._graph)):
+            self.mark_dirty()
+
+    def dirty_since(self, mark=None):
+        """
+        查询从上次的标记以来被修改过的节点。
+
+        Parameters
+        ----------
+        mark : (int, int) (可以为空)
+                上一次调用返回的标记。
+
+        Returns
+        -------
+        ((int, int), set or None)
+                (当前的标记, 被修改过的节点)。mark 为空或者期间网表被整体修改过时，节点为 None.
+        """
+        now = (self._epoch, len(self._dirty))
+        if mark is None or mark[0] != self._epoch:
+            return now, None
+        return now, set(self._dirty[mark[1]:])
+
+    def _build_attr_index(self):
+        # 一次遍历建立 {属性名: {属性值: 节点}} 的倒排索引。节点集合用 dict 存放，以保持节点在图中的顺序。
+        if self._attr_index is None:
+            if isinstance(self.graph, CSRGraph):
+                self._attr_index = self.graph.attr_index(INDEXED_ATTRS)
+                return self._attr_index
+            index = {a: dict() for a in INDEXED_ATTRS}
+            for n, data in self.graph.nodes(data=True):
+                for a in INDEXED_ATTRS:
+                    v = data.get(a)
+                    if v is not None:
+                        index[a].setdefault(v, dict())[n] = None
+            self._attr_index = index
+        return self._attr_index
+
+    def _index_node(self, n):
+        if self._attr_index is not None:
+            data = self.graph.nodes[n]
+            for a in INDEXED_ATTRS:
+                v = data.get(a)
+                if v is not None:
+                    self._attr_index[a].setdefault(v, dict())[n] = None
+
+    def _unindex_node(self, n):
+        if self._attr_index is not None and n in self.graph:
+            data = self.graph.nodes[n]
+            for a in INDEXED_ATTRS:
+                v = data.get(a)
+                if v is not None:
+                    nodes = self._attr_index[a].get(v)
+                    if nodes is not None:
+                        nodes.pop(n, None)
+                        if not nodes:
+                            del self._attr_index[a][v]
+
+    def _filter_attr(self, attr, values, io_flag):
+        index = self._build_attr_index()[attr]
+        if isinstance(values, str):
+            nodes = index.get(values, ())
+            return (n for n in nodes) if io_flag == 0 else list(nodes)
+        node_dict = dict()
+        for v in set(values):   # 去除相同的值
+            nodes = index.get(v, ())
+            node_dict[v] = (n for n in nodes) if io_flag == 0 else list(nodes)
+        return node_dict
+
+    def set_node_attr(self, n, **attr):
+        """
+        修改节点 n 的属性并同步更新缓存的索引。值为 None 的属性会被删除。
+        修改 type/subtype/function/iotype 时应当用它，而不是直接改 self.graph.nodes[n].
+
+        Parameters
+        ----------
+        n : str
+                节点名
+        **attr : 要修改的属性，例如 subtype="INV_X4"
+        """
+        data = self.graph.nodes[n]
+        old_type = data.get("type")
+        self._unindex_node(n)
+        for k, v in attr.items():
+            if v is None:
+                data.pop(k, None)
+            else:
+                data[k] = v
+        self._index_node(n)
+        self.mark_dirty(n)
+        if "type" in attr or "iotype" in attr:
+            self._timing_points = None
+            self._topo = None     # 其中缓存了按 gate 数计的最长路径
+        if data.get("type") != old_type and (old_type == "flipflop" or data.get("type") == "flipflop"):
+            # gate 和 flipflop 之间的转换会改变分级时断开的边
+            self._level = self._level_sets = None
+            self._topo = None
+
     # 接下来这三个函数只是把 graph 上的操作转嫁到 netlist 上。
     def __contains__(self, n):
         """检查 graph 中是否含有节点 n."""
@@ -252,7 +442,7 @@ class Netlist:
         -------
         list of str
         """
-        return list(set(self.ntype(self.nodes, io_flag=self.default_io_flag, warn_ignore=1 )))
+        return list(self._build_attr_index()["type"])
     
     @property
     def nsubtypes(self):
@@ -263,7 +453,7 @@ class Netlist:
         -------
         list of str
         """
-        return list(set(self.nsubtype(self.nodes, io_flag=self.default_io_flag, warn_ignore=1 )))
+        return list(self._build_attr_index()["subtype"])
     
     @property
     def nfunctions(self):
@@ -274,7 +464,7 @@ class Netlist:
         -------
         list of str
         """
-        return list(set(self.nfunction(self.nodes, io_flag=self.default_io_flag, warn_ignore=1 )))
+        return list(self._build_attr_index()["function"])
     
     @property
     def niotypes(self):
@@ -285,7 +475,7 @@ class Netlist:
         -------
         list of str
         """
-        return list(set(self.niotype(self.nodes, io_flag=self.default_io_flag, warn_ignore=1 )))
+        return list(self._build_attr_index()["iotype"])
     
     @property
     def io(self):
@@ -305,75 +495,178 @@ class Netlist:
 
     def copy(self):
         """返回网表的一个副本。"""
-        return Netlist(name=self.name, graph=self.graph.copy())
+        return Netlist(name=self.name, graph=self.graph.copy(), backend=self.backend)
+
+    def to_csr(self):
+        """把图转成只读的 CSR 后端 (csrgraph.CSRGraph)，之后 self.backend 为 "csr"."""
+        self.backend = "csr"
+        if not isinstance(self.graph, CSRGraph):
+            self.graph = CSRGraph.from_networkx(self.graph)
+        return self.graph
+
+    def to_networkx(self):
+        """把图转回可编辑的 networkx.MultiDiGraph 后端，之后 self.backend 为 "networkx"."""
+        self.backend = "networkx"
+        if isinstance(self.graph, CSRGraph):
+            self.graph = self.graph.to_networkx()
+        return self.graph
     
+    def _snapshot_path(self, file):
+        file_path = str(file) if file is not None else 'graph_data/' + self.name
+        return file_path if file_path.endswith('.snap') else file_path + '.snap'
+
     def save(self, file=None):
-        """保存图结构的 pickle 类型文件到 file. 其中 file 可以自动加上扩展名。"""
-        try:
-            # 如果 networkx 是 3.0 之前的老版本
-            file_path = file
-            if file_path == None:
-                file_path = 'graph_data/' + self.name + ".pkl"
-            if file_path.endswith('.pkl'):
-                nx.write_gpickle(self.graph, file_path)
-                print(f"已成功将图保存到 {file_path} 文件中。" )
-            else:
-                nx.write_gpickle(self.graph, file_path+".pkl")
-                print(f"已成功将图保存到 {file_path}.pkl 文件中。" )
-        except:
-            file_path = file
-            if file_path == None:
-                file_path = 'graph_data/' + self.name + ".gpickle"
-            if file_path.endswith('.gpickle'):
-                with open(file_path, 'wb') as f:
-                    pickle.dump(self.graph, f, pickle.HIGHEST_PROTOCOL)
-                print(f"已成功将图保存到 {file_path} 文件中。" )    
-            else:
-                with open(file_path+'.gpickle', 'wb') as f:
-                    pickle.dump(self.graph, f, pickle.HIGHEST_PROTOCOL)
-                print(f"已成功将图保存到 {file_path}.gpickle 文件中。" )       
+        """
+        把图保存成 file 处的快照目录 (csrgraph.CSRGraph.save 的格式：节点名字符串表、int32 CSR 边数组和按列存放的属性，带版本号)。
+        其中 file 可以自动加上扩展名 .snap, 不指定时保存到 graph_data/<name>.snap.
+        networkx 后端的图会先转换成 CSRGraph 再保存；gate 的 fanin/fanout 属性由边推导，不单独保存。
+        """
+        file_path = self._snapshot_path(file)
+        graph = self.graph if isinstance(self.graph, CSRGraph) else CSRGraph.from_networkx(self.graph)
+        graph.save(file_path)
+        print(f"已成功将图保存到 {file_path} 中。" )
             
-    def load(self, file=None):
-        """从 pickle 类型文件 file 中读取图结构. 其中 file 可以自动加上扩展名。"""
-        try:
-            # 如果 networkx 是 3.0 之前的老版本
-            file_path = file
-            if file_path == None:
-                file_path = 'graph_data/' + self.name + ".pkl"
-            if file_path.endswith('.pkl'):
-                self.graph = nx.read_gpickle(self.graph, file_path)
-                print(f"已成功从 {file_path} 中读取并加载类型为 {type(self.graph)} 的图。" )
-            else:
-                self.graph = nx.read_gpickle(self.graph, file_path+".pkl")
-                print(f"已成功从 {file_path}.pkl 中读取并加载类型为 {type(self.graph)} 的图。" )
-        except:
-            file_path = file
-            if file_path == None:
-                file_path = 'graph_data/' + self.name + ".gpickle"
-            if file_path.endswith('.gpickle'):
-                with open(file_path, 'rb') as f:
-                    self.graph = pickle.load(f)
-                print(f"已成功从 {file_path} 中读取并加载类型为 {type(self.graph)} 的图。" ) 
-            else:
-                with open(file_path+'.gpickle', 'rb') as f:
+    def load(self, file=None, mmap=True):
+        """
+        从 file 处读取图结构. 其中 file 可以自动加上扩展名。
+        优先读取 save 保存的快照 (.snap)。csr 后端时数组直接用 numpy.memmap 映射 (mmap=True), 大网表也只需几毫秒就能打开；
+        networkx 后端时会再转换成 nx.MultiDiGraph, 节点、succ/pred 和 gate 引脚的顺序都与保存时相同。
+        如果找不到快照，会按旧的格式读取 .pkl/.gpickle 的 pickle 文件。
+
+        Raises
+        ------
+        FileNotFoundError
+                快照和 pickle 文件都不存在。
+        """
+        file_path = str(file) if file is not None else 'graph_data/' + self.name
+        snapshot = pathlib.Path(self._snapshot_path(file_path))
+        if (snapshot / "meta.json").exists():
+            graph = CSRGraph.load(snapshot, mmap=mmap and self.backend == "csr")
+            self.graph = graph if self.backend == "csr" else graph.to_networkx()
+            print(f"已成功从 {snapshot} 中读取并加载类型为 {type(self.graph)} 的图。" )
+            return
+
+        # 旧格式：整个 nx.MultiDiGraph 的 pickle
+        for path in (file_path, file_path + ".pkl", file_path + ".gpickle"):
+            if path.endswith(('.pkl', '.gpickle')) and pathlib.Path(path).is_file():
+                with open(path, 'rb') as f:
                     self.graph = pickle.load(f)
-                print(f"已成功从 {file_path}.gpickle 中读取并加载类型为 {type(self.graph)} 的图。" )
+                print(f"已成功从 {path} 中读取并加载类型为 {type(self.graph)} 的图。" )
+                return
+        raise FileNotFoundError(f"No snapshot or pickle found for {file_path}")
         
+    def read_liberty(self, path, **kwargs):
+        """
+        读入 Liberty 工艺库并挂到 self.liberty 上，之后 gate 和 flipflop 节点就可以通过 subtype 属性找到各自的库单元 (见 lib_cell)。
+        kwargs 会原样传给 libparser.read_liberty, 例如 cache_dir 和 use_cache.
+
+        Returns
+        -------
+        libparser.Liberty
+        """
+        self.liberty = read_liberty(path, **kwargs)
+        return self.liberty
+
+    def lib_cell(self, n):
+        """
+        返回节点 n 对应的库单元 (libparser.LibertyCell)，按节点的 subtype 属性（例如 "INV_X2"）在 self.liberty 中查找。
+
+        Raises
+        ------
+        ValueError
+                还没有读入 Liberty 库。
+        KeyError
+                节点没有 subtype 属性，或者库中没有这种 cell.
+        """
+        if self.liberty is None:
+            raise ValueError("No liberty library loaded, call read_liberty first.")
+        return self.liberty.cell(self.graph.nodes[n]["subtype"])
+
+    def read_spef(self, path):
+        """
+        读入 SPEF 寄生参数文件并挂到 self.spef 上。这里只会建立每个 net 在文件中的位置索引，
+        某个 wire 节点的 RC 网络要等到第一次调用 parasitics 时才会被解析。
+
+        Returns
+        -------
+        spefparser.Spef
+        """
+        if self.spef is not None:
+            self.spef.close()
+            for n in chain(self.spef.loaded, self.spef.patched):
+                if n in self.graph:
+                    self.graph.nodes[n].pop("rc", None)
+        self.spef = read_spef(path)
+        self.mark_dirty()
+        return self.spef
+
+    def parasitics(self, n):
+        """
+        返回 wire 节点 n 的 RC 网络 (spefparser.SpefNet)。第一次访问时从 SPEF 文件中解析，并存到节点的 "rc" 属性上。
+
+        Raises
+        ------
+        ValueError
+                还没有读入 SPEF 文件。
+        KeyError
+                SPEF 文件中没有这个 net.
+        """
+        if self.spef is None:
+            raise ValueError("No SPEF loaded, call read_spef first.")
+        attr = self.graph.nodes[n] if n in self.graph else {}
+        rc = attr.get("rc")
+        if rc is None:
+            rc = self.spef.net(n)
+            if n in self.graph:
+                attr["rc"] = rc
+        return rc
+
+    def apply_spef_delta(self, path):
+        """
+        在原地应用一个增量 SPEF 文件（例如 TAU15 的 change_1.spef），只替换其中出现的 net 的寄生参数，不会重新读入整个 SPEF.
+        如果还没有读入过 SPEF, 就把 path 当作完整的 SPEF 读入。
+
+        Returns
+        -------
+        list of str
+                寄生参数发生变化的 wire 节点。增量文件中还不在图中的 net (例如稍后才会 insert_net 的 net) 不在其中，
+                但它们的寄生参数已经记下了，节点加入后用 parasitics 即可取到。
+        """
+        if self.spef is None:
+            self.read_spef(path)
+            return [n for n in self.spef if n in self.graph]
+
+        changed = []
+        for n in self.spef.apply_delta(path):
+            if n in self.graph:
+                self.graph.nodes[n]["rc"] = self.spef.net(n)
+                changed.append(n)
+        self.mark_dirty(changed)
+        return changed
+
     def is_cyclic(self):
         """
-        检查网表是否有环。
+        检查网表是否有组合环 (不经过 flipflop 的环)。经过 flipflop 的环是正常的时序电路，不算在内，
+        所以它为 False 时 levelize, topo_sort 和 fanin_depth 都不会报 ValueError. 结果取自缓存的分级索引，直到网表被修改。
 
         Returns
         -------
         bool
-                Existence of cycle
+                Existence of combinational cycle
 
         """
-        return not nx.is_directed_acyclic_graph(self.graph)
+        if self._cyclic is None:
+            try:
+                self.levelize()
+                self._cyclic = False
+            except ValueError:
+                self._cyclic = True
+        return self._cyclic
     
     def topo_sort(self):
         """
         返回一个生成器，以拓扑顺序依次返回若干组节点。
+        顺序取自缓存的分级索引（见 levelize），flipflop 的 fanout 边被视为断开，所以含有 flipflop 的时序电路也可以排序。
 
         Returns
         -------
@@ -381,7 +674,257 @@ class Netlist:
                 Ordered node names.
 
         """
-        return nx.topological_sort(self.graph)
+        return (n for nodes in self.levels for n in nodes)
+
+    def _is_sequential(self, n):
+        # flipflop 的 fanout 边在分级时视为断开，环都要经过 flipflop 才是合法的时序电路
+        return self.graph.nodes[n].get("type") == "flipflop"
+
+    def levelize(self):
+        """
+        建立（或返回缓存的）分级拓扑索引：每个节点的逻辑级数等于从没有前驱的节点（primary input、flipflop 的输出等）
+        到它的最长路径的边数。计算时 flipflop 的 fanout 边被视为断开。
+        索引只在第一次调用时用 O(V+E) 建立，之后 add_node/connect/disconnect/remove_nodes 只会修复受影响的那部分节点。
+
+        Returns
+        -------
+        dict = {str node: int level}
+                这个字典就是缓存本身，不要修改它。
+
+        Raises
+        ------
+        ValueError
+                网表中有不经过 flipflop 的环 (组合环)。
+        """
+        if self._level is not None:
+            return self._level
+
+        g = self.graph
+        if isinstance(g, CSRGraph):
+            # CSR 后端直接在数组上逐层做 Kahn 排序
+            ids = g.levelize_ids(g.node_mask("type", "flipflop"))
+            if (ids < 0).any():
+                raise ValueError("Cannot levelize netlist with combinational cycle")
+            order = np.argsort(ids, kind="stable")
+            bounds = np.searchsorted(ids[order], np.arange(ids.max() + 2 if len(ids) else 1))
+            self._level_sets = [dict.fromkeys(g.decode(order[bounds[l]:bounds[l + 1]])) for l in range(len(bounds) - 1)]
+            self._level = {n: l for l, nodes in enumerate(self._level_sets) for n in nodes}
+            return self._level
+
+        indegree = dict.fromkeys(g, 0)
+        for u, nbrs in g.adj.items():
+            if self._is_sequential(u):
+                continue
+            for v, keys in nbrs.items():
+                indegree[v] += len(keys)
+
+        level = dict()
+        level_sets = []
+        frontier = [n for n, d in indegree.items() if d == 0]
+        while frontier:
+            l = len(level_sets)
+            level_sets.append(dict.fromkeys(frontier))
+            nxt = []
+            for u in frontier:
+                level[u] = l
+                if self._is_sequential(u):
+                    continue
+                for v, keys in g.adj[u].items():
+                    indegree[v] -= len(keys)
+                    if indegree[v] == 0:
+                        nxt.append(v)
+            frontier = nxt
+
+        if len(level) < len(g):
+            raise ValueError("Cannot levelize netlist with combinational cycle")
+        self._level, self._level_sets = level, level_sets
+        return level
+
+    @property
+    def levels(self):
+        """每一级的节点组成的列表，第 i 个元素是级数为 i 的所有节点 (按加入的先后排列的 dict, 顺序每次运行都一样)。不要修改它。"""
+        self.levelize()
+        return self._level_sets
+
+    def level(self, n):
+        """节点 n 的逻辑级数，见 levelize."""
+        return self.levelize()[n]
+
+    def _topo_dag(self):
+        # 按拓扑顺序给节点编号，并把 flipflop 的 fanout 边断开之后的 DAG 存成边数组：
+        # fanout 方向按终点排序，fanin 方向按起点排序，edge_ptr 给出每一级节点的边在数组中的范围
+        if self._topo is not None:
+            return self._topo
+        g = self.graph
+        levels = self.levels
+        order = [n for nodes in levels for n in nodes]
+        pos = {n: i for i, n in enumerate(order)}
+        level_ptr = np.zeros(len(levels) + 1, dtype=np.int64)
+        np.cumsum([len(nodes) for nodes in levels], out=level_ptr[1:])
+
+        if isinstance(g, CSRGraph):
+            perm = np.empty(len(order), dtype=np.int64)
+            perm[g.ids(order)] = np.arange(len(order))
+            src = np.repeat(np.arange(len(g)), np.diff(g.out_ptr))
+            keep = ~g.node_mask("type", "flipflop")[src]
+            src, dst = perm[src[keep]], perm[g.out_dst[keep]]
+        else:
+            seq = self._build_attr_index()["type"].get("flipflop", {})
+            src, dst = [], []
+            for v in order:
+                j = pos[v]
+                for u in g._pred[v]:
+                    if u not in seq:
+                        src.append(pos[u])
+                        dst.append(j)
+            src, dst = np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64)
+
+        # 去掉平行边（同一对节点之间的多个引脚，个数记在 mult 中），同时按 (终点, 起点) 排序
+        n = max(len(order), 1)
+        key, mult = np.unique(dst * n + src, return_counts=True)
+        dst, src = key // n, key % n
+        by_src = np.argsort(src, kind="stable")
+        nodes = np.arange(len(order) + 1)
+        self._topo = {
+            "order": order,
+            "pos": pos,
+            "level_ptr": level_ptr,
+            "fanout": (dst, src, np.searchsorted(dst, level_ptr)),
+            "fanin": (src[by_src], dst[by_src], np.searchsorted(src[by_src], level_ptr)),
+            # 按节点的 CSR: 节点 i 的前驱为 fanout[1][in_ptr[i]:in_ptr[i+1]]，后继为 fanin[1][out_ptr[i]:out_ptr[i+1]]
+            "in_ptr": np.searchsorted(dst, nodes),
+            "out_ptr": np.searchsorted(src[by_src], nodes),
+            "in_mult": mult,
+            "out_mult": mult[by_src],
+        }
+        return self._topo
+
+    def cone_bitsets(self, ns, fanin=False):
+        """
+        一次算出多个节点的 transitive fanout (或 fanin)。ns 中的第 j 个节点占用第 j 个比特，
+        按拓扑顺序（fanin 时按逆序）把打包成 uint64 的比特集合沿边逐级做按位或，K 个查询节点只需要扫描一遍网表，
+        代价为 O((V+E)·K/64)，而不是逐个节点遍历的 O(K·(V+E)).
+        与 levelize 一样，flipflop 的 fanout 边视为断开：锥在 flipflop 处停下，但 flipflop 本身在锥内。
+
+        Parameters
+        ----------
+        ns : iterable of str or iterable of iterable of str
+                K 个查询节点。元素也可以是一组节点，这组节点共用同一个比特，得到的是它们的锥的并集。
+        fanin : bool
+                为 False 时，第 i 行记录哪些查询节点能到达 nodes[i]（即 nodes[i] 在它们的 transitive fanout 中）；
+                为 True 时，第 i 行记录 nodes[i] 能到达哪些查询节点（即 nodes[i] 在它们的 transitive fanin 中）。
+
+        Returns
+        -------
+        (list of str, numpy.ndarray)
+                nodes: 按拓扑顺序排列的所有节点，不要修改它；
+                bits: 形状为 (V, ceil(K/64)) 的 uint64 数组，第 j 个查询节点对应第 j//64 列的第 j%64 位。查询节点自己的那一位也是置上的。
+
+        Raises
+        ------
+        ValueError
+                网表中有组合环。
+        """
+        topo = self._topo_dag()
+        pos, level_ptr = topo["pos"], topo["level_ptr"]
+        tail, head, edge_ptr = topo["fanin" if fanin else "fanout"]
+        ns = list(ns)
+        bits = np.zeros((len(topo["order"]), (len(ns) + 63) // 64), dtype=np.uint64)
+        groups = [[n] if isinstance(n, str) else n for n in ns]
+        j = np.fromiter((j for j, group in enumerate(groups) for n in group), dtype=np.int64)
+        rows = np.fromiter((pos[n] for group in groups for n in group), dtype=np.int64, count=len(j))
+        np.bitwise_or.at(bits, (rows, j >> 6), np.left_shift(np.uint64(1), (j & 63).astype(np.uint64)))
+
+        # fanout 方向：第 l 级节点的入边都来自更低的级；fanin 方向反过来，所以逐级倒着做
+        nlevels = len(level_ptr) - 1
+        for l in (range(nlevels - 1, -1, -1) if fanin else range(1, nlevels)):
+            a, b = edge_ptr[l], edge_ptr[l + 1]
+            if a == b:
+                continue
+            t = tail[a:b]
+            starts = np.flatnonzero(np.r_[True, t[1:] != t[:-1]])
+            bits[t[starts]] |= np.bitwise_or.reduceat(bits[head[a:b]], starts, axis=0)
+        return topo["order"], bits
+
+    def _cones(self, ns, fanin):
+        # 按 BITSET_BYTES 的预算把查询节点分批，每批调用一次 cone_bitsets，
+        # 再把比特矩阵中非零的字展开成 (查询节点, 节点) 对，按查询节点分组取出每个锥
+        topo = self._topo_dag()
+        order, pos = topo["order"], topo["pos"]
+        ns = list(ns)
+        chunk = max(64, BITSET_BYTES // (8 * max(len(order), 1)) // 64 * 64)
+        for c in range(0, len(ns), chunk):
+            batch = ns[c:c + chunk]
+            _, bits = self.cone_bitsets(batch, fanin)
+            rows, bounds = self._unpack_bitsets(bits, len(batch))
+            for j, n in enumerate(batch):
+                yield [order[i] for i in rows[bounds[j]:bounds[j + 1]].tolist() if i != pos[n]]
+
+    @staticmethod
+    def _unpack_bitsets(bits, k):
+        # 把比特矩阵中非零的字展开成 (查询, 行) 对并按查询排序；第 j 个查询的行号为 rows[bounds[j]:bounds[j+1]]
+        rows, words = np.nonzero(bits)
+        flags = np.unpackbits(bits[rows, words].view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+        i, b = np.nonzero(flags)
+        query, rows = words[i] * 64 + b, rows[i]
+        by_query = np.argsort(query, kind="stable")
+        return rows[by_query], np.searchsorted(query[by_query], np.arange(k + 1))
+
+    def _cone(self, n, fanin):
+        # 单个节点直接在图上做一次遍历，不必建立 _topo_dag
+        g = self.graph
+        seen = {n}
+        stack = [n]
+        while stack:
+            u = stack.pop()
+            if fanin:
+                nbrs = (w for w in g._pred[u] if not self._is_sequential(w))
+            else:
+                nbrs = () if self._is_sequential(u) else g._succ[u]
+            for w in nbrs:
+                if w not in seen:
+                    seen.add(w)
+                    stack.append(w)
+        seen.discard(n)
+        return list(seen)
+
+    def _repair_levels(self, seeds):
+        # 从 seeds 开始向后重新计算级数，只有级数真的变了才继续往后传，因此代价只与受影响的节点数有关
+        self._topo = None
+        self._timing_points = None
+        if self._level is None:
+            return
+        g = self.graph
+        level, level_sets = self._level, self._level_sets
+        limit = len(g)
+        work = deque(n for n in seeds)
+        queued = set(work)
+        while work:
+            v = work.popleft()
+            queued.discard(v)
+            if v not in g:
+                continue
+            new = max((level.get(u, 0) + 1 for u in g.pred[v] if not self._is_sequential(u)), default=0)
+            old = level.get(v)
+            if new == old:
+                continue
+            if new > limit:
+                # 级数一直涨，说明出现了组合环
+                self._level = self._level_sets = None
+                return
+            if old is not None:
+                level_sets[old].pop(v, None)
+            while len(level_sets) <= new:
+                level_sets.append(dict())
+            level_sets[new][v] = None
+            level[v] = new
+            if not self._is_sequential(v):
+                for w in g.succ[v]:
+                    if w not in queued:
+                        work.append(w)
+                        queued.add(w)
+        while level_sets and not level_sets[-1]:
+            level_sets.pop()
 
     def ntype(self, ns, io_flag=1, warn_ignore=0):
         """
@@ -580,28 +1123,8 @@ class Netlist:
                 当 ntypes 是单个 str 变量时返回一个生成器或列表 (取决于 io_flag)。
 
         """
-        
-        if isinstance(ntypes, str):  
-            # 如果输入的 ntypes 是单个节点
-            if io_flag == 0:
-                return (n for n in self.graph.nodes if self.ntype(n, warn_ignore=1) == ntypes)
-            else:
-                return [n for n in self.graph.nodes if self.ntype(n, warn_ignore=1) == ntypes]
-        else:
-            # 如果输入的 ntypes 是可迭代对象
-            ntypes = set(ntypes)   # 去除相同的 type.
-            
-            node_dict = dict()
-            
-            # 用 #type 次遍历来获得所有相关的节点（我暂时没想到怎么用一次遍历取出这些节点的同时还能封装成多个生成器）
-            for ty in ntypes:
-                if io_flag == 0:
-                    node_dict[ty] = (n for n in self.graph.nodes if self.ntype(n, warn_ignore=1) == ty)
-                else:
-                    node_dict[ty] = [n for n in self.graph.nodes if self.ntype(n, warn_ignore=1) == ty]
-
-            return node_dict
-    
+        return self._filter_attr("type", ntypes, io_flag)
+
     def filter_nsubtype(self, nsubtypes, io_flag=1):
         """
         返回所有 "subtype" 属性 in nsubtypes 的节点。
@@ -623,27 +1146,7 @@ class Netlist:
                 当 nsubtypes 是单个 str 变量时返回一个生成器或列表 (取决于 io_flag)。
 
         """
-        
-        if isinstance(nsubtypes, str):  
-            # 如果输入的 nsubtypes 是单个节点
-            if io_flag == 0:
-                return (n for n in self.graph.nodes if self.nsubtype(n, warn_ignore=1) == nsubtypes)
-            else:
-                return [n for n in self.graph.nodes if self.nsubtype(n, warn_ignore=1) == nsubtypes]
-        else:
-            # 如果输入的 nsubtypes 是可迭代对象
-            nsubtypes = set(nsubtypes)   # 去除相同的 type.
-            
-            node_dict = dict()
-            
-            # 用 #type 次遍历来获得所有相关的节点（我暂时没想到怎么用一次遍历取出这些节点的同时还能封装成多个生成器）
-            for ty in nsubtypes:
-                if io_flag == 0:
-                    node_dict[ty] = (n for n in self.graph.nodes if self.nsubtype(n, warn_ignore=1) == ty)
-                else:
-                    node_dict[ty] = [n for n in self.graph.nodes if self.nsubtype(n, warn_ignore=1) == ty]
-
-            return node_dict
+        return self._filter_attr("subtype", nsubtypes, io_flag)
 
     def filter_nfunction(self, nfuncs, io_flag=1):
         """
@@ -666,27 +1169,7 @@ class Netlist:
                 当 nfuncs 是单个 str 变量时返回一个生成器或列表 (取决于 io_flag)。
 
         """
-        
-        if isinstance(nfuncs, str):  
-            # 如果输入的 nfuncs 是单个节点
-            if io_flag == 0:
-                return (n for n in self.graph.nodes if self.nfunction(n, warn_ignore=1) == nfuncs)
-            else:
-                return [n for n in self.graph.nodes if self.nfunction(n, warn_ignore=1) == nfuncs]
-        else:
-            # 如果输入的 nfuncs 是可迭代对象
-            nfuncs = set(nfuncs)   # 去除相同的 func.
-            
-            node_dict = dict()
-            
-            # 用 #nfuncs 次遍历来获得所有相关的节点（我暂时没想到怎么用一次遍历取出这些节点的同时还能封装成多个生成器）
-            for ty in nfuncs:
-                if io_flag == 0:
-                    node_dict[ty] = (n for n in self.graph.nodes if self.nfunction(n, warn_ignore=1) == ty)
-                else:
-                    node_dict[ty] = [n for n in self.graph.nodes if self.nfunction(n, warn_ignore=1) == ty]
-
-            return node_dict
+        return self._filter_attr("function", nfuncs, io_flag)
 
     def filter_niotype(self, niotypes, io_flag=1):
         """
@@ -709,27 +1192,7 @@ class Netlist:
                 当 ntypes 是单个 str 变量时返回一个生成器或列表 (取决于 io_flag)。
 
         """
-        
-        if isinstance(niotypes, str):  
-            # 如果输入的 ntypes 是单个节点
-            if io_flag == 0:
-                return (n for n in self.graph.nodes if self.niotype(n, warn_ignore=1) == niotypes)
-            else:
-                return [n for n in self.graph.nodes if self.niotype(n, warn_ignore=1) == niotypes]
-        else:
-            # 如果输入的 niotypes 是可迭代对象
-            niotypes = set(niotypes)   # 去除相同的 iotype.
-            
-            node_dict = dict()
-            
-            # 用 #niotypes 次遍历来获得所有相关的节点（我暂时没想到怎么用一次遍历取出这些节点的同时还能封装成多个生成器）
-            for ty in niotypes:
-                if io_flag == 0:
-                    node_dict[ty] = (n for n in self.graph.nodes if self.niotype(n, warn_ignore=1) == ty)
-                else:
-                    node_dict[ty] = [n for n in self.graph.nodes if self.niotype(n, warn_ignore=1) == ty]
-
-            return node_dict
+        return self._filter_attr("iotype", niotypes, io_flag)
 
     def add_node(self, n, fanin_nodes=[], fanout_nodes=[], **attr):
         """
@@ -760,7 +1223,9 @@ class Netlist:
             for k,v in fanout_nodes.items():
                 self.graph.add_edge(n, v, type = "fanout", subtype=k)
             # 向 graph 中添加节点
+            self._unindex_node(n)
             self.graph.add_node(n, **attr)
+            self._index_node(n)
             
         else:
             # 如果未指定连接名称，只指定了连接关系。
@@ -777,12 +1242,20 @@ class Netlist:
             fanout_nodes = list(fanout_nodes)
 
             # 向 graph 中添加节点
+            self._unindex_node(n)
             self.graph.add_node(n, **attr)
+            self._index_node(n)
 
             # 连接 fanin 和 fanout
             self.connect(n, fanout_nodes)
             self.connect(fanin_nodes, n)
 
+        if self._cyclic is False and (fanin_nodes or fanout_nodes):
+            self._cyclic = None
+        touched = list(chain([n], fanin_nodes.values() if isinstance(fanin_nodes, dict) else fanin_nodes,
+                             fanout_nodes.values() if isinstance(fanout_nodes, dict) else fanout_nodes))
+        self.mark_dirty(touched)
+        self._repair_levels(touched)
         return n
 
     def get_edge_data(self, u, v, key=None, default=None):
@@ -803,9 +1276,25 @@ class Netlist:
         """
         if isinstance(ns, str):
             ns = [ns]
+        ns = dict.fromkeys(n for n in ns if n in self.graph)     # 保持传入的顺序，级数修复的顺序才与哈希种子无关
+        for n in ns:
+            self._unindex_node(n)
+        # 与被删节点相连的节点的连接关系也变了
+        self.mark_dirty(set(chain(ns, (w for n in ns for w in chain(self.graph.pred[n], self.graph.succ[n])))))
+        if self._level is not None:
+            # 被删节点的后继的级数可能会降低
+            seeds = dict.fromkeys(w for n in ns for w in self.graph.succ[n] if w not in ns)
+            for n in ns:
+                l = self._level.pop(n, None)
+                if l is not None:
+                    self._level_sets[l].pop(n, None)
         self.graph.remove_nodes_from(ns)   # 如果节点本来就不存在，也不会报错。
+        if self._cyclic:
+            self._cyclic = None
+        if self._level is not None:
+            self._repair_levels(seeds)
 
-    def connect(self, us, vs):
+    def connect(self, us, vs, **attr):
         """
         为传入的两组节点之间建立全连接的边。（并不是画一个完全图，而是像神经网络的全连接层那样。）
 
@@ -815,6 +1304,7 @@ class Netlist:
                 第一个/组节点
         vs : str or iterable of str
                 第二个/组节点 
+        **attr : 新边的属性，例如 type="fanin", subtype="A"
 
         """
         if not us or not vs:
@@ -836,9 +1326,13 @@ class Netlist:
                 raise ValueError(f"node '{n}' does not exist.")
 
         # connect
-        self.graph.add_edges_from((u, v) for u in us for v in vs)
+        self.graph.add_edges_from(((u, v) for u in us for v in vs), **attr)
+        if self._cyclic is False:
+            self._cyclic = None
+        self.mark_dirty(us + vs)
+        self._repair_levels(vs)
 
-    def disconnect(self, us, vs):
+    def disconnect(self, us, vs, subtype=None):
         """
         connect 的反向操作，去除两组节点的全连接性。
 
@@ -848,6 +1342,8 @@ class Netlist:
                 第一个/组节点
         vs : str or iterable of str
                 第二个/组节点 
+        subtype : str (可以为空)
+                如果指定了，只去除 subtype 属性（即引脚名）等于它的边，例如只断开 gate 的 A2 引脚。
 
         """
         if isinstance(us, str):
@@ -856,7 +1352,15 @@ class Netlist:
         if isinstance(vs, str):
             vs = [vs]
         vs = list(vs)
-        self.graph.remove_edges_from((u, v) for u in us for v in vs)
+        if subtype is None:
+            self.graph.remove_edges_from((u, v) for u in us for v in vs)
+        else:
+            self.graph.remove_edges_from([(u, v, k) for u in us for v in vs
+                                          for k, d in self.graph.get_edge_data(u, v, default={}).items() if d.get("subtype") == subtype])
+        if self._cyclic:
+            self._cyclic = None
+        self.mark_dirty(us + vs)
+        self._repair_levels(vs)
 
     def fanin(self, ns, io_flag=1):
         """
@@ -922,7 +1426,8 @@ class Netlist:
     def transitive_fanin(self, ns, io_flag=1):
         """
         列出 ns 中每一个节点的 transitive fanin 节点（所有的前驱节点）。
-        【疑问: 如果 edge 有名称，那么怎么看 edge 的 transitive fanin 节点呢？】
+        flipflop 的 fanout 边视为断开，所以锥在 flipflop 处停下（见 cone_bitsets）。
+        ns 是多个节点时，所有节点的锥由 cone_bitsets 按比特并行一起算出。
 
         Parameters
         ----------
@@ -941,18 +1446,17 @@ class Netlist:
         """
         
         if isinstance(ns, str):
-            return list(self.graph.ancestors(ns))
+            return self._cone(ns, fanin=True)
         else:
-            if io_flag == 0:
-                return ( self.transitive_fanin(n,io_flag) for n in ns )
-            else:
-                return [ self.transitive_fanin(n,io_flag) for n in ns ]
+            cones = self._cones(ns, fanin=True)
+            return cones if io_flag == 0 else list(cones)
         
         
     def transitive_fanout(self, ns, io_flag=1):
         """
         列出 ns 中每一个节点的 transitive fanout 节点（所有的后继节点）。
-        【疑问: 如果 edge 有名称，那么怎么看 edge 的 transitive fanout 节点呢？】
+        flipflop 的 fanout 边视为断开，所以锥在 flipflop 处停下（见 cone_bitsets）。
+        ns 是多个节点时，所有节点的锥由 cone_bitsets 按比特并行一起算出。
 
         Parameters
         ----------
@@ -971,19 +1475,17 @@ class Netlist:
         """
         
         if isinstance(ns, str):
-            return list(self.graph.descendants(ns))
+            return self._cone(ns, fanin=False)
         else:
-            if io_flag == 0:
-                return ( self.transitive_fanout(n,io_flag) for n in ns )
-            else:
-                return [ self.transitive_fanout(n,io_flag) for n in ns ]
+            cones = self._cones(ns, fanin=False)
+            return cones if io_flag == 0 else list(cones)
         
     def paths(self, source, target, cutoff=None, io_flag=0):
         """
         获取从节点 u 到节点 v 的所有 path. （目前只支持传入一对节点，暂不支持两组节点之间）.
         由于即便在较小的 design 中, 两点之间的路径数量也可能非常大，所以 io_flag 默认为 0.
         
-        本质基于 nx.all_simple_paths() 函数。
+        本质基于 nx.all_simple_paths() 函数。需要按长度从长到短取前几条路径时，用 worst_paths.
 
         Parameters
         ----------
@@ -1003,193 +1505,448 @@ class Netlist:
         return paths if io_flag == 0 else list(paths)
 
 
+    def _is_clock_pin(self, n, pin):
+        # 读入了 Liberty 库时看引脚的 clock 属性，否则按引脚名判断
+        if self.liberty is not None:
+            try:
+                return self.lib_cell(n).is_clock(pin)
+            except KeyError:
+                pass
+        return CLOCK_PIN_PATTERN.fullmatch(pin) is not None
+
+    def timing_points(self):
+        """
+        建立（或返回缓存的）时序路径的边界：
+        + startpoints: primary input 和 flipflop 的输出 net;
+        + endpoints: primary output 和 flipflop (代表它的数据引脚，时钟引脚不算);
+        + launch: {flipflop: [它的输出 net]};
+        + capture: {flipflop: [它的数据引脚所接的 net]}.
+        flipflop 就是 build 时 type 为 "flipflop" 的节点，时钟引脚由 Liberty 的 clock 属性（没有读入库时按 CLOCK_PIN_PATTERN）判断。
+        结果在网表被修改之后会自动重建。
+
+        Returns
+        -------
+        dict
+                {"startpoints": dict, "endpoints": dict, "launch": dict, "capture": dict}, 前两者以 dict 当作有序集合。不要修改它。
+        """
+        if self._timing_points is None:
+            g = self.graph
+            index = self._build_attr_index()
+            launch, capture = dict(), dict()
+            for ff in index["type"].get("flipflop", ()):
+                launch[ff] = list(g._succ[ff])
+                capture[ff] = list(dict.fromkeys(u for u, keys in g._pred[ff].items() for d in keys.values()
+                                                 if not self._is_clock_pin(ff, d.get("subtype", ""))))
+            startpoints = dict.fromkeys(index["iotype"].get("input", ()))
+            startpoints.update(dict.fromkeys(chain.from_iterable(launch.values())))
+            endpoints = dict.fromkeys(index["iotype"].get("output", ()))
+            endpoints.update(dict.fromkeys(capture))
+            self._timing_points = {"startpoints": startpoints, "endpoints": endpoints, "launch": launch, "capture": capture}
+        return self._timing_points
+
+    def _boundary_points(self, ns, fanin):
+        # startpoints (fanin=True) 或 endpoints (fanin=False) 的批量查询：所有查询节点的锥在一次 cone_bitsets 中算出。
+        # flipflop 作为查询节点时，前者从它的数据引脚往回找，后者从它的输出 net 往后找
+        tp = self.timing_points()
+        points = tp["startpoints"] if fanin else tp["endpoints"]
+        seeds = tp["capture"] if fanin else tp["launch"]
+        pos = self._topo_dag()["pos"]
+        ns = list(ns)
+        groups = [seeds.get(n, [n]) for n in ns]
+        _, bits = self.cone_bitsets(groups, fanin)
+
+        # 每个 boundary 点对应比特矩阵中的若干行：flipflop 作为 endpoint 时取它的数据引脚 net 的并集
+        members = [tp["capture"][p] if not fanin and p in tp["capture"] else [p] for p in points]
+        point_ids = np.fromiter((i for i, m in enumerate(members) for _ in m), dtype=np.int64)
+        rows = np.fromiter((pos[n] for m in members for n in m), dtype=np.int64, count=len(point_ids))
+        sub = np.zeros((len(members), bits.shape[1]), dtype=np.uint64)
+        np.bitwise_or.at(sub, point_ids, bits[rows])
+
+        points = list(points)
+        hits, bounds = self._unpack_bitsets(sub, len(ns))
+        for j in range(len(ns)):
+            yield [points[i] for i in hits[bounds[j]:bounds[j + 1]].tolist()]
+
     def startpoints(self, ns=None, io_flag=1):
         """
-        查询 node, nodes, or netlist 的 startpoints.
-        【这个函数尚不可用，接口未经过调整】
+        查询时序路径的起点 (startpoints): primary input 和 flipflop 的输出 net.
+        ns 不为空时，返回能到达 ns 中每个节点的起点；flipflop 作为查询节点时，查的是它的数据引脚 (见 timing_points)。
+        多个节点的查询在一次 cone_bitsets 中一起完成。
 
         Parameters
         ----------
-        ns : str or iterable of str
-                Node(s) to compute startpoints for.
+        ns : str, iterable of str or None
+                要查询的节点。为 None 时返回网表的所有起点。
+        io_flag : bool int
+                为 0 时, 表示返回的可迭代对象为一个生成器。
+                为 1 时, 表示返回的可迭代对象为一个列表。
 
         Returns
         -------
-        list of str
-                Startpoints of ns.
+        list of str, or list of sublist of str, or generator
+                ns 为 None 或单个节点时返回起点列表；ns 是可迭代对象时，作为元素的 list 是每个 ns 成员的起点列表。
 
         """
-        
+        if ns is None:
+            points = self.timing_points()["startpoints"]
+            return (n for n in points) if io_flag == 0 else list(points)
         if isinstance(ns, str):
-            ns = [ns]
-
-        if ns:
-            # 自己 + 自己的所有前驱 
-            return (set(ns) | self.transitive_fanin(ns)) & self.startpoints()
-        return self.inputs()
+            return next(self._boundary_points([ns], fanin=True))
+        points = self._boundary_points(ns, fanin=True)
+        return points if io_flag == 0 else list(points)
 
     def endpoints(self, ns=None, io_flag=1):
         """
-        Compute the endpoints of a node, nodes, or netlist.
-        【这个函数尚不可用，接口未经过调整】
+        查询时序路径的终点 (endpoints): primary output 和 flipflop 的数据引脚（以 flipflop 节点表示）。
+        ns 不为空时，返回 ns 中每个节点能到达的终点；flipflop 作为查询节点时，查的是它的输出 net (见 timing_points)。
+        多个节点的查询在一次 cone_bitsets 中一起完成。
 
         Parameters
         ----------
-        ns : str or iterable of str
-                Node(s) to compute endpoints for.
+        ns : str, iterable of str or None
+                要查询的节点。为 None 时返回网表的所有终点。
+        io_flag : bool int
+                为 0 时, 表示返回的可迭代对象为一个生成器。
+                为 1 时, 表示返回的可迭代对象为一个列表。
 
         Returns
         -------
-        set of str
-                Endpoints of ns.
+        list of str, or list of sublist of str, or generator
+                ns 为 None 或单个节点时返回终点列表；ns 是可迭代对象时，作为元素的 list 是每个 ns 成员的终点列表。
 
         """
+        if ns is None:
+            points = self.timing_points()["endpoints"]
+            return (n for n in points) if io_flag == 0 else list(points)
         if isinstance(ns, str):
-            ns = [ns]
+            return next(self._boundary_points([ns], fanin=False))
+        points = self._boundary_points(ns, fanin=False)
+        return points if io_flag == 0 else list(points)
+
+    def _longest_to_end(self, weight, targets):
+        # 逆拓扑顺序逐级取最大，算出每个节点到终点的最长距离（到不了任何终点的为 -inf），同时返回 topo["fanin"] 中每条边的权重。
+        # flipflop 只能从数据引脚所接的 net 进入，时钟引脚上的边权重为 -inf
+        cache = weight is None and targets is None
+        topo = self._topo_dag()
+        if cache and "longest" in topo:
+            return topo["longest"]
+        order, pos = topo["order"], topo["pos"]
+        out_src, out_dst, edge_ptr = topo["fanin"]
+        out_ptr = topo["out_ptr"]
+        tp = self.timing_points()
+        if weight is None:
+            is_gate = np.zeros(len(order))
+            is_gate[[pos[n] for n in self._build_attr_index()["type"].get("gate", ())]] = 1.0
+            w = is_gate[out_dst]
+        else:
+            g = self.graph
+            w = np.array([max(d.get(weight, 1) for d in g._succ[order[u]][order[v]].values())
+                          for u, v in zip(out_src.tolist(), out_dst.tolist())], dtype=float)
+        in_ptr, in_src = topo["in_ptr"], topo["fanout"][1]
+        for ff, capture in tp["capture"].items():
+            i = pos[ff]
+            capture = set(pos[n] for n in capture)
+            for u in in_src[in_ptr[i]:in_ptr[i + 1]].tolist():
+                if u not in capture:
+                    e = out_ptr[u] + np.searchsorted(out_dst[out_ptr[u]:out_ptr[u + 1]], i)
+                    w[e] = -np.inf
+
+        is_end = np.zeros(len(order), dtype=bool)
+        is_end[[pos[n] for n in (tp["endpoints"] if targets is None else targets)]] = True
+        best = np.where(is_end, 0.0, -np.inf)
+        for l in range(len(edge_ptr) - 2, -1, -1):
+            a, b = edge_ptr[l], edge_ptr[l + 1]
+            if a == b:
+                continue
+            t = out_src[a:b]
+            starts = np.flatnonzero(np.r_[True, t[1:] != t[:-1]])
+            best[t[starts]] = np.maximum(best[t[starts]], np.maximum.reduceat(best[out_dst[a:b]] + w[a:b], starts))
+        result = (best, w, is_end)
+        if cache:
+            topo["longest"] = result
+        return result
+
+    def worst_paths(self, k=None, weight=None, sources=None, targets=None):
+        """
+        按长度从长到短、惰性地给出从起点到终点的路径，只算出真正被取走的那几条。
+        先用一遍逆拓扑顺序的 DP 求出每个节点到终点的最长距离，然后每条路径都表示成 "某个前缀 + 在某个节点上选第 r 好的后继，之后一直走最长的后继"，
+        放在优先队列里；每取出一条路径，只需要把它沿途每个节点上次好的选择放回队列 (deviation)，
+        所以取前 K 条路径的代价约为 O(V+E + K·L·log(K·L))，L 是路径长度。
+        与 levelize 一样，flipflop 的 fanout 边视为断开；flipflop 作为终点时只能从它的数据引脚进入（见 timing_points）。
 
-        if ns:
-            return (set(ns) | self.transitive_fanout(ns)) & self.endpoints()
-        return self.outputs() | self.filter_type("bb_input")
+        Parameters
+        ----------
+        k : int (可以为空)
+                最多给出多少条路径。为空时按长度顺序给出所有路径（路径可能非常多，请只取需要的部分）。
+        weight : str (可以为空)
+                为空时路径长度等于路径上 gate 节点的个数 (gate depth)；否则为边上的这个属性之和（缺少这个属性的边按 1 计，平行边取最大）。
+        sources : iterable of str (可以为空)
+                路径的起点，默认为所有 startpoints.
+        targets : iterable of str (可以为空)
+                路径的终点，默认为所有 endpoints.
+
+        Returns
+        -------
+        generator of (float, list of str)
+                (路径长度, 路径上的节点)，按路径长度从大到小排列。
+
+        Raises
+        ------
+        ValueError
+                网表中有组合环。
+        """
+        topo = self._topo_dag()
+        order, pos = topo["order"], topo["pos"]
+        out_ptr, out_dst = topo["out_ptr"], topo["fanin"][1]
+        best, w, is_end = self._longest_to_end(weight, targets)
+        sources = self.timing_points()["startpoints"] if sources is None else sources
+
+        # 每个节点上的选择按走下去能得到的最长距离排序：(距离, 下一个节点, 边权)，下一个节点为 -1 表示在这个终点结束
+        choices = dict()
+        choices[-1] = sorted(((best[i], i, 0.0) for i in (pos[n] for n in sources) if best[i] > -np.inf), reverse=True)
+
+        def choices_of(x):
+            c = choices.get(x)
+            if c is None:
+                a, b = out_ptr[x], out_ptr[x + 1]
+                nxt, ew = out_dst[a:b], w[a:b]
+                c = [(v, u, e) for v, u, e in zip((best[nxt] + ew).tolist(), nxt.tolist(), ew.tolist()) if v > -np.inf]
+                if is_end[x]:
+                    c.append((0.0, -1, 0.0))
+                c.sort(reverse=True)
+                choices[x] = c
+            return c
+
+        # 队列中的元素：(-路径总长, 序号, 已走的长度, 前缀, 做选择的节点, 选第几好的)；前缀是 (节点, 更前面的前缀) 组成的链表
+        heap = []
+        if choices[-1]:
+            heap.append((-choices[-1][0][0], 0, 0.0, None, -1, 0))
+        count = 1
+        found = 0
+        while heap and (k is None or found < k):
+            _, _, length, prefix, x, rank = heapq.heappop(heap)
+            c = choices[x]
+            if rank + 1 < len(c):
+                heapq.heappush(heap, (-(length + c[rank + 1][0]), count, length, prefix, x, rank + 1))
+                count += 1
+            _, y, e = c[rank]
+            while y != -1:
+                length += e
+                prefix = (y, prefix)
+                c = choices_of(y)
+                if len(c) > 1:
+                    heapq.heappush(heap, (-(length + c[1][0]), count, length, prefix, y, 1))
+                    count += 1
+                _, y, e = c[0]
+            path = []
+            while prefix is not None:
+                path.append(order[prefix[0]])
+                prefix = prefix[1]
+            path.reverse()
+            found += 1
+            yield length, path
+
+    def _depths(self, reverse, pessimism):
+        # 按拓扑顺序 (reverse 时按逆序) 做一遍 DP, flipflop 的 fanout 边视为断开
+        g = self.graph
+        agg = min if pessimism else max
+        levels = self.levels
+        order = (n for nodes in (reversed(levels) if reverse else levels) for n in nodes)
+        depth = dict()
+        for v in order:
+            if reverse:
+                nbrs = () if self._is_sequential(v) else g._succ[v]
+            else:
+                nbrs = [u for u in g._pred[v] if not self._is_sequential(u)]
+            depth[v] = agg(depth[u] for u in nbrs) + 1 if nbrs else 0
+        return depth
+
+    def _select_depths(self, depth, ns):
+        if ns is None:
+            return depth
+        if isinstance(ns, str):
+            return depth[ns]
+        return {n: depth[n] for n in ns}
 
-    def fanout_depth(self, n, pessimism=1):
+    def fanout_depth(self, ns=None, pessimism=1):
         """
-        计算 单个节点 的 后继深度 列表（后继有多少 output port, 这个列表就会有多长）。
+        计算节点的 后继深度：节点到其后继中的终点（没有后继的节点，例如 primary output 和 flipflop）所经过的边数。
         当在 后继节点 上发生 reconverge 时,  pessimism 会决定 深度取大还是取小。
         pessimism = 1 时, 深度总是取小。pessimism = 0 时，深度总是取大。
-        【函数功能待测试】
+        所有节点的深度在一次 O(V+E) 的逆拓扑序 DP 中一起算出（用 levelize 缓存的分级索引，flipflop 的 fanout 边视为断开）。
 
         Parameters
         ----------
-        n : str 
-                要计算深度的节点。
+        ns : str, iterable of str or None
+                要计算深度的节点。为 None 时返回所有节点的深度。
         pessimism: bool
                 当在 后继节点 上发生 reconverge 时,  pessimism 会决定 深度取大还是取小。
                 pessimism = 1 时, 深度总是取小。pessimism = 0 时，深度总是取大。
 
         Returns
         -------
-        dict = {str endnode: int depth} 
-                节点 n 到所有边缘边缘节点的深度。
+        int or dict = {str node: int depth} 
+                ns 为单个节点时返回它的深度，否则返回 节点到深度 的字典。
 
+        Raises
+        ------
+        ValueError
+                网表中有组合环。
         """
-        def update_dict(dict1, dict2, pessimism):
-            new_dict = dict(dict1)
-
-            for k, v in dict2.items():
-                if k in new_dict:
-                    if pessimism:
-                        new_dict[k] = min(new_dict[k], v)  # 悲观更新：深度取小
-                    else:
-                        new_dict[k] = max(new_dict[k], v)  # 悲观更新：深度取大
-                else:
-                    new_dict[k] = v  # 添加新的键值对
-        
-        
-        def visit_node(n, depth, pessimism=1):
-            # 访问节点 n 的所有后继，认为 n 的深度为 n，后继的节点依次 +1，
-            # 返回自己和所有后继的深度（以字典的形式）
-            
-            # 先拓展搜索前沿
-            reachable = self.fanout(n, io_flag=1)
-            
-            # 初始化返回值
-            visited = {n:depth}
+        return self._select_depths(self._depths(True, pessimism), ns)
         
-            if not reachable:
-                # 已经到终点了，那就直接返回.
-                pass
-            else:
-                # 没到终点，就去下一层看看
-                for u in reachable:
-                    visited_temp = visit_node(u, depth+1)
-                    visited = update_dict(visited, visited_temp, pessimism)
-            
-            return visited
-
-        # 判断 图 是否是无环的。如果有环就报错。
-        if self.is_cyclic():
-            raise ValueError("Cannot compute depth of cyclic netlist")
-
-        # 起点的所在深度为 0
-        depth = 0
-
-        # 递归
-        visited = visit_node(n, depth, pessimism)
-
-        return {key:value for key, value in visited.items() if key in self.endpoints(n, io_flag=1)}
-        
-    def fanin_depth(self, n, pessimism=1):
+    def fanin_depth(self, ns=None, pessimism=1):
         """
-        计算 单个节点 的 前驱深度 列表（前驱中有多少 input port, 这个列表就会有多长）。
+        计算节点的 前驱深度：其前驱中的起点（没有前驱的节点，例如 primary input 和 flipflop 的输出）到节点所经过的边数。
         当在前驱节点上发生 reconverge 时,  pessimism 会决定 深度取大还是取小。
         pessimism = 1 时, 深度总是取小。pessimism = 0 时，深度总是取大。
-        【函数功能待测试】
+        所有节点的深度在一次 O(V+E) 的拓扑序 DP 中一起算出（用 levelize 缓存的分级索引，flipflop 的 fanout 边视为断开）。
 
         Parameters
         ----------
-        n : str 
-                要计算深度的节点。
+        ns : str, iterable of str or None
+                要计算深度的节点。为 None 时返回所有节点的深度。
         pessimism: bool
                 当在前驱节点上发生 reconverge 时,  pessimism 会决定 深度取大还是取小。
                 pessimism = 1 时, 深度总是取小。pessimism = 0 时，深度总是取大。
 
         Returns
         -------
-        dict = {str endnode: int depth} 
-                节点 n 到所有边缘边缘节点的深度。
+        int or dict = {str node: int depth} 
+                ns 为单个节点时返回它的深度，否则返回 节点到深度 的字典。
 
-        """
-        
-        def update_dict(dict1, dict2, pessimism):
-            new_dict = dict(dict1)
-
-            for k, v in dict2.items():
-                if k in new_dict:
-                    if pessimism:
-                        new_dict[k] = min(new_dict[k], v)  # 悲观更新：深度取小
-                    else:
-                        new_dict[k] = max(new_dict[k], v)  # 悲观更新：深度取大
-                else:
-                    new_dict[k] = v  # 添加新的键值对
-        
-        
-        def visit_node(n, depth, pessimism=1):
-            # 访问节点 n 的所有前驱，认为 n 的深度为 n，前驱的节点依次 +1，
-            # 返回自己和所有前驱的深度（以字典的形式）
-            
-            # 先拓展搜索前沿
-            reachable = self.fanin(n, io_flag=1)
-            
-            # 初始化返回值
-            visited = {n:depth}
-        
-            if not reachable:
-                # 已经到终点了，那就直接返回.
-                pass
-            else:
-                # 没到终点，就去下一层看看
-                for u in reachable:
-                    visited_temp = visit_node(u, depth+1)
-                    visited = update_dict(visited, visited_temp, pessimism)
-            
-            return visited
-
-        # 判断 图 是否是无环的。如果有环就报错。
-        if self.is_cyclic():
-            raise ValueError("Cannot compute depth of cyclic netlist")
+        Raises
+        ------
+        ValueError
+                网表中有组合环。
+        """
+        return self._select_depths(self._depths(False, pessimism), ns)
+
+    def _reconvergence(self, stems=None):
+        # 见 reconvergence. 逐个产生 (stem, [汇合节点])，stem 按拓扑顺序排列
+        topo = self._topo_dag()
+        order, pos, level_ptr = topo["order"], topo["pos"], topo["level_ptr"]
+        dst, src, _ = topo["fanout"]
+        out_src, out_dst, _ = topo["fanin"]
+        in_ptr, out_ptr, out_mult = topo["in_ptr"], topo["out_ptr"], topo["out_mult"]
+        n = len(order)
+
+        # 有两个及以上 fanout 引脚的节点才可能是 stem；d 个引脚用 ceil(log2(d)) 位编码
+        pins = np.bincount(out_src, weights=out_mult, minlength=n).astype(np.int64)
+        if stems is None:
+            cand = np.flatnonzero(pins >= 2)
+        else:
+            cand = np.array(sorted(pos[s] for s in ([stems] if isinstance(stems, str) else stems)), dtype=np.int64)
+            cand = cand[pins[cand] >= 2]
+        code_bits = np.ceil(np.log2(np.maximum(pins[cand], 2))).astype(np.int64)
+        bounds = np.searchsorted(np.cumsum(code_bits), np.arange(0, code_bits.sum() + RECONV_BITS, RECONV_BITS), "right")
+        bounds[0] = 0
+
+        mark = np.zeros(n, dtype=bool)
+        local = np.full(n, -1, dtype=np.int64)
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            if a == b:
+                continue
+            batch, width = cand[a:b], code_bits[a:b]
+            slot_start = np.cumsum(width) - width
+            nslots = int(width.sum())
+            words = (nslots + 63) // 64
+
+            # 每个 stem 的第 i 个 fanout 引脚是它的第 i 个分支，分支编号的二进制编码按位写进 ONE (该位为 1) 或 ZERO (该位为 0)
+            starts, ends = out_ptr[batch], out_ptr[batch + 1]
+            counts = ends - starts
+            e = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            pin_rows = np.repeat(out_dst[e], out_mult[e])
+            pin_stem = np.repeat(np.repeat(np.arange(len(batch)), counts), out_mult[e])
+            branch = np.arange(len(pin_rows)) - np.repeat(np.cumsum(pins[batch]) - pins[batch], pins[batch])
+
+            # 只在这批 stem 的 fanout 锥的并集上传播
+            frontier = np.unique(pin_rows)
+            mark[frontier] = True
+            while len(frontier):
+                starts, ends = out_ptr[frontier], out_ptr[frontier + 1]
+                counts = ends - starts
+                nxt = out_dst[np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+                frontier = np.unique(nxt[~mark[nxt]])
+                mark[frontier] = True
+            rows = np.flatnonzero(mark)
+            local[rows] = np.arange(len(rows))
+
+            bits = np.zeros((len(rows), 2 * words), dtype=np.uint64)
+            for l in range(int(width.max())):
+                sel = width[pin_stem] > l
+                slot = slot_start[pin_stem[sel]] + l
+                column = (slot >> 6) + np.where((branch[sel] >> l) & 1, 0, words)
+                np.bitwise_or.at(bits, (local[pin_rows[sel]], column), np.left_shift(np.uint64(1), (slot & 63).astype(np.uint64)))
+
+            # 子图中的边按终点排序，逐级做按位或
+            starts, ends = in_ptr[rows], in_ptr[rows + 1]
+            counts = ends - starts
+            e = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            head, tail = local[src[e]], np.repeat(np.arange(len(rows)), counts)
+            keep = head >= 0
+            head, tail = head[keep], tail[keep]
+            runs = np.flatnonzero(np.r_[True, tail[1:] != tail[:-1]]) if len(tail) else np.zeros(0, dtype=np.int64)
+            run_level = np.searchsorted(level_ptr, rows[tail[runs]], "right") - 1
+            level_runs = np.r_[np.flatnonzero(np.r_[True, run_level[1:] != run_level[:-1]]), len(runs)] if len(runs) else [0]
+            for r0, r1 in zip(level_runs[:-1], level_runs[1:]):
+                e0 = runs[r0]
+                e1 = runs[r1] if r1 < len(runs) else len(tail)
+                bits[tail[runs[r0:r1]]] |= np.bitwise_or.reduceat(bits[head[e0:e1]], runs[r0:r1] - e0, axis=0)
+
+            # 同一个 stem 的两个不同分支到达的节点上，必有该 stem 的某一位在 ONE 和 ZERO 中都为 1；
+            # 汇合节点是这样的节点中，没有任何前驱已经是这样的那些
+            both = bits[:, :words] & bits[:, words:]
+            before = np.zeros_like(both)
+            if len(runs):
+                before[tail[runs]] = np.bitwise_or.reduceat(both[head], runs, axis=0)
+            slot_stem = np.repeat(np.arange(len(batch)), width)
+            keys = []
+            for m in (both, before):
+                hit_rows, hit_bounds = self._unpack_bitsets(m, nslots)
+                keys.append(np.unique(np.repeat(slot_stem, np.diff(hit_bounds)) * len(rows) + hit_rows))
+            merged = np.setdiff1d(keys[0], keys[1], assume_unique=True)
+            merged_bounds = np.searchsorted(merged, np.arange(len(batch) + 1) * len(rows))
+            for j, stem in enumerate(batch):
+                merges = merged[merged_bounds[j]:merged_bounds[j + 1]] % len(rows)
+                if len(merges):
+                    yield order[stem], [order[i] for i in rows[merges].tolist()]
+
+            mark[rows] = False
+            local[rows] = -1
+
+    def reconvergence(self, stems=None):
+        """
+        找出所有 fanout 会重新汇合的 stem, 以及各自的汇合节点。
+        stem 是有两个及以上 fanout 引脚的节点（同一个 net 接到同一个 gate 的两个引脚也算两个分支）；
+        如果一个节点能从 stem 的两个不同分支到达，就说 stem 在这里汇合，汇合节点是这样的节点中最早的那些（它的前驱都还没有汇合）。
+
+        实现上给每个 stem 的 d 个分支编号，用 ceil(log2(d)) 位的编码和它的反码两组比特沿拓扑顺序传播：
+        某个节点上某一位的编码和反码同时为 1, 当且仅当两个不同的分支都到达了它。
+        stem 按 RECONV_BITS 分批，每批只在这批 stem 的 fanout 锥的并集上传播，总代价与所有 stem 的 fanout 锥的大小之和成正比，
+        而不是逐对分支求 transitive_fanout 的交集。
+        与 levelize 一样，flipflop 的 fanout 边视为断开，所以汇合只在两级 flipflop 之间的组合逻辑中查找。
 
-        # 起点的所在深度为 0
-        depth = 0
+        Parameters
+        ----------
+        stems : str, iterable of str or None
+                只检查这些节点。为 None 时检查所有节点。
 
-        # 递归
-        visited = visit_node(n, depth, pessimism)
+        Returns
+        -------
+        dict = {str stem: list of str}
+                每个发生汇合的 stem 和它的汇合节点，stem 按拓扑顺序排列。没有汇合的 stem 不在其中。
 
-        return {key:value for key, value in visited.items() if key in self.startpoints(n, io_flag=1)}
+        Raises
+        ------
+        ValueError
+                网表中有组合环。
+        """
+        return dict(self._reconvergence(stems))
 
     def reconvergent_fanout_nodes(self):
         """
-        Get nodes that have fanout that reconverges.
-        【这个函数尚不可用，接口未经过调整】
+        fanout 会重新汇合的所有 stem, 见 reconvergence.
 
         Returns
         -------
@@ -1197,18 +1954,11 @@ class Netlist:
                 A generator of nodes that have reconvergent fanout
 
         """
-        for node in self.nodes():
-            fo = self.fanout(node)
-            if len(fo) > 1:
-                for a, b in combinations(fo, 2):
-                    if self.transitive_fanout(a) & self.transitive_fanout(b):
-                        yield node
-                        break
+        return (stem for stem, _ in self._reconvergence())
 
     def has_reconvergent_fanout(self):
         """
-        Check if a netlist has any reconvergent fanout present.
-        【这个函数尚不可用，接口未经过调整】
+        网表中是否有 fanout 重新汇合的 stem. 按拓扑顺序检查，在第一批找到汇合的 stem 时就停下，见 reconvergence.
 
         Returns
         -------
@@ -1216,12 +1966,7 @@ class Netlist:
             Whether or not reconvergent fanout is present
 
         """
-        try:
-            next(self.reconvergent_fanout_nodes())
-            return True
-        except StopIteration:
-            return False
-
+        return next(self._reconvergence(), None) is not None
 
     def uid(self, n, blocked=None):
         """
@@ -1254,48 +1999,153 @@ class Netlist:
                 i *= 7
         return f"{n}_{i}"
 
-    def kcuts(self, n, k, computed=None):
-        """
-        Generate k-cuts.
-        【这个函数尚不可用，接口未经过调整】
+    @staticmethod
+    def _prune_cuts(cuts, limit):
+        # 去重，去掉被支配的 cut (是另一个 cut 的超集)，按 (大小, 叶子) 排序后最多保留 limit 个。
+        # 按大小从小到大检查，所以只需要看新的 cut 是否被已经保留的 cut 支配：
+        # 叶子少时直接查它的所有真子集是否已被保留，否则逐个比较（签名不覆盖时一定不是子集）
+        kept = []
+        seen = set()
+        for cut, sig in sorted(dict((c, s) for s, c in cuts).items(), key=lambda x: (len(x[0]), x[0])):
+            if (1 << len(cut)) <= len(kept):
+                dominated = any(sub in seen for r in range(1, len(cut)) for sub in combinations(cut, r))
+            else:
+                dominated = False
+                leaves = None
+                for ksig, kcut in kept:
+                    if ksig & ~sig == 0:
+                        if leaves is None:
+                            leaves = set(cut)
+                        if leaves.issuperset(kcut):
+                            dominated = True
+                            break
+            if not dominated:
+                kept.append((sig, cut))
+                seen.add(cut)
+                if limit is not None and len(kept) >= limit:
+                    break
+        return kept
+
+    def enumerate_cuts(self, k, limit=None, ns=None, stats=None):
+        """
+        按拓扑顺序一遍算出所有节点的 k-feasible cut. 节点 n 的一个 cut 是一组叶子节点，从起点到 n 的每条路径都经过其中至少一个，
+        且叶子数不超过 k. 叶子总是 wire 节点（信号），gate 和 flipflop 节点本身不作为叶子，因而也没有平凡 cut.
+        每个节点的 cut 由它的 fanin 节点的 cut 两两合并而来，合并时：
+        + 用 64 位签名（叶子编号对 64 取模的位图）先排除一定超过 k 个叶子的组合；
+        + 去掉被支配的 cut（叶子集合是另一个 cut 的超集）；
+        + limit 不为空时，每个节点只保留按 (叶子数, 叶子) 排序的前 limit 个 cut (priority cuts)，wire 节点另外总是带上只含自己的平凡 cut.
+        与 levelize 一样，flipflop 的 fanout 边视为断开，所以 flipflop 的输出 net 和 primary input 一样只有平凡 cut.
 
         Parameters
         ----------
-        n : str
-                Node to compute cuts for.
         k : int
-                Maximum cut width.
+                cut 的最大叶子数。
+        limit : int (可以为空)
+                每个节点最多保留的非平凡 cut 数。为空时不限制，此时结果是完整的 k-feasible cut 集合（去掉了被支配的 cut）。
+        ns : iterable of str (可以为空)
+                只需要这些节点的 cut. 此时只遍历它们的 transitive fanin, 并且一个节点的 cut 在它的 fanout 都合并完之后就会被释放。
+                为空时返回所有节点的 cut.
+        stats : dict (可以为空)
+                如果传入，会在其中填入 "nodes", "cuts", "seconds", "cuts_per_s", "peak_cuts" 和 "peak_bytes"
+                (同时存活的 cut 数量和它们占用内存的估计值，按 sys.getsizeof 计)。
 
         Returns
         -------
-        iter of str
-                k-cuts.
-
-        """
-        if computed is None:
-            computed = {}
+        dict = {str node: list of tuple of str}
+                每个节点的 cut 列表，wire 节点的平凡 cut 排在第一个，每个 cut 是按拓扑顺序排列的叶子节点组成的 tuple.
 
-        if n in computed:
-            return computed[n]
+        Raises
+        ------
+        ValueError
+                网表中有组合环。
+        """
+        t0 = time.perf_counter()
+        topo = self._topo_dag()
+        order, pos = topo["order"], topo["pos"]
+        dst, src, _ = topo["fanout"]
+        fanin_ptr = topo["in_ptr"].tolist()
+        src = src.tolist()
+        if ns is None:
+            wanted = None
+            visit = range(len(order))
+        else:
+            ns = [ns] if isinstance(ns, str) else list(ns)
+            wanted = set(pos[n] for n in ns)
+            _, bits = self.cone_bitsets([ns], fanin=True)
+            visit = np.flatnonzero(bits[:, 0]).tolist()
+        # 每个节点还有多少个 fanout 没有用到它的 cut, 降到 0 时就可以释放
+        refs = dict.fromkeys(visit, 0)
+        if wanted is not None:
+            for i in visit:
+                for p in src[fanin_ptr[i]:fanin_ptr[i + 1]]:
+                    refs[p] += 1
+
+        # gate 和 flipflop 与它的输出 net 在逻辑上是同一个信号，只让 net 等其他节点当叶子，避免同一个信号的 cut 重复出现
+        index = self._build_attr_index()["type"]
+        cells = set(pos[n] for t in ("gate", "flipflop") for n in index.get(t, ()))
+        cuts = dict()
+        live = peak = live_bytes = peak_bytes = total = 0
+        getsizeof = sys.getsizeof
+        for i in visit:
+            merged = [(0, ())]
+            fanins = src[fanin_ptr[i]:fanin_ptr[i + 1]]
+            for m, p in enumerate(fanins, 1):
+                nxt = []
+                for sa, a in merged:
+                    for sb, b in cuts[p]:
+                        sig = sa | sb
+                        if sig.bit_count() > k:
+                            continue
+                        c = tuple(sorted(set(a).union(b)))
+                        if len(c) <= k:
+                            nxt.append((sig, c))
+                # limit 只在合并完最后一个 fanin 之后才用，中间结果只去掉被支配的 cut
+                merged = self._prune_cuts(nxt, limit if m == len(fanins) else None)
+            node_cuts = merged if i in cells else [(1 << (i & 63), (i,))]
+            if fanins and i not in cells:
+                node_cuts += merged
+            cuts[i] = node_cuts
+            total += len(node_cuts)
+            live += len(node_cuts)
+            live_bytes += getsizeof(node_cuts) + sum(getsizeof(c) for _, c in node_cuts)
+            if wanted is not None:
+                for p in fanins:
+                    refs[p] -= 1
+                    if refs[p] == 0 and p not in wanted:
+                        freed = cuts.pop(p)
+                        live -= len(freed)
+                        live_bytes -= getsizeof(freed) + sum(getsizeof(c) for _, c in freed)
+            peak = max(peak, live)
+            peak_bytes = max(peak_bytes, live_bytes)
+
+        result = {order[i]: [tuple(order[j] for j in c) for _, c in node_cuts]
+                  for i, node_cuts in cuts.items() if wanted is None or i in wanted}
+        if stats is not None:
+            seconds = time.perf_counter() - t0
+            stats.update(nodes=len(visit), cuts=total, seconds=seconds, cuts_per_s=total / seconds if seconds else float("inf"),
+                         peak_cuts=peak, peak_bytes=peak_bytes)
+        return result
+
+    def kcuts(self, n, k, limit=None):
+        """
+        节点 n 的所有 k-feasible cut, 只遍历 n 的 transitive fanin. 见 enumerate_cuts.
 
-        # helper function
-        def merge_cut_sets(a_cuts, b_cuts):
-            merged_cuts = []
-            for a_cut, b_cut in product(a_cuts, b_cuts):
-                merged_cut = a_cut | b_cut
-                if len(merged_cut) <= k:
-                    merged_cuts.append(merged_cut)
-            return merged_cuts
+        Parameters
+        ----------
+        n : str
+                要计算 cut 的节点。
+        k : int
+                cut 的最大叶子数。
+        limit : int (可以为空)
+                每个节点最多保留的非平凡 cut 数 (priority cuts)。
 
-        if self.fanin(n):
-            fanin_cut_sets = [self.kcuts(f, k, computed) for f in self.fanin(n)]
-            cuts = reduce(merge_cut_sets, fanin_cut_sets) + [{n}]
-        else:
-            cuts = [{n}]
+        Returns
+        -------
+        list of tuple of str
+                n 的 cut 列表。n 是 wire 节点时，第一个是平凡 cut (n,).
 
-        # add cuts
-        computed[n] = cuts
-        return cuts
+        """
+        return self.enumerate_cuts(k, limit, ns=[n])[n]
 
     def remove_unloaded(self, inputs=False):
         """
@@ -0,0 +1,224 @@
+import time
+import shlex
+from pathlib import Path
+from collections import defaultdict
+from vparser import split_cell_type
+from graphize import guess_in_pattern, guess_out_pattern
+
+# TAU15 .ops 脚本中会修改网表的操作
+EDIT_OPS = ("repower_gate", "insert_gate", "insert_net", "connect_pin", "disconnect_pin", "remove_gate", "remove_net", "read_spef")
+# 只查询时序、不修改网表的操作
+REPORT_OPS = ("report_at", "report_rat", "report_slack", "report_slew", "report_worst_paths")
+
+def parse_ops(path):
+    """
+    逐行读取 .ops 脚本。
+
+    Returns
+    -------
+    generator of (int, str, list of str)
+            (行号, 操作名, 参数列表)。空行和 # 开头的注释行会被跳过。
+    """
+    with open(path, 'r') as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            op, *args = shlex.split(line) if '"' in line else line.split()
+            yield lineno, op, args
+
+class OpsRunner:
+    """
+    在 HeterDiG_GateWireNodePinEdge 网表上原地执行 TAU15 的 .ops 增量修改脚本，不重新建图。
+
+    网表的修改都通过 Netlist 的 add_node, connect, disconnect 和 remove_nodes 完成，并同步维护 gate 节点的 fanin/fanout 属性。
+    report_* 这类查询操作交给 reporter 处理；没有指定 reporter 时只计数、不输出。
+
+    Parameters
+    ----------
+    netlist : HeterDiG_GateWireNodePinEdge
+            已经 build 好的网表。
+    reporter : callable (可以为空)
+            reporter(op, args) 负责执行 report_* 操作，返回值会收集到 self.reports 中。
+    """
+
+    def __init__(self, netlist, reporter=None):
+        self.netlist = netlist
+        self.reporter = reporter
+        self.reports = []
+        self.latency = defaultdict(list)     # {操作名: [每次执行的用时 (s)]}
+        self.changed_nets = set()            # 被修改过连接关系或寄生参数的 wire 节点
+
+        # 顶层端口和它所在的 wire 节点。一开始端口就是同名的 wire 节点，disconnect_pin/connect_pin 可以把端口挪到别的 net 上。
+        g = netlist.graph
+        self.ports = {n: n for n, iotype in g.nodes(data="iotype") if iotype in ("input", "output")}
+        self.port_iotype = {n: g.nodes[n]["iotype"] for n in self.ports}
+
+        self.handlers = {
+            "repower_gate": self.repower_gate,
+            "insert_gate": self.insert_gate,
+            "insert_net": self.insert_net,
+            "connect_pin": self.connect_pin,
+            "disconnect_pin": self.disconnect_pin,
+            "remove_gate": self.remove_gate,
+            "remove_net": self.remove_net,
+            "read_spef": self.read_spef,
+        }
+        self.base_dir = Path(".")
+
+    def run(self, path):
+        """
+        执行整个 .ops 脚本。read_spef 中的相对路径按 .ops 文件所在的目录解析。
+
+        Returns
+        -------
+        dict
+                即 self.summary().
+        """
+        self.base_dir = Path(path).parent
+        perf_counter = time.perf_counter
+        for lineno, op, args in parse_ops(path):
+            t0 = perf_counter()
+            try:
+                self.execute(op, args)
+            except Exception as e:
+                raise RuntimeError(f"{path}:{lineno}: {op} {' '.join(args)}: {e}") from e
+            self.latency[op].append(perf_counter() - t0)
+        return self.summary()
+
+    def execute(self, op, args):
+        """执行单个操作。"""
+        handler = self.handlers.get(op)
+        if handler is not None:
+            return handler(*args)
+        if op.startswith("report_"):
+            if self.reporter is not None:
+                result = self.reporter(op, args)
+                self.reports.append((op, args, result))
+                return result
+            return None
+        raise ValueError(f"unknown op '{op}'")
+
+    def summary(self):
+        """
+        Returns
+        -------
+        dict
+                {"ops": 总操作数, "seconds": 总用时, "ops_per_s": 吞吐量,
+                 "per_op": {操作名: {"count", "total", "mean", "max"}}}，时间单位为秒。
+        """
+        per_op = dict()
+        for op, ts in self.latency.items():
+            per_op[op] = {"count": len(ts), "total": sum(ts), "mean": sum(ts) / len(ts), "max": max(ts)}
+        n = sum(v["count"] for v in per_op.values())
+        total = sum(v["total"] for v in per_op.values())
+        return {"ops": n, "seconds": total, "ops_per_s": n / total if total else float("inf"), "per_op": per_op}
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"共 {s['ops']} 个操作，用时 {s['seconds']*1000:.2f} ms, {s['ops_per_s']:.0f} ops/s")
+        for op, v in sorted(s["per_op"].items()):
+            print(f"  {op:<20s} {v['count']:>6d} 次  平均 {v['mean']*1e6:8.2f} us  最长 {v['max']*1e6:8.2f} us")
+
+    # 下面是各个操作的实现
+    def _pin_direction(self, gate, pin):
+        # 已有连接的引脚沿用原来的方向；否则查 Liberty 库；再不行就按引脚名猜
+        attr = self.netlist.graph.nodes[gate]
+        if pin in attr.get("fanout", ()):
+            return "out"
+        if pin in attr.get("fanin", ()):
+            return "in"
+        if self.netlist.liberty is not None:
+            try:
+                return "out" if self.netlist.lib_cell(gate).direction(pin) == "output" else "in"
+            except KeyError:
+                pass
+        if guess_out_pattern.match(pin) and not guess_in_pattern.fullmatch(pin):
+            return "out"
+        return "in"
+
+    @staticmethod
+    def _cell_attr(cell):
+        entry = split_cell_type(cell)
+        function, spec = entry[1] if entry else (cell, "")
+        return {
+            "type": "flipflop" if ("FF" in cell) or ("ms" in cell) else "gate",
+            "function": function,
+            "spec": spec,
+            "subtype": cell,
+        }
+
+    def repower_gate(self, gate, cell):
+        self.netlist.set_node_attr(gate, **self._cell_attr(cell))
+
+    def insert_gate(self, gate, cell):
+        self.netlist.add_node(gate, fanin_nodes={}, fanout_nodes={}, fanin={}, fanout={}, **self._cell_attr(cell))
+
+    def insert_net(self, net):
+        self.netlist.add_node(net, type="wire")
+        self.changed_nets.add(net)
+
+    def connect_pin(self, pin, net):
+        gate, _, pin_name = pin.partition(":")
+        if not pin_name:
+            # 顶层端口
+            self.netlist.set_node_attr(net, iotype=self.port_iotype[pin])
+            self.ports[pin] = net
+        elif self._pin_direction(gate, pin_name) == "out":
+            self.netlist.connect(gate, net, type="fanout", subtype=pin_name)
+            self.netlist.graph.nodes[gate]["fanout"][pin_name] = net
+        else:
+            self.netlist.connect(net, gate, type="fanin", subtype=pin_name)
+            self.netlist.graph.nodes[gate]["fanin"][pin_name] = net
+        self.changed_nets.add(net)
+
+    def disconnect_pin(self, pin):
+        gate, _, pin_name = pin.partition(":")
+        if not pin_name:
+            net = self.ports.pop(pin)
+            self.netlist.set_node_attr(net, iotype=None)
+        else:
+            attr = self.netlist.graph.nodes[gate]
+            if pin_name in attr["fanout"]:
+                net = attr["fanout"].pop(pin_name)
+                self.netlist.disconnect(gate, net, subtype=pin_name)
+            else:
+                net = attr["fanin"].pop(pin_name)
+                self.netlist.disconnect(net, gate, subtype=pin_name)
+        self.changed_nets.add(net)
+
+    def remove_gate(self, gate):
+        self.netlist.remove_nodes(gate)
+
+    def remove_net(self, net):
+        self.netlist.remove_nodes(net)
+        self.changed_nets.discard(net)
+
+    def read_spef(self, path):
+        changed = self.netlist.apply_spef_delta(self.base_dir / path)
+        self.changed_nets.update(changed)
+        return changed
+
+def run_ops(netlist, path, reporter=None):
+    """在 netlist 上执行 path 处的 .ops 脚本，返回 OpsRunner (可以从中取得 summary 和 reports)。"""
+    runner = OpsRunner(netlist, reporter)
+    runner.run(path)
+    return runner
+
+if __name__ == "__main__":
+    import sys
+    from graphize import HeterDiG_GateWireNodePinEdge
+
+    # python opsrunner.py [benchmarks/TAU15/c17]
+    design_dir = Path(sys.argv[1] if len(sys.argv) > 1 else Path(__file__).parent / "benchmarks/TAU15/c17")
+    name = design_dir.name
+    netlist = HeterDiG_GateWireNodePinEdge(name)
+    netlist.build(design_dir / f"{name}.v", vlib=[design_dir / f"{name}_Early.lib"])
+    netlist.read_liberty(design_dir / f"{name}_Early.lib")
+    netlist.read_spef(design_dir / f"{name}.spef")
+
+    t0 = time.perf_counter()
+    runner = run_ops(netlist, design_dir / f"{name}.ops")
+    t1 = time.perf_counter()
+    runner.print_summary()
+    print(f"{name}.ops 总用时 {(t1-t0)*1000:.2f} ms, 修改后共 {len(netlist)} 个节点")
@@ -0,0 +1,377 @@
+import re
+import numpy as np
+from itertools import chain
+from pathlib import Path
+
+# 每次建立索引时读入的字节数
+CHUNK_SIZE = 1 << 22
+
+# 统一换算到 ps, fF, kOhm（与 TAU 的 Liberty 库一致，且 kOhm * fF = ps）
+T_UNITS = {"FS": 1e-3, "PS": 1.0, "NS": 1e3, "US": 1e6}
+C_UNITS = {"FF": 1.0, "PF": 1e3, "NF": 1e6, "UF": 1e9}
+R_UNITS = {"OHM": 1e-3, "KOHM": 1.0, "MOHM": 1e3}
+
+_D_NET = re.compile(rb"^\*D_NET\s+(\S+)\s+(\S+)", re.M)
+_HEADER = re.compile(rb"^\*(T_UNIT|C_UNIT|R_UNIT|DESIGN|DELIMITER|DIVIDER)\s+(.*?)\s*$", re.M)
+# 文件头中各段的关键字行 (*NAME_MAP, *PORTS, *POWER_NETS 等)。*NAME_MAP 的条目是 *数字，不会被当成关键字
+_SECTION = re.compile(rb"^\*([A-Z_]+)\b", re.M)
+_MAP_ENTRY = re.compile(rb"^(\*\d+)\s+(\S+)", re.M)
+
+class SpefNet:
+    """
+    SPEF 中一个 net (*D_NET) 的寄生参数。电容以 fF 为单位，电阻以 kOhm 为单位。
+
+    属性
+    ---------
+    + name : 线网名
+    + total_cap : *D_NET 行上给出的总电容
+    + conns : list of (str pin, str direction, str kind)
+            *CONN 段中的连接，例如 ("inst_125:ZN", "O", "I")。kind 为 "P" 表示顶层端口，"I" 表示 cell 引脚。
+    + nodes : list of str, RC 网络中的所有节点（引脚和内部节点）
+    + node_index : {str node: int 下标}
+    + cap : numpy.ndarray, 每个节点的对地电容。耦合电容也按对地电容处理，加到两端各自的节点上。
+    + res_from, res_to : numpy.ndarray of int, 每个电阻两端的节点下标
+    + res : numpy.ndarray, 每个电阻的阻值
+    """
+
+    __slots__ = ("name", "total_cap", "conns", "nodes", "node_index", "cap", "res_from", "res_to", "res")
+
+    def __init__(self, name, total_cap=0.0):
+        self.name = name
+        self.total_cap = total_cap
+        self.conns = []
+        self.nodes = []
+        self.node_index = dict()
+        self.cap = np.zeros(0)
+        self.res_from = np.zeros(0, dtype=np.int32)
+        self.res_to = np.zeros(0, dtype=np.int32)
+        self.res = np.zeros(0)
+
+    def __repr__(self):
+        return f"SpefNet({self.name}, {len(self.nodes)} nodes, {len(self.res)} res, total_cap={self.total_cap})"
+
+    @property
+    def driver(self):
+        """驱动这个 net 的引脚（方向为 O 的 cell 引脚或方向为 I 的顶层输入端口），没有则为 None."""
+        for pin, direction, kind in self.conns:
+            if (kind == "I" and direction == "O") or (kind == "P" and direction == "I"):
+                return pin
+        return None
+
+    @property
+    def sinks(self):
+        """这个 net 驱动的所有引脚（cell 输入引脚和顶层输出端口）。"""
+        return [pin for pin, direction, kind in self.conns if (kind == "I" and direction != "O") or (kind == "P" and direction != "I")]
+
+    def elmore(self, root, extra_cap=None):
+        """
+        以 root 为驱动点，在 RC 树上计算每个节点的 Elmore 延时（一阶矩）和 impulse^2 = 2 * beta - delay^2（beta 为二阶矩）。
+        网络中有环时只沿从 root 出发的 BFS 生成树计算，多出来的电阻忽略。
+
+        Parameters
+        ----------
+        root : str
+                驱动节点的名字，例如 "inst_0:ZN" 或顶层输入端口名。
+        extra_cap : {str 节点: float} (可以为空)
+                额外挂在节点上的电容，例如负载引脚的引脚电容和输出端口的 load. 不在网络中的节点会被忽略。
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray, float)
+                按 self.nodes 顺序的 delay 和 impulse^2, 以及整个网络（含 extra_cap）的总电容。
+        """
+        n = len(self.nodes)
+        cap = self.cap.copy()
+        for name, c in (extra_cap or dict()).items():
+            i = self.node_index.get(name)
+            if i is not None:
+                cap[i] += c
+        delay = np.zeros(n)
+        beta = np.zeros(n)
+        r = self.node_index.get(root)
+        if r is None or not len(self.res):
+            return delay, beta, float(cap.sum())
+
+        adj = [[] for _ in range(n)]
+        for a, b, v in zip(self.res_from.tolist(), self.res_to.tolist(), self.res.tolist()):
+            adj[a].append((b, v))
+            adj[b].append((a, v))
+        parent = np.full(n, -1)
+        res = np.zeros(n)
+        order = [r]
+        seen = {r}
+        for u in order:
+            for v, w in adj[u]:
+                if v not in seen:
+                    seen.add(v)
+                    parent[v], res[v] = u, w
+                    order.append(v)
+
+        # 从叶子往根累加下游电容，再从根往叶子累加延时；二阶矩同理
+        down = cap.copy()
+        for u in reversed(order[1:]):
+            down[parent[u]] += down[u]
+        for u in order[1:]:
+            delay[u] = delay[parent[u]] + res[u] * down[u]
+        ldelay = cap * delay
+        for u in reversed(order[1:]):
+            ldelay[parent[u]] += ldelay[u]
+        for u in order[1:]:
+            beta[u] = beta[parent[u]] + res[u] * ldelay[u]
+        return delay, 2 * beta - delay * delay, float(cap.sum())
+
+    def _node(self, name):
+        i = self.node_index.get(name)
+        if i is None:
+            i = self.node_index[name] = len(self.nodes)
+            self.nodes.append(name)
+        return i
+
+    @classmethod
+    def from_lines(cls, lines, resolve=lambda x: x, c_scale=1.0, r_scale=1.0):
+        """
+        从一个 *D_NET ... *END 段解析出 SpefNet.
+
+        Parameters
+        ----------
+        lines : iterable of str
+                从 *D_NET 行开始, 到 *END 行（含）为止的各行。
+        resolve : callable
+                把 *NAME_MAP 中的 *123 这样的名字还原成真实名字。
+        c_scale, r_scale : float
+                换算到 fF 和 kOhm 的比例。
+        """
+        lines = iter(lines)
+        head = next(lines).split()
+        net = cls(resolve(head[1]), float(head[2]) * c_scale if len(head) > 2 else 0.0)
+        caps = dict()
+        res = []
+        section = None
+        for line in lines:
+            tokens = line.split()
+            if not tokens:
+                continue
+            key = tokens[0]
+            if key == "*END":
+                break
+            elif key in ("*CONN", "*CAP", "*RES"):
+                section = key
+            elif key.startswith("*"):
+                if section == "*CONN" and key in ("*P", "*I") and len(tokens) >= 3:
+                    pin = resolve(tokens[1])
+                    net.conns.append((pin, tokens[2], key[1]))
+                    net._node(pin)
+                else:
+                    section = None    # *INDUC 等不关心的段
+            elif section == "*CAP":
+                if len(tokens) == 3:
+                    i = net._node(resolve(tokens[1]))
+                    caps[i] = caps.get(i, 0.0) + float(tokens[2]) * c_scale
+                elif len(tokens) >= 4:
+                    # 耦合电容：只有本 net 上的那一端会出现在本 net 的节点里
+                    for t in tokens[1:3]:
+                        name = resolve(t)
+                        if name.split(":")[0] == net.name or name in net.node_index:
+                            i = net._node(name)
+                            caps[i] = caps.get(i, 0.0) + float(tokens[3]) * c_scale
+            elif section == "*RES" and len(tokens) >= 4:
+                res.append((net._node(resolve(tokens[1])), net._node(resolve(tokens[2])), float(tokens[3]) * r_scale))
+
+        net.cap = np.zeros(len(net.nodes))
+        for i, c in caps.items():
+            net.cap[i] = c
+        if res:
+            arr = np.array(res)
+            net.res_from = arr[:, 0].astype(np.int32)
+            net.res_to = arr[:, 1].astype(np.int32)
+            net.res = arr[:, 2]
+        return net
+
+class Spef:
+    """
+    按需加载的 SPEF 寄生参数文件。
+
+    构造时只扫描一遍文件，记下每个 *D_NET 段在文件中的字节偏移和总电容；
+    某个 net 的 *CONN/*CAP/*RES 段只有在第一次被访问 (spef[name] 或 spef.net(name)) 时才会被解析，并缓存起来。
+    因此内存只与实际访问过的 net 的数量成正比，而与文件大小无关。
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+            SPEF 文件路径。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.design = None
+        self.t_scale = self.c_scale = self.r_scale = 1.0
+        self.name_map = dict()         # {"*123": "net_5"}
+        self.offsets = dict()          # {net: *D_NET 行的字节偏移}
+        self.total_caps = dict()       # {net: 总电容}
+        self.loaded = dict()           # {net: SpefNet}, 已解析过的 net
+        self.patched = dict()          # {net: SpefNet}, 由 apply_delta 替换过的 net, 优先于文件中的内容
+        self._file = None
+        self._index()
+
+    def __repr__(self):
+        return f"Spef({self.path.name}, {len(self.offsets)} nets, {len(self.loaded)} loaded)"
+
+    def __contains__(self, name):
+        return name in self.offsets or name in self.patched
+
+    def __len__(self):
+        return len(self.offsets) + sum(1 for n in self.patched if n not in self.offsets)
+
+    def __iter__(self):
+        yield from self.offsets
+        yield from (n for n in self.patched if n not in self.offsets)
+
+    def __getitem__(self, name):
+        return self.net(name)
+
+    @property
+    def nets(self):
+        """所有 net 的名字（先是文件中的 net, 按文件中的先后顺序；然后是 apply_delta 新增的 net）。"""
+        return list(self)
+
+    def _resolve(self, token):
+        # 还原 *NAME_MAP 中的名字，"*12:A" 这样的 引脚名 也要还原前半部分
+        if token.startswith("*") and self.name_map:
+            head, sep, tail = token.partition(":")
+            return self.name_map.get(head, head) + sep + tail
+        return token
+
+    def _index(self):
+        # 逐块扫描整个文件，只记录文件头、*NAME_MAP 和每个 *D_NET 行的位置
+        header_done = False
+        in_map = False      # 上一块结束时是否还在 *NAME_MAP 段里
+        with open(self.path, 'rb') as f:
+            base = 0
+            tail = b""
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                data = tail + chunk
+                cut = data.rfind(b"\n") + 1 if chunk else len(data)
+                data, tail = data[:cut], data[cut:]
+                if not header_done:
+                    first = _D_NET.search(data)
+                    head = data if first is None else data[:first.start()]
+                    in_map = self._read_header(head, in_map)
+                    header_done = first is not None
+                # 第一个 *D_NET 之前的文件头 (包括完整的 *NAME_MAP) 已经读完，这时才还原 net 名
+                for m in _D_NET.finditer(data):
+                    name = self._resolve(m.group(1).decode())
+                    self.offsets[name] = base + m.start()
+                    self.total_caps[name] = float(m.group(2)) * self.c_scale
+                base += len(data)
+                if not chunk:
+                    break
+
+    def _read_header(self, data, in_map=False):
+        # 读文件头中的单位、设计名和 *NAME_MAP 的条目。*NAME_MAP 可能跨块，in_map 表示这一块开头是否还在 *NAME_MAP 段里，
+        # 返回这一块结尾是否还在。*NAME_MAP 段到下一个关键字行 (*PORTS 等) 为止
+        for m in _HEADER.finditer(data):
+            key, value = m.group(1).decode(), m.group(2).decode().strip('"')
+            if key == "DESIGN":
+                self.design = value
+            elif key in ("T_UNIT", "C_UNIT", "R_UNIT"):
+                scale, unit = value.split()
+                table = {"T_UNIT": T_UNITS, "C_UNIT": C_UNITS, "R_UNIT": R_UNITS}[key]
+                setattr(self, key[0].lower() + "_scale", float(scale) * table.get(unit.upper(), 1.0))
+        start = 0 if in_map else None
+        for m in chain(_SECTION.finditer(data), [None]):
+            end = len(data) if m is None else m.start()
+            if start is not None:
+                for e in _MAP_ENTRY.finditer(data, start, end):
+                    self.name_map[e.group(1).decode()] = e.group(2).decode()
+            if m is not None:
+                start = m.end() if m.group(1) == b"NAME_MAP" else None
+        return start is not None
+
+    def net(self, name):
+        """
+        返回名为 name 的 net 的寄生参数 (SpefNet)。第一次访问时才会从文件中解析。
+
+        Raises
+        ------
+        KeyError
+                文件中没有这个 net.
+        """
+        net = self.patched.get(name) or self.loaded.get(name)
+        if net is None:
+            offset = self.offsets[name]
+            if self._file is None:
+                self._file = open(self.path, 'rb')
+            self._file.seek(offset)
+
+            def lines():
+                for line in self._file:
+                    line = line.decode()
+                    yield line
+                    if line.startswith("*END"):
+                        return
+
+            net = SpefNet.from_lines(lines(), self._resolve, self.c_scale, self.r_scale)
+            self.loaded[name] = net
+        return net
+
+    def unload(self, name=None):
+        """丢弃已解析的 net（name 为 None 时丢弃全部），下次访问时会重新从文件中解析。apply_delta 替换过的 net 不受影响。"""
+        if name is None:
+            self.loaded.clear()
+        else:
+            self.loaded.pop(name, None)
+
+    def apply_delta(self, path):
+        """
+        读入一个增量 SPEF 文件（例如 TAU15 的 change_1.spef），用其中的 net 替换当前的寄生参数，其余的 net 保持不变。
+        增量文件通常只有几个 net, 所以会被完整解析；文件中原来没有的 net (例如新插入的 net) 也会被加进来。
+
+        Returns
+        -------
+        list of str
+                被替换或新增的 net 的名字。
+        """
+        with Spef(path) as delta:
+            changed = delta.nets
+            for name in changed:
+                self.patched[name] = delta.net(name)
+                self.loaded.pop(name, None)
+        return changed
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+def read_spef(path):
+    """建立 SPEF 文件的索引，返回按需加载的 Spef 对象。"""
+    return Spef(path)
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    # python spefparser.py [xxx.spef] 会测一次建索引的耗时，并解析其中的第一个 net
+    if len(sys.argv) > 1:
+        file_name = sys.argv[1]
+    else:
+        file_name = Path(__file__).parent / "benchmarks/TAU19/s1196/design/s1196.spef"
+
+    t0 = time.perf_counter()
+    spef = read_spef(file_name)
+    t1 = time.perf_counter()
+    net = spef[spef.nets[0]]
+    t2 = time.perf_counter()
+    print(spef)
+    print(net, net.conns)
+    print(f"建立索引 {t1-t0:.3f} s, 解析单个 net {(t2-t1)*1000:.3f} ms")
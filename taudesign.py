@@ -0,0 +1,296 @@
+import time
+import warnings
+import numpy as np
+from pathlib import Path
+from itertools import chain
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from graphize import HeterDiG_GateWireNodePinEdge
+from libparser import read_liberty
+from spefparser import read_spef
+from timer import Timer, parse_timing, EARLY, LATE, RISE, FALL, DEFAULT_CORNER
+
+# 清单文件里按扩展名区分的文件种类
+MANIFEST_KINDS = {".v": "verilog", ".spef": "spef", ".lib": "libs", ".timing": "timing", ".sdc": "timing"}
+
+def _corner_names(libs):
+    # 去掉各个库文件名共同的、以下划线分隔的前缀，至少保留最后一段；这样得到的名字有重复时就用完整的文件名
+    parts = [lib.stem.split("_") for lib in libs]
+    n = 0
+    while n < min(len(p) for p in parts) - 1 and all(p[n] == parts[0][n] for p in parts):
+        n += 1
+    names = ["_".join(p[n:]) for p in parts]
+    return names if len(set(names)) == len(names) else [lib.stem for lib in libs]
+
+def parse_manifest(path):
+    """
+    读取 TAU15 的 .tau2015 或 TAU19 的 .tau2019 清单文件。清单里只是一串文件名，按扩展名区分，相对路径按清单所在的目录解析。
+
+    .tau2015 的两个 .lib 依次是 early 和 late 库，合成一个工艺角；.tau2019 的每个 .lib 自成一个工艺角，early 和 late 用同一个库，
+    工艺角名取文件名去掉所有库共同的、以下划线分隔的前缀之后的部分 (NangateOpenCellLibrary_typical.lib, NangateOpenCellLibrary_low_temp.lib
+    -> typical, low_temp)，至少保留最后一段，所以只有一个库时是最后一个下划线之后的部分。
+    清单里没有断言文件时，依次在清单和 verilog 文件所在的目录下找同名的 .timing 和 .sdc.
+
+    Returns
+    -------
+    dict
+            {"format": "tau2015" 或 "tau2019", "verilog": Path, "spef": Path, "libs": [Path], "corners": {工艺角: (early 库路径, late 库路径)},
+             "timing": Path 或 None}
+    """
+    path = Path(path)
+    manifest = {"format": path.suffix.lstrip("."), "verilog": None, "spef": None, "libs": [], "timing": None}
+    with open(path, 'r') as f:
+        for token in f.read().split():
+            kind = MANIFEST_KINDS.get(Path(token).suffix)
+            if kind is None:
+                raise ValueError(f"{path}: unknown file {token} in manifest.")
+            if kind == "libs":
+                manifest["libs"].append(path.parent / token)
+            else:
+                manifest[kind] = path.parent / token
+    if manifest["verilog"] is None or not manifest["libs"]:
+        raise ValueError(f"{path}: manifest needs a verilog file and at least one liberty file.")
+
+    if manifest["format"] == "tau2015":
+        if len(manifest["libs"]) != 2:
+            raise ValueError(f"{path}: a .tau2015 manifest lists an early and a late liberty file, got {len(manifest['libs'])}.")
+        manifest["corners"] = {DEFAULT_CORNER: tuple(manifest["libs"])}
+    else:
+        manifest["corners"] = {name: (lib, lib) for name, lib in zip(_corner_names(manifest["libs"]), manifest["libs"])}
+
+    if manifest["timing"] is None:
+        for d in dict.fromkeys((path.parent, manifest["verilog"].parent)):
+            found = [d / f"{path.stem}{suffix}" for suffix in (".timing", ".sdc") if (d / f"{path.stem}{suffix}").is_file()]
+            if found:
+                manifest["timing"] = found[0]
+                break
+    return manifest
+
+def parse_sdc(path):
+    """
+    读取 SDC 约束中 TAU19 基准用到的子集 (create_clock, set_input_delay, set_input_transition, set_output_delay, set_load)，
+    换算成 parse_timing 的格式。没给 -min/-max 或 -rise/-fall 时两边都设，没设到的列为 0.
+    输出延时换算成 required time: late 为 周期 - 延时，early 为 -延时。
+
+    Returns
+    -------
+    dict
+            同 timer.parse_timing.
+    """
+    result = {"clock": dict(), "at": dict(), "slew": dict(), "rat": dict(), "load": dict()}
+    kinds = {"set_input_delay": "at", "set_input_transition": "slew", "set_output_delay": "output_delay"}
+    output_delay = dict()
+    with open(path, 'r') as f:
+        for line in f:
+            tokens = line.replace("[", " [ ").replace("]", " ] ").replace("{", " ").replace("}", " ").split()
+            if not tokens or tokens[0].startswith("#"):
+                continue
+            # 选项、[get_ports ...] 和其余的位置参数
+            opts, args, i = dict(), [], 1
+            while i < len(tokens):
+                t = tokens[i]
+                if t in ("-period", "-name", "-clock"):
+                    opts[t] = tokens[i + 1]
+                    i += 2
+                elif t.startswith("-") and not t[1:2].isdigit():
+                    opts[t] = True
+                    i += 1
+                elif t == "[":
+                    j = tokens.index("]", i)
+                    opts[tokens[i + 1]] = tokens[i + 2:j]
+                    i = j + 1
+                else:
+                    args.append(t)
+                    i += 1
+            ports = opts.get("get_ports", [])
+
+            if tokens[0] == "create_clock":
+                for port in ports:
+                    result["clock"][port] = (float(opts["-period"]),)
+            elif tokens[0] == "set_load":
+                for port in ports:
+                    result["load"][port] = float(args[0])
+            elif tokens[0] in kinds:
+                splits = [s for s, opt in ((EARLY, "-min"), (LATE, "-max")) if opt in opts] or [EARLY, LATE]
+                transitions = [t for t, opt in ((RISE, "-rise"), (FALL, "-fall")) if opt in opts] or [RISE, FALL]
+                table = output_delay if tokens[0] == "set_output_delay" else result[kinds[tokens[0]]]
+                for port in ports:
+                    values = table.setdefault(port, [0.0] * 4)
+                    for s in splits:
+                        for t in transitions:
+                            values[2 * s + t] = float(args[0])
+
+    period = next(iter(result["clock"].values()), (0.0,))[0]
+    for port, d in output_delay.items():
+        result["rat"][port] = [0.0 - d[0], 0.0 - d[1], period - d[2], period - d[3]]
+    return result
+
+def bind_timing(netlist, timing, ports=None):
+    """
+    把断言挂到端口所在的 wire 节点上：输入端口的 "at" 和 "slew"、输出端口的 "rat" 都是 E/R, E/F, L/R, L/F 四列的 NumPy 数组，
+    输出端口的 "load" 是负载电容，时钟端口的 "clock" 是周期。
+
+    Parameters
+    ----------
+    netlist : Netlist
+    timing : dict
+            parse_timing 或 parse_sdc 的结果。
+    ports : {str 端口: str wire 节点} (可以为空)
+            默认是同名的 wire 节点。
+
+    Returns
+    -------
+    list of str
+            网表中找不到的端口，它们的断言被跳过了。
+    """
+    missing = []
+    for kind in ("at", "slew", "rat", "load", "clock"):
+        for port, values in timing.get(kind, dict()).items():
+            n = ports.get(port) if ports is not None else port if port in netlist.graph else None
+            if n is None:
+                missing.append(port)
+            elif kind == "load":
+                netlist.set_node_attr(n, load=float(values))
+            elif kind == "clock":
+                netlist.set_node_attr(n, clock=float(values[0]))
+            else:
+                netlist.set_node_attr(n, **{kind: np.array(values, dtype=float)})
+    if missing:
+        warnings.warn(f"{len(missing)} asserted ports are not in netlist {netlist.name}: {sorted(set(missing))[:5]}")
+    return sorted(set(missing))
+
+def _timed(func, *args, **kwargs):
+    # 在线程或子进程里执行，返回 (结果, 用时)
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+def _check_cells(lib, path):
+    # 没有 cell 的库建不出引脚方向表，也算不出时序，直接报出是哪个文件
+    if len(lib.cell_index) == 0:
+        raise ValueError(f"{path}: Liberty library {lib.name!r} has no cells")
+    return lib
+
+class TauDesign:
+    """
+    read_tau 读入的一个设计。
+
+    Attributes
+    ----------
+    manifest : dict
+            parse_manifest 的结果。
+    netlist : HeterDiG_GateWireNodePinEdge
+            建好的网表，netlist.spef 为读入的 SPEF, netlist.liberty 为第一个工艺角的 late 库。
+            端口所在的 wire 节点上挂着断言 (见 bind_timing)。
+    corners : {str 工艺角: (early Liberty, late Liberty)}
+    timing : dict
+            parse_timing 格式的断言，没有断言文件时为空。
+    stats : dict
+            {"seconds": {文件: 读入用时}, "wall": 并发读入的总用时, "bind": 挂断言的用时}
+    """
+
+    def __init__(self, manifest, netlist, corners, timing, stats):
+        self.manifest = manifest
+        self.netlist = netlist
+        self.corners = corners
+        self.timing = timing
+        self.stats = stats
+
+    def __repr__(self):
+        return f"TauDesign({self.netlist.name}, corners={list(self.corners)}, wall={self.stats['wall']:.3f}s)"
+
+    def timer(self, **kwargs):
+        """按清单里的工艺角建一个 Timer 并应用断言。kwargs 原样传给 Timer, 例如 ports."""
+        timer = Timer(self.netlist, self.corners, **kwargs)
+        timer.apply_timing(self.timing)
+        return timer
+
+def read_tau(path, timing=None, backend="networkx", cache=None, workers=None, processes=False):
+    """
+    一次读入 .tau2015/.tau2019 清单描述的整个设计：建 HeterDiG_GateWireNodePinEdge 网表，读 Liberty 库、SPEF 和断言，
+    再把断言挂到端口节点上。
+
+    每个 Liberty 库、SPEF 索引和断言文件互不依赖，它们被同时提交到一个线程池里，总用时取决于最慢的那个文件而不是所有文件之和。
+    verilog 建图要用第一个库的引脚方向，它在线程里等这个库解析完，直接用它的方向表 (Liberty.pin_directions)，每个库只解析一次。
+    库文件里没有 cell (比如只是一个占位文件) 时报 ValueError, 错误信息里带着文件名。
+    读缓存、算文件哈希和建 SPEF 索引大部分时间不占 GIL; 没有缓存、要从文本解析 Liberty 时可以用 processes=True 把库放到子进程里解析。
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+            清单文件。
+    timing : str or pathlib.Path (可以为空)
+            .timing 或 .sdc 断言文件，默认用清单里的或者找到的同名文件 (见 parse_manifest)。
+    backend : str
+            网表的图后端，"networkx" 或 "csr".
+    cache : bool or buildcache.BuildCache (可以为空)
+            原样传给 build, 启用建图缓存。
+    workers : int (可以为空)
+            线程池 (和进程池) 的大小，默认每个文件一个。
+    processes : bool
+            是否在子进程中解析 Liberty 库。
+
+    Returns
+    -------
+    TauDesign
+    """
+    t0 = time.perf_counter()
+    manifest = parse_manifest(path)
+    timing_path = Path(timing) if timing is not None else manifest["timing"]
+    lib_paths = list(dict.fromkeys(manifest["libs"]))
+    workers = workers or len(lib_paths) + 3
+
+    def build(first):
+        # 等第一个库解析完再建图，用时不算等待的时间
+        directions = _check_cells(first.result()[0], lib_paths[0]).pin_directions()
+        netlist = HeterDiG_GateWireNodePinEdge(manifest["verilog"].stem, backend=backend)
+        seconds = _timed(netlist.build, manifest["verilog"], vlib=directions, cache=cache)[1]
+        return netlist, seconds
+
+    with ThreadPoolExecutor(workers) as threads, (ProcessPoolExecutor(workers) if processes else nullcontext(threads)) as pool:
+        futures = {f"lib:{p.name}": pool.submit(_timed, read_liberty, p) for p in lib_paths}
+        futures["verilog"] = threads.submit(build, futures[f"lib:{lib_paths[0].name}"])
+        if manifest["spef"] is not None:
+            futures["spef"] = threads.submit(_timed, read_spef, manifest["spef"])
+        if timing_path is not None:
+            futures["timing"] = threads.submit(_timed, parse_sdc if timing_path.suffix == ".sdc" else parse_timing, timing_path)
+        results = {key: f.result() for key, f in futures.items()}
+
+    stats = {"seconds": {key: seconds for key, (_, seconds) in results.items()}, "wall": time.perf_counter() - t0}
+    libs = {p: _check_cells(results[f"lib:{p.name}"][0], p) for p in lib_paths}
+    corners = {name: (libs[early], libs[late]) for name, (early, late) in manifest["corners"].items()}
+    netlist = results["verilog"][0]
+    netlist.liberty = next(iter(corners.values()))[1]
+    netlist.spef = results["spef"][0] if "spef" in results else None
+    assertions = results["timing"][0] if "timing" in results else dict()
+
+    t1 = time.perf_counter()
+    bind_timing(netlist, assertions)
+    stats["bind"] = time.perf_counter() - t1
+    return TauDesign(manifest, netlist, corners, assertions, stats)
+
+if __name__ == "__main__":
+    import gc
+    import sys
+
+    # python taudesign.py [xxx.tau2015] [--processes]: 先逐个文件顺序读一遍，再并发读一遍，比较总用时和最慢的单个文件，最后跑一次时序分析
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    path = Path(args[0]) if args else Path(__file__).parent / "benchmarks/TAU15/s27/s27.tau2015"
+    processes = "--processes" in sys.argv
+
+    # 只留下顺序读入的用时，免得两个大网表同时留在内存里影响第二遍的计时
+    sequential = read_tau(path, workers=1).stats
+    gc.collect()
+    design = read_tau(path, processes=processes)
+    # 并发读入时各个线程交替执行，单个文件的用时要看顺序读入的那一遍
+    for key, seconds in sequential["seconds"].items():
+        print(f"{key:>40s}: {seconds * 1000:9.2f} ms")
+    print(f"顺序读入 {sequential['wall'] * 1000:.2f} ms, 并发读入 {design.stats['wall'] * 1000:.2f} ms, "
+          f"最慢的文件 {max(sequential['seconds'].values()) * 1000:.2f} ms, 挂断言 {design.stats['bind'] * 1000:.2f} ms")
+    print(design)
+    for n in chain(design.netlist.inputs[:3], design.netlist.outputs[:3]):
+        print(n, {k: v for k, v in design.netlist.graph.nodes[n].items() if k in ("at", "slew", "rat", "load", "clock")})
+
+    timer = design.timer()
+    timer.update_timing()
+    print(timer, "WNS", np.nanmin(timer.slacks))
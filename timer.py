@@ -0,0 +1,1218 @@
+import time
+import numpy as np
+from pathlib import Path
+from itertools import chain
+from collections import defaultdict
+from libparser import TIMING_SENSES
+
+EARLY, LATE = 0, 1
+SPLITS = ("early", "late")
+RISE, FALL = 0, 1
+TRANSITIONS = ("rise", "fall")
+# 每个引脚的时序量都是四列，顺序与 .timing 文件和 TAU19 的输出一致：列号 = 2 * split + transition
+COLUMNS = ("E/R", "E/F", "L/R", "L/F")
+# early 列取最小值、late 列取最大值。early 列取负号存储后，两种分析可以在同一次 np.maximum 归约里完成
+_SIGN = np.array([-1.0, -1.0, 1.0, 1.0])
+
+# 这些 timing_type 只是约束 (setup_rising, hold_falling 等)，信号不会沿着它们传播
+CONSTRAINT_PREFIXES = ("setup", "hold", "recovery", "removal", "skew", "non_seq", "nochange", "min_pulse", "minimum_period")
+# 参与检查的约束：setup/recovery 给出 late 的 required time, hold/removal 给出 early 的
+_CHECKS = {"setup": LATE, "recovery": LATE, "hold": EARLY, "removal": EARLY}
+# 每种 timing_sense / timing_type 下的 (输入跳变, 输出跳变) 组合
+_UNATE = {
+    "positive_unate": ((RISE, RISE), (FALL, FALL)),
+    "negative_unate": ((FALL, RISE), (RISE, FALL)),
+    "non_unate": ((RISE, RISE), (FALL, RISE), (RISE, FALL), (FALL, FALL)),
+    "rising_edge": ((RISE, RISE), (RISE, FALL)),
+    "falling_edge": ((FALL, RISE), (FALL, FALL)),
+}
+# 只有一个工艺角时它的名字
+DEFAULT_CORNER = "default"
+# 逐层的增量传播每个引脚的开销是全量传播的几倍。增量更新要重算的引脚或者已经删掉的引脚超过还在网表中的引脚的这个比例时，
+# 改为整体重建、全量传播，保证增量更新不会比全量重算慢
+INCREMENTAL_SHARE = 0.125
+
+def parse_timing(path):
+    """
+    读取 TAU15/TAU19 的 .timing 断言文件。
+
+    Returns
+    -------
+    dict
+            {"clock": {端口: (周期, ...)}, "at": {端口: [E/R, E/F, L/R, L/F]}, "slew": {...}, "rat": {...}, "load": {端口: float}}
+    """
+    result = {"clock": dict(), "at": dict(), "slew": dict(), "rat": dict(), "load": dict()}
+    with open(path, 'r') as f:
+        for line in f:
+            tokens = line.split()
+            if len(tokens) < 3 or tokens[0] not in result:
+                continue
+            values = [float(x) for x in tokens[2:]]
+            if tokens[0] == "load":
+                result["load"][tokens[1]] = values[0]
+            elif tokens[0] == "clock":
+                result["clock"][tokens[1]] = tuple(values)
+            else:
+                result[tokens[0]][tokens[1]] = values
+    return result
+
+def format_report(title, values, pins):
+    """
+    按 TAU19 输出文件 (at.typical.txt, slews.typical.txt) 的格式排版四列的时序量，没有值的写成 n/a.
+
+    Parameters
+    ----------
+    title : str
+            例如 "Arrival time" 或 "Slew".
+    values : numpy.ndarray
+            (N, 4) 的时序量。
+    pins : list of str
+            N 个引脚名。
+
+    Returns
+    -------
+    str
+    """
+    rule = "-" * 62
+    lines = [f"{title} [pins:{len(pins)}]", rule, f"{COLUMNS[0]:>10s}" + "".join(f"{c:>12s}" for c in COLUMNS[1:]) + f"{'Pin':>16s}", rule]
+    for row, pin in zip(values, pins):
+        cells = ["n/a" if np.isnan(v) else f"{v:.3f}" for v in row]
+        lines.append(f"{cells[0]:>10s}" + "".join(f"{c:>12s}" for c in cells[1:]) + f"{pin:>16s}")
+    lines.append(rule)
+    return "\n".join(lines) + "\n"
+
+class LutStack:
+    """
+    把几个 Liberty 库的查找表补齐到同样大小后堆叠在一起，不同库的 arc 就可以在同一次 lut_lookup 中查表。
+    同一个库只会放一份：unique 是去重后的库，slot[i] 是第 i 个库在 unique 中的下标，
+    第 i 个库的表在堆叠后的下标为 原下标 + offsets[i].
+    """
+
+    def __init__(self, libs):
+        self.unique = []
+        self.slot = []
+        for lib in libs:
+            for i, u in enumerate(self.unique):
+                if lib is u:
+                    self.slot.append(i)
+                    break
+            else:
+                self.slot.append(len(self.unique))
+                self.unique.append(lib)
+        unique = self.unique
+        n1 = max(u.lut_index_1.shape[1] for u in unique)
+        n2 = max(u.lut_index_2.shape[1] for u in unique)
+        starts = np.cumsum([0] + [len(u.lut_shape) for u in unique])
+        self.offsets = [int(starts[i]) for i in self.slot]
+        self.lut_index_1 = np.concatenate([np.pad(u.lut_index_1, ((0, 0), (0, n1 - u.lut_index_1.shape[1])), mode="edge") for u in unique])
+        self.lut_index_2 = np.concatenate([np.pad(u.lut_index_2, ((0, 0), (0, n2 - u.lut_index_2.shape[1])), mode="edge") for u in unique])
+        self.lut_values = np.concatenate([np.pad(u.lut_values, ((0, 0), (0, n1 - u.lut_values.shape[1]), (0, n2 - u.lut_values.shape[2])), mode="edge") for u in unique])
+        self.lut_shape = np.concatenate([u.lut_shape for u in unique])
+
+def lut_weights(luts, tables, x, y):
+    """
+    批量求 NLDM 查找表上双线性插值用到的四个格点和权重，超出表格范围时按边上的两个点线性外推。
+    只取用到的四个点而不是整张表，轴相同的两张表（例如 cell_rise 和 rise_transition）还可以共用同一组权重。
+
+    Parameters
+    ----------
+    luts : libparser.Liberty or LutStack
+            带有 lut_index_1, lut_index_2, lut_values, lut_shape 这几列的对象。
+    tables : numpy.ndarray of int
+            查找表下标 (lut_* 的行号)。
+    x, y : numpy.ndarray
+            与 tables 等长的第一、第二个轴上的取值（输入 slew 和负载电容，或被约束引脚和相关引脚的 slew）。
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+            (n, 4) 的格点在 luts.lut_values.ravel() 中的下标，和 (n, 4) 的权重。
+    """
+    i1, i2, shape = luts.lut_index_1[tables], luts.lut_index_2[tables], luts.lut_shape[tables]
+    r = np.arange(len(tables))
+    # 表格补齐时在末尾重复了最后一个值，所以要按真实大小截断区间下标
+    a = np.clip((i1 <= x[:, None]).sum(1) - 1, 0, np.maximum(shape[:, 0] - 2, 0))
+    b = np.clip((i2 <= y[:, None]).sum(1) - 1, 0, np.maximum(shape[:, 1] - 2, 0))
+    a1 = np.minimum(a + 1, shape[:, 0] - 1)
+    b1 = np.minimum(b + 1, shape[:, 1] - 1)
+    x0, x1, y0, y1 = i1[r, a], i1[r, a1], i2[r, b], i2[r, b1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fx = np.where(x1 != x0, (x - x0) / (x1 - x0), 0.0)
+        fy = np.where(y1 != y0, (y - y0) / (y1 - y0), 0.0)
+    n1, n2 = luts.lut_values.shape[1:]
+    base = tables * (n1 * n2)
+    index = np.stack([base + a * n2 + b, base + a1 * n2 + b, base + a * n2 + b1, base + a1 * n2 + b1], axis=1)
+    weight = np.stack([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy], axis=1)
+    return index, weight
+
+def lut_lookup(luts, tables, x, y):
+    """批量查表，参数同 lut_weights, 返回插值结果。"""
+    index, weight = lut_weights(luts, tables, x, y)
+    return (luts.lut_values.reshape(-1)[index] * weight).sum(1)
+
+class Timer:
+    """
+    在 HeterDiG_GateWireNodePinEdge 网表上做静态时序分析 (STA)，不依赖 PrimeTime.
+
+    时序图以引脚为节点：gate 的每个引脚记为 "inst:pin"，顶层端口记为端口名。
+    net arc 从驱动引脚连到每个负载引脚，延时和 slew 衰减用 SPEF 的 RC 树算 Elmore 延时；
+    cell arc 来自 Liberty 的 timing 分组，延时和输出 slew 在 NLDM 表上插值得到。
+    flipflop 的 CK->Q 是正常的 arc, D 端是终点，由 setup/hold 约束给出 required time, 所以整个时序图是一个 DAG.
+
+    传播时先把引脚分层，每一层的所有 arc 一起做一次向量化的查表和归约，而不是逐个引脚调用 Python 函数。
+    每个引脚的时序量有四列：early rise, early fall, late rise, late fall. early 用 early 库、取最小值，late 用 late 库、取最大值。
+    多个工艺角 (PVT corner) 共用同一个时序图和分层，只是查表用各自的库，所有工艺角沿着数组的第一个轴堆叠，在同一次遍历中算完。
+    结果 self.arrival, self.slews, self.required 的形状都是 (工艺角数, 引脚数, 4).
+
+    网表通过 add_node, connect, disconnect, remove_nodes, set_node_attr 或 apply_spef_delta 修改之后 (见 Netlist.mark_dirty)，
+    update_timing 只重建被修改的 gate 和 net 上的 arc, 再从这些引脚出发逐层向前重算 arrival time、向后重算 required time,
+    某个引脚的值没有变就不再往下传。要重算的引脚太多时 (见 INCREMENTAL_SHARE) 改为全量重算。
+    被删掉的引脚暂时留在 self.pins 中，self.live 为 False, 值为 nan, write_reports 不输出它们；删掉的引脚多了之后整体重建、重新编号。
+
+    Parameters
+    ----------
+    netlist : HeterDiG_GateWireNodePinEdge
+            已经 build 好的网表。
+    liberty : Liberty, (Liberty, Liberty) or {str 工艺角: Liberty or (Liberty, Liberty)} (可以为空)
+            一个库时 early 和 late 都用它；(early 库, late 库) 时分别使用，例如 TAU15 的 xxx_Early.lib 和 xxx_Late.lib；
+            字典时每一项是一个工艺角，例如 {"typical": lib_typ, "fast": lib_fast}. 默认用 netlist.liberty.
+    spef : spefparser.Spef (可以为空)
+            默认用 netlist.spef. 没有寄生参数的 net 的线延时为 0, 负载只有引脚电容。
+    ports : {str 端口: str wire 节点} (可以为空)
+            顶层端口和它所在的 net (例如 OpsRunner.ports，它被修改后下次更新时会跟着变)。默认是 iotype 为 input/output 的同名 wire 节点。
+    """
+
+    def __init__(self, netlist, liberty=None, spef=None, ports=None):
+        liberty = liberty if liberty is not None else netlist.liberty
+        if not isinstance(liberty, dict):
+            liberty = {DEFAULT_CORNER: liberty}
+        self.corners = list(liberty)
+        self.libs = [tuple(lib) if isinstance(lib, (tuple, list)) else (lib, lib) for lib in liberty.values()]
+        if not self.libs or any(len(pair) != 2 or None in pair for pair in self.libs):
+            raise ValueError("Timer needs a Liberty library or an (early, late) pair per corner, call netlist.read_liberty() first.")
+        for lib in {id(lib): lib for pair in self.libs for lib in pair}.values():
+            if len(lib.cell_index) == 0:
+                raise ValueError(f"Liberty library {lib.path or lib.name} has no cells")
+        self.netlist = netlist
+        self._spef = spef
+        g = netlist.graph
+        self.ports = ports if ports is not None else {n: n for n, iotype in g.nodes(data="iotype") if iotype in ("input", "output")}
+        self.luts = LutStack([lib for pair in self.libs for lib in pair])
+        # _slots[c][split] 是工艺角 c 在 split 一侧所用的库在 LutStack.unique 中的下标
+        self._slots = np.array(self.luts.slot).reshape(len(self.corners), 2)
+
+        self.pi_at = dict()        # {端口: 四列的 arrival time}
+        self.pi_slew = dict()
+        self.po_rat = dict()       # {端口: 四列的 required time}
+        self.po_load = dict()      # {端口: 电容}
+        self.clock = None          # (时钟端口, 周期)
+
+        self.pins = []             # 引脚名
+        self.pin_index = dict()    # {引脚名: 下标}
+        self.arrival = None        # (C, N, 4) 的 arrival time
+        self.slews = None          # (C, N, 4) 的 slew
+        self.required = None       # (C, N, 4) 的 required time
+        self.live = None           # (N,) 引脚是否还在网表中，被删掉的 gate 和端口的引脚为 False
+        self._graph = None         # arc 表、引脚分层和邻接索引
+        self._state = None         # 带符号存储的 at, slew, rat, rat 的初值 (C, 4 * 引脚数) 和 cell arc 的延时
+        self._mark = None          # 上次更新时网表的修改标记 (见 Netlist.dirty_since)
+        self._dirty = set()        # 断言引起的修改：改了负载的输出端口所在的 net
+        self._dirty_ports = set()  # 改了 arrival time 或 slew 的输入端口
+        self._stale = True
+        self._templates = dict()
+        self._gate_pins = dict()   # {gate: {引脚名: 引脚下标}}
+        self._pin_cap = dict()     # {引脚下标: 每个去重后的库里的引脚电容}
+        self.stats = dict()
+
+    def __repr__(self):
+        return f"Timer({self.netlist.name}, {len(self.pins)} pins, corners={self.corners})"
+
+    @property
+    def spef(self):
+        return self._spef if self._spef is not None else self.netlist.spef
+
+    @property
+    def stale(self):
+        """上次 update_timing 之后网表或断言是否被修改过。"""
+        return self._stale or self._state is None or self.netlist.dirty_since()[0] != self._mark
+
+    # 断言
+    @staticmethod
+    def _columns(values):
+        # 1 个值: 四列相同; 2 个值: (rise, fall), early 和 late 相同; 4 个值: E/R, E/F, L/R, L/F
+        v = np.asarray(values, dtype=float).ravel()
+        if len(v) in (1, 2):
+            return np.resize(v, 4)
+        if len(v) == 4:
+            return v
+        raise ValueError(f"expected 1, 2 or 4 values, got {len(v)}.")
+
+    def set_at(self, port, *values):
+        """设置输入端口的 arrival time, values 为 1 个、(rise, fall) 2 个或 E/R, E/F, L/R, L/F 4 个值。"""
+        self.pi_at[port] = self._columns(values)
+        self._dirty_ports.add(port)
+        self._stale = True
+
+    def set_slew(self, port, *values):
+        """设置输入端口的 slew, values 同 set_at."""
+        self.pi_slew[port] = self._columns(values)
+        self._dirty_ports.add(port)
+        self._stale = True
+
+    def set_rat(self, port, *values):
+        """设置输出端口的 required arrival time, values 同 set_at."""
+        self.po_rat[port] = self._columns(values)
+        self._stale = True
+
+    def set_load(self, port, cap):
+        """设置输出端口的负载电容，下次更新时重算端口所在 net 的 RC."""
+        self.po_load[port] = cap
+        if port in self.ports:
+            self._dirty.add(self.ports[port])
+        self._stale = True
+
+    def set_clock(self, port, period):
+        """设置时钟端口和周期，setup 检查的 required time 要加上一个周期。"""
+        self.clock = (port, float(period))
+        self._stale = True
+
+    def apply_timing(self, timing):
+        """应用 parse_timing 读出的断言 (clock, at, slew, rat, load)，对所有工艺角都一样。"""
+        for port, values in timing.get("clock", dict()).items():
+            self.set_clock(port, values[0])
+        for port, v in timing.get("at", dict()).items():
+            self.set_at(port, *v)
+        for port, v in timing.get("slew", dict()).items():
+            self.set_slew(port, *v)
+        for port, v in timing.get("rat", dict()).items():
+            self.set_rat(port, *v)
+        for port, cap in timing.get("load", dict()).items():
+            self.set_load(port, cap)
+
+    # 建立时序图
+    def invalidate(self):
+        """绕过 Netlist 的修改接口改了网表，或者换了库之后调用，下次 update_timing 时整体重建时序图。"""
+        self._graph = None
+        self._stale = True
+
+    def _pin(self, name):
+        i = self.pin_index.get(name)
+        if i is None:
+            i = self.pin_index[name] = len(self.pins)
+            self.pins.append(name)
+        return i
+
+    def _lib_template(self, u, split, cell):
+        # 库单元 cell 在去重后的第 u 个库中、作为 split 一侧使用时的引脚电容、传播 arc 和约束，表下标已经加上 LutStack 的偏移
+        lib = self.luts.unique[u]
+        off = self.luts.offsets[self.luts.slot.index(u)]
+        ci = lib.cell_index.get(cell)
+        caps, arcs, checks = dict(), dict(), dict()
+        if ci is not None:
+            for pin, p in lib.pin_index[cell].items():
+                caps[pin] = float(lib.pin_capacitance[p])
+            start = lib.cell_arc_start[ci]
+            for a in range(start, start + lib.cell_arc_count[ci]):
+                if lib.arc_from[a] < 0:
+                    continue
+                ttype = lib.timing_types[lib.arc_type[a]]
+                src, dst = str(lib.pin_name[lib.arc_from[a]]), str(lib.pin_name[lib.arc_to[a]])
+                tables = lib.arc_tables[a]
+                if ttype.startswith(CONSTRAINT_PREFIXES):
+                    kind, _, edge = ttype.partition("_")
+                    if _CHECKS.get(kind) == split and tables[4] >= 0 and tables[5] >= 0:
+                        checks[(dst, src, FALL if edge == "falling" else RISE)] = (tables[4] + off, tables[5] + off)
+                    continue
+                sense = ttype if ttype in ("rising_edge", "falling_edge") else TIMING_SENSES[lib.arc_sense[a]] if lib.arc_sense[a] >= 0 else "non_unate"
+                for i, o in _UNATE[sense]:
+                    if tables[o] >= 0 and tables[2 + o] >= 0:
+                        arcs[(src, dst, 2 * split + i, 2 * split + o)] = (tables[o] + off, tables[2 + o] + off)
+        return caps, arcs, checks
+
+    def _template(self, split, cell):
+        """
+        库单元 cell 作为 split 一侧使用时、合并了所有工艺角的 arc, 按单元缓存。某个工艺角的库里没有的 arc 表下标为 -1.
+
+        Returns
+        -------
+        (dict, list, list)
+                {引脚名: 每个去重后的库里的引脚电容}，
+                传播 arc [(from 引脚名, to 引脚名, 输入列, 输出列, [C 个延时表 ..., C 个 slew 表 ...])]，
+                约束 [(被约束引脚名, 时钟引脚名, 时钟跳变, [C 个 rise_constraint 表 ..., C 个 fall_constraint 表 ...])]。
+        """
+        key = (split, cell)
+        if key in self._templates:
+            return self._templates[key]
+        n_unique = len(self.luts.unique)
+        per_lib = [self._lib_template(u, split, cell) for u in range(n_unique)]
+        caps = {pin: tuple(t[0].get(pin, 0.0) for t in per_lib) for pin in dict.fromkeys(p for t in per_lib for p in t[0])}
+        # 工艺角 c 在 split 一侧用的是去重后的第 slot[2c + split] 个库
+        corners = [per_lib[u] for u in self.luts.slot[split::2]]
+        arcs, checks = [], []
+        for k in dict.fromkeys(k for t in corners for k in t[1]):
+            tables = [t[1].get(k, (-1, -1)) for t in corners]
+            arcs.append(k + ([x[0] for x in tables] + [x[1] for x in tables],))
+        for k in dict.fromkeys(k for t in corners for k in t[2]):
+            tables = [t[2].get(k, (-1, -1)) for t in corners]
+            checks.append(k + ([x[0] for x in tables] + [x[1] for x in tables],))
+        self._templates[key] = (caps, arcs, checks)
+        return self._templates[key]
+
+    def _gate_arcs(self, n, attr):
+        # gate 节点 n 的引脚（没有的就新建）、cell arc 和约束，同时记下引脚电容
+        local = dict()
+        for pin_name in chain(attr.get("fanin", ()), attr.get("fanout", ())):
+            local[pin_name] = self._pin(f"{n}:{pin_name}")
+        self._gate_pins[n] = local
+        cell = attr.get("subtype")
+        caps = self._template(EARLY, cell)[0]
+        for pin_name, p in local.items():
+            if pin_name in caps:
+                self._pin_cap[p] = caps[pin_name]
+            else:
+                self._pin_cap.pop(p, None)
+        rows, tables, check_rows, check_tables = [], [], [], []
+        for split in (EARLY, LATE):
+            _, arcs, checks = self._template(split, cell)
+            for src, dst, i, o, t in arcs:
+                if src in local and dst in local:
+                    rows.append((local[src], local[dst], i, o))
+                    tables.append(t)
+            for d, ck, edge, t in checks:
+                if d in local and ck in local:
+                    check_rows.append((local[d], local[ck], split, edge))
+                    check_tables.append(t)
+        return rows, tables, check_rows, check_tables
+
+    def _port_pins(self):
+        # 顶层端口的引脚：输入端口驱动所在的 net, 输出端口是所在 net 的负载，电容为 po_load
+        g = self.netlist.graph
+        nets = defaultdict(list)    # {net: [(引脚下标, 是否输入端口)]}
+        inputs, outputs = [], []
+        for port, net in self.ports.items():
+            p = self._pin(port)
+            is_input = g.nodes[net].get("iotype") == "input"
+            if is_input:
+                inputs.append(p)
+            else:
+                outputs.append(p)
+                self._pin_cap[p] = (self.po_load.get(port, 0.0),) * len(self.luts.unique)
+            nets[net].append((p, is_input))
+        return nets, np.array(inputs, dtype=np.int64), np.array(outputs, dtype=np.int64)
+
+    def _net_pins(self, net, port_nets):
+        # 从图上找出 net 现在的驱动引脚和负载引脚
+        g = self.netlist.graph
+        driver, sinks = None, []
+        for p, is_input in port_nets.get(net, ()):
+            if is_input:
+                driver = p
+            else:
+                sinks.append(p)
+        if net in g:
+            for gate in g.pred[net]:
+                for pin_name, w in g.nodes[gate].get("fanout", dict()).items():
+                    if w == net and gate in self._gate_pins:
+                        driver = self._gate_pins[gate][pin_name]
+            for gate in g.succ[net]:
+                for pin_name, w in g.nodes[gate].get("fanin", dict()).items():
+                    if w == net and gate in self._gate_pins:
+                        sinks.append(self._gate_pins[gate][pin_name])
+        return driver, sinks
+
+    def _net_arcs(self, net, driver, sinks):
+        # net 上驱动引脚到每个负载引脚的 Elmore 延时和 impulse^2 (每个去重后的库一列)，以及驱动引脚在每个库下的负载。
+        # 它们只与电容有关，建图时就算好
+        n_unique = len(self.luts.unique)
+        delay, impulse, load = np.zeros((len(sinks), n_unique)), np.zeros((len(sinks), n_unique)), np.zeros(n_unique)
+        if not sinks:
+            return delay, impulse, load
+        spef = self.spef
+        rc = spef.net(net) if spef is not None and net in spef else None
+        no_caps = (0.0,) * n_unique
+        for u in range(n_unique):
+            caps = {self.pins[p]: self._pin_cap.get(p, no_caps)[u] for p in sinks}
+            if rc is None:
+                load[u] = sum(caps.values())
+                continue
+            d, m, load[u] = rc.elmore(self.pins[driver], caps)
+            nodes = [rc.node_index.get(self.pins[s]) for s in sinks]
+            found = [j for j, i in enumerate(nodes) if i is not None]
+            idx = [nodes[j] for j in found]
+            delay[found, u] = d[idx]
+            impulse[found, u] = np.maximum(m[idx], 0.0)
+        return delay, impulse, load
+
+    def _build(self):
+        g = self.netlist.graph
+        self._mark = self.netlist.dirty_since()[0]
+        self._dirty, self._dirty_ports = set(), set()
+        self.pins, self.pin_index = [], dict()
+        self._templates, self._gate_pins, self._pin_cap = dict(), dict(), dict()
+        n_corners, n_unique = len(self.corners), len(self.luts.unique)
+
+        port_nets, inputs, outputs = self._port_pins()
+        net_driver = dict()                  # {net: 驱动引脚下标}
+        net_sinks = defaultdict(list)        # {net: [负载引脚下标]}
+        for net, pins in port_nets.items():
+            for p, is_input in pins:
+                if is_input:
+                    net_driver[net] = p
+                else:
+                    net_sinks[net].append(p)
+
+        # arc 表按 gate 和 net 分段存放，owner 记下每段的 [起, 止)，增量更新时整段替换
+        cell_rows, cell_tables = [], []      # (src, dst, 输入列, 输出列), [C 个延时表 ..., C 个 slew 表 ...]
+        check_rows, check_tables = [], []    # (被约束引脚, 时钟引脚, split, 时钟跳变), [C 个 rise 表 ..., C 个 fall 表 ...]
+        owner = {"net": dict(), "cell": dict(), "check": dict()}
+        for n, attr in g.nodes(data=True):
+            if attr.get("type") not in ("gate", "flipflop"):
+                continue
+            rows, tables, crows, ctables = self._gate_arcs(n, attr)
+            local = self._gate_pins[n]
+            for pin_name, net in attr.get("fanin", dict()).items():
+                net_sinks[net].append(local[pin_name])
+            for pin_name, net in attr.get("fanout", dict()).items():
+                net_driver[net] = local[pin_name]
+            owner["cell"][n] = (len(cell_rows), len(cell_rows) + len(rows))
+            owner["check"][n] = (len(check_rows), len(check_rows) + len(crows))
+            cell_rows += rows
+            cell_tables += tables
+            check_rows += crows
+            check_tables += ctables
+
+        load = np.zeros((n_unique, len(self.pins)))
+        net_pairs, net_delay, net_impulse = [], [np.zeros((0, n_unique))], [np.zeros((0, n_unique))]
+        for net, driver in net_driver.items():
+            sinks = net_sinks.get(net, [])
+            delay, impulse, load[:, driver] = self._net_arcs(net, driver, sinks)
+            owner["net"][net] = (len(net_pairs), len(net_pairs) + len(sinks))
+            net_pairs.extend((driver, s) for s in sinks)
+            net_delay.append(delay)
+            net_impulse.append(impulse)
+
+        self._graph = {
+            "net": {"rows": np.array(net_pairs, dtype=np.int64).reshape(-1, 2), "delay": np.concatenate(net_delay),
+                    "impulse": np.concatenate(net_impulse), "alive": np.ones(len(net_pairs), dtype=bool)},
+            "cell": {"rows": np.array(cell_rows, dtype=np.int64).reshape(-1, 4),
+                     "tables": np.array(cell_tables, dtype=np.int64).reshape(-1, 2 * n_corners), "alive": np.ones(len(cell_rows), dtype=bool)},
+            "check": {"rows": np.array(check_rows, dtype=np.int64).reshape(-1, 4),
+                      "tables": np.array(check_tables, dtype=np.int64).reshape(-1, 2 * n_corners), "alive": np.ones(len(check_rows), dtype=bool)},
+            "owner": owner, "appends": {"net": [], "cell": [], "check": []}, "driver": net_driver, "load": load,
+            "ports": dict(self.ports), "inputs": inputs, "outputs": outputs, "live": np.ones(len(self.pins), dtype=bool),
+        }
+        self._index()
+        self.stats.update(pins=len(self.pins), corners=n_corners, net_arcs=len(net_pairs), cell_arcs=len(cell_rows), checks=len(check_rows))
+
+    def _replace(self, kind, owner, rows, **values):
+        # 用新的行替换 owner (gate 或 net) 名下原来的行：连接关系没变时原地覆盖，否则旧行作废、新行先记在 appends 里，
+        # 由 _flush 一次追加到表的末尾。返回新旧两组行涉及的引脚，以及连接关系是否变了
+        table, owners, appends = self._graph[kind], self._graph["owner"][kind], self._graph["appends"][kind]
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1, table["rows"].shape[1])
+        values = {name: np.asarray(v, dtype=table[name].dtype).reshape(len(rows), *table[name].shape[1:]) for name, v in values.items()}
+        start, stop = owners.get(owner, (0, 0))
+        old = table["rows"][start:stop]
+        pins = np.concatenate([old[:, :2].ravel(), rows[:, :2].ravel()])
+        if np.array_equal(old, rows):
+            for name, v in values.items():
+                table[name][start:stop] = v
+            return pins, False
+        table["alive"][start:stop] = False
+        n = len(table["alive"]) + sum(len(r) for r, _ in appends)
+        appends.append((rows, values))
+        owners[owner] = (n, n + len(rows))
+        return pins, True
+
+    def _flush(self):
+        # 把 _replace 记下的新行追加到各个 arc 表的末尾
+        for kind, appends in self._graph["appends"].items():
+            if appends:
+                table = self._graph[kind]
+                table["rows"] = np.concatenate([table["rows"]] + [r for r, _ in appends])
+                for name in table:
+                    if name not in ("rows", "alive"):
+                        table[name] = np.concatenate([table[name]] + [v[name] for _, v in appends])
+                table["alive"] = np.concatenate([table["alive"], np.ones(sum(len(r) for r, _ in appends), dtype=bool)])
+                appends.clear()
+
+    def _patch(self, nodes):
+        """
+        按被修改的网表节点重建 arc 表中对应的行，返回需要重算的引脚。
+
+        Parameters
+        ----------
+        nodes : set of str
+                自上次更新以来被修改过的网表节点 (见 Netlist.dirty_since)。
+
+        Returns
+        -------
+        numpy.ndarray
+                arc 被替换过、负载变了或断言变了的引脚。
+        """
+        g = self.netlist.graph
+        G = self._graph
+        n_pins = len(self.pins)
+        touched = [np.zeros(0, dtype=np.int64)]
+        structural = False
+
+        port_nets, G["inputs"], G["outputs"] = self._port_pins()
+        nets = set(self._dirty)
+        born, dead = [self.pin_index[port] for port in self.ports], []     # 新建 (或重新出现) 的引脚和被删掉的引脚
+        for port in set(G["ports"]) | set(self.ports):
+            old, new = G["ports"].get(port), self.ports.get(port)
+            if old != new:
+                nets.update(net for net in (old, new) if net is not None)
+                touched.append([self.pin_index[port]])
+                if new is None:
+                    dead.append(self.pin_index[port])
+        G["ports"] = dict(self.ports)
+        touched.append([self.pin_index[port] for port in self._dirty_ports if port in self.pin_index])
+
+        for n in nodes:
+            attr = g.nodes[n] if n in g else None
+            if attr is not None and attr.get("type") in ("gate", "flipflop"):
+                old = list(self._gate_pins.get(n, dict()).values())
+                touched.append(old)
+                rows, tables, crows, ctables = self._gate_arcs(n, attr)
+                dead += old
+                born += self._gate_pins[n].values()
+                pins, changed = self._replace("cell", n, rows, tables=tables)
+                touched += [pins, self._replace("check", n, crows, tables=ctables)[0], list(self._gate_pins[n].values())]
+                structural |= changed
+                # 引脚电容可能变了，所连的 net 也要重算
+                nets.update(attr.get("fanin", dict()).values())
+                nets.update(attr.get("fanout", dict()).values())
+            elif n in self._gate_pins:
+                # gate 被删掉了
+                touched.append(list(self._gate_pins.pop(n).values()))
+                dead += touched[-1]
+                pins, changed = self._replace("cell", n, [], tables=[])
+                touched += [pins, self._replace("check", n, [], tables=[])[0]]
+                structural |= changed
+            else:
+                nets.add(n)
+
+        extra = len(self.pins) - G["load"].shape[1]
+        G["load"] = np.pad(G["load"], ((0, 0), (0, extra)))
+        # 先清掉旧驱动引脚的负载，一个输出引脚从一个 net 挪到另一个 net 上时才不会被覆盖
+        members = dict()
+        for net in nets:
+            old = G["driver"].pop(net, None)
+            if old is not None:
+                G["load"][:, old] = 0.0
+                touched.append([old])
+            members[net] = self._net_pins(net, port_nets)
+        for net, (driver, sinks) in members.items():
+            if driver is None:
+                sinks, delay, impulse = [], np.zeros((0, len(self.luts.unique))), np.zeros((0, len(self.luts.unique)))
+            else:
+                G["driver"][net] = driver
+                delay, impulse, G["load"][:, driver] = self._net_arcs(net, driver, sinks)
+                touched.append([driver])
+            pins, changed = self._replace("net", net, [(driver, s) for s in sinks], delay=delay, impulse=impulse)
+            touched.append(pins)
+            structural |= changed
+
+        n_net, n_cell = len(G["net"]["alive"]), len(G["cell"]["alive"])
+        self._flush()
+        self._dirty, self._dirty_ports = set(), set()
+        if structural or len(self.pins) > n_pins:
+            G["extra"] = None
+            self._relevel(n_net, n_cell)
+        G["is_input"] = np.zeros(len(self.pins), dtype=bool)
+        G["is_input"][G["inputs"]] = True
+        live = G["live"] = np.pad(G["live"], (0, len(self.pins) - len(G["live"])))
+        live[np.asarray(dead, dtype=np.int64)] = False
+        live[np.asarray(born, dtype=np.int64)] = True
+        # 分层批次里存着查表用的负载和延时，要重新编排
+        G["levels"] = None
+        self._grow()
+        return np.unique(np.concatenate([np.asarray(t, dtype=np.int64) for t in touched]))
+
+    def _grow(self):
+        # 新建了引脚或 arc 之后，把状态数组补齐到新的大小
+        state = self._state
+        extra = 4 * len(self.pins) - state["at"].shape[1]
+        if extra > 0:
+            for name in ("at", "slew", "rat", "base"):
+                state[name] = np.pad(state[name], ((0, 0), (0, extra)), constant_values=-np.inf)
+        extra = len(self._graph["cell"]["alive"]) - state["cell_delay"].shape[1]
+        if extra > 0:
+            state["cell_delay"] = np.pad(state["cell_delay"], ((0, 0), (0, extra)), constant_values=np.nan)
+
+    def _index(self):
+        # 整体重新分层；按目标引脚和按源引脚排序的邻接索引到增量更新用到时再建
+        G = self._graph
+        net, cell = G["net"], G["cell"]
+        net_rows, cell_ids = np.flatnonzero(net["alive"]), np.flatnonzero(cell["alive"])
+        G["level"] = self._levelize(len(self.pins), np.concatenate([net["rows"][net_rows, 0], cell["rows"][cell_ids, 0]]),
+                                    np.concatenate([net["rows"][net_rows, 1], cell["rows"][cell_ids, 1]]))
+        G["levels"] = None
+        G["fanin"] = G["fanout"] = G["extra"] = None
+        G["is_input"] = np.zeros(len(self.pins), dtype=bool)
+        G["is_input"][G["inputs"]] = True
+
+    def _relevel(self, net_start, cell_start):
+        # 追加了 arc 之后修复层号。传播只要求每条 arc 的目标层号大于源层号，所以只把违反的引脚往后推，
+        # 和 Netlist._repair_levels 一样层号真的变大了才继续往后传。推的轮数太多 (有环) 时整体重新分层
+        G = self._graph
+        self._adjacency()
+        level = G["level"] = np.pad(G["level"], (0, len(self.pins) - len(G["level"])))
+        if (level < 0).any():
+            # 删掉的 arc 可能拆开了环
+            return self._index()
+        _, src, dst = self._arcs(net_start, cell_start)
+        frontier = np.unique(dst[level[dst] <= level[src]])
+        for _ in range(2 * int(level.max(initial=0)) + 4):
+            if not len(frontier):
+                return
+            _, this, pred = self._neighbors(frontier, "fanin")
+            need = level[frontier].copy()
+            np.maximum.at(need, np.searchsorted(frontier, this), level[pred] + 1)
+            raised = frontier[need > level[frontier]]
+            level[raised] = need[need > level[frontier]]
+            frontier = np.unique(self._neighbors(raised, "fanout")[2])
+        self._index()
+
+    def _arcs(self, net_start, cell_start):
+        # 从给定行开始、还有效的 arc: (编号, 源引脚, 目标引脚)。
+        # arc 的编号：net arc 展开成每列一条，编号为 4 * 行号 + 列；cell arc 的编号为 -(行号 + 1), 表变长时编号不变
+        net, cell = self._graph["net"], self._graph["cell"]
+        net_rows = np.flatnonzero(net["alive"][net_start:]) + net_start
+        cell_rows = np.flatnonzero(cell["alive"][cell_start:]) + cell_start
+        arcs = np.concatenate([(net_rows[:, None] * 4 + np.arange(4)).ravel(), -cell_rows - 1])
+        src = np.concatenate([np.repeat(net["rows"][net_rows, 0], 4), cell["rows"][cell_rows, 0]])
+        dst = np.concatenate([np.repeat(net["rows"][net_rows, 1], 4), cell["rows"][cell_rows, 1]])
+        return arcs, src, dst
+
+    def _adjacency(self):
+        # 按目标引脚 (fanin) 和按源引脚 (fanout) 排序的 CSR 邻接索引：(每个引脚的起点, arc 编号, 另一端的引脚)。
+        # 索引建好之后追加的 arc 放在 G["extra"] 里逐个比对，作废的 arc 在取用时滤掉；追加的 arc 多了再整体重建
+        G = self._graph
+        n_net, n_cell = len(G["net"]["alive"]), len(G["cell"]["alive"])
+        if G["fanin"] is not None:
+            base_net, base_cell = G["base"]
+            if 8 * (4 * (n_net - base_net) + n_cell - base_cell) > 4 * base_net + base_cell:
+                G["fanin"] = None
+        if G["fanin"] is None:
+            arcs, src, dst = self._arcs(0, 0)
+            n_pins = len(self.pins)
+            for name, pins, other in (("fanin", dst, src), ("fanout", src, dst)):
+                order = np.argsort(pins, kind="stable")
+                G[name] = (np.searchsorted(pins[order], np.arange(n_pins + 1)), arcs[order], other[order])
+            G["base"], G["extra"] = (n_net, n_cell), None
+        if G["extra"] is None:
+            G["extra"] = self._arcs(*G["base"])
+
+    def _neighbors(self, pins, direction):
+        # pins 的所有入边 (fanin) 或出边 (fanout) 中还有效的 arc: (编号, 这一端的引脚, 另一端的引脚)
+        G = self._graph
+        ptr, arcs, other = G[direction]
+        inside = pins[pins < len(ptr) - 1]
+        pos = self._ranges(ptr, inside)
+        this = np.repeat(inside, ptr[inside + 1] - ptr[inside])
+        arcs, other = arcs[pos], other[pos]
+        extra, src, dst = G["extra"]
+        if len(extra):
+            near, far = (dst, src) if direction == "fanin" else (src, dst)
+            hit = np.isin(near, pins)
+            arcs, this, other = np.concatenate([arcs, extra[hit]]), np.concatenate([this, near[hit]]), np.concatenate([other, far[hit]])
+        alive = np.empty(len(arcs), dtype=bool)
+        net = arcs >= 0
+        alive[net] = G["net"]["alive"][arcs[net] // 4]
+        alive[~net] = G["cell"]["alive"][-arcs[~net] - 1]
+        return arcs[alive], this[alive], other[alive]
+
+    def _batch(self, pins, direction):
+        # pins 的所有入边 (fanin) 或出边 (fanout)，编排成一批。反向传播只用到已经算好的延时，不需要准备查表
+        arcs = self._neighbors(pins, direction)[0]
+        return self._compile(arcs[arcs >= 0], -arcs[arcs < 0] - 1, lookup=direction == "fanin") if len(arcs) else None
+
+    def _schedule(self):
+        # 全量传播用的分层批次：第 l 个批次是所有指向第 l + 1 层引脚的 arc
+        G = self._graph
+        if G["levels"] is None:
+            level = G["level"]
+            net_ids = (np.flatnonzero(G["net"]["alive"])[:, None] * 4 + np.arange(4)).ravel()
+            cell_ids = np.flatnonzero(G["cell"]["alive"])
+            net_level = level[G["net"]["rows"][net_ids // 4, 1]]
+            cell_level = level[G["cell"]["rows"][cell_ids, 1]]
+            net_order, cell_order = np.argsort(net_level, kind="stable"), np.argsort(cell_level, kind="stable")
+            net_ids, net_level = net_ids[net_order], net_level[net_order]
+            cell_ids, cell_level = cell_ids[cell_order], cell_level[cell_order]
+            levels = []
+            for l in range(1, level.max() + 1 if len(level) else 1):
+                a, b = np.searchsorted(net_level, [l, l + 1])
+                c, d = np.searchsorted(cell_level, [l, l + 1])
+                levels.append(self._compile(net_ids[a:b], cell_ids[c:d]))
+            G["levels"] = levels
+            self.stats["levels"] = len(levels)
+        return G["levels"]
+
+    def _compile(self, net_ids, cell_ids, lookup=True):
+        # 把一批 net arc (展开后的编号) 和 cell arc (行号) 编排成向量化传播用的数组，lookup 为 False 时不准备前向查表用的部分。
+        # 两种 arc 各自按 (目标引脚, 输出列) 排序，指向同一个 (引脚, 列) 的行连续，便于 reduceat
+        G, slots = self._graph, self._slots
+        net_ids = net_ids[np.argsort(G["net"]["rows"][net_ids // 4, 1] * 4 + net_ids % 4, kind="stable")]
+        row, col = net_ids // 4, net_ids % 4
+        pairs = G["net"]["rows"][row]
+        u = slots[:, col // 2]                          # (C, R) 每行在每个工艺角用的库
+        net = {"src": pairs[:, 0] * 4 + col, "sign": _SIGN[col],
+               "delay": G["net"]["delay"][row[None, :], u], "impulse": G["net"]["impulse"][row[None, :], u]}
+
+        rows = G["cell"]["rows"][cell_ids]
+        order = np.argsort(rows[:, 1] * 4 + rows[:, 3], kind="stable")
+        cell_ids, rows = cell_ids[order], rows[order]
+        cell = {"src": rows[:, 0] * 4 + rows[:, 2], "sign": _SIGN[rows[:, 3]], "arc": cell_ids}
+        if lookup:
+            cell.update(self._lookup_tables(rows, cell_ids))
+
+        dst = np.concatenate([pairs[:, 1] * 4 + col, rows[:, 1] * 4 + rows[:, 3]])
+        src = np.concatenate([net["src"], cell["src"]])
+        starts = self._starts(dst)
+        # 反向传播 required time 时按源引脚归约
+        src_order = np.argsort(src, kind="stable")
+        src_sorted = src[src_order]
+        src_starts = self._starts(src_sorted)
+        return {"net": net, "cell": cell, "dst": dst, "keys": dst[starts], "starts": starts,
+                "sign": np.concatenate([net["sign"], cell["sign"]]),
+                "src_order": src_order, "src_keys": src_sorted[src_starts], "src_starts": src_starts}
+
+    def _lookup_tables(self, rows, cell_ids):
+        # cell arc 在每个工艺角查表用的表下标和负载，形状都是 (C, R) 展开后的一维数组
+        G, luts, slots = self._graph, self.luts, self._slots
+        n_corners = len(self.corners)
+        tables = G["cell"]["tables"][cell_ids]
+        split = rows[:, 3] // 2
+        delay_table, slew_table = tables[:, :n_corners].T, tables[:, n_corners:].T     # (C, R)
+        exists = (delay_table >= 0) & (slew_table >= 0)
+        delay_table, slew_table = np.where(exists, delay_table, 0), np.where(exists, slew_table, 0)
+        # 延时表和 slew 表的轴相同时共用插值权重，slew 表的格点就是延时表的格点平移 slew_shift
+        same_axes = (np.all(luts.lut_index_1[delay_table] == luts.lut_index_1[slew_table], axis=2)
+                     & np.all(luts.lut_index_2[delay_table] == luts.lut_index_2[slew_table], axis=2)
+                     & np.all(luts.lut_shape[delay_table] == luts.lut_shape[slew_table], axis=2))
+        table_size = luts.lut_values.shape[1] * luts.lut_values.shape[2]
+        return {"delay_table": delay_table.ravel(), "slew_table": slew_table.ravel(),
+                "load": G["load"][slots[np.arange(n_corners)[:, None], split[None, :]], rows[None, :, 1]].ravel(),
+                "slew_shift": ((slew_table - delay_table) * table_size).reshape(-1, 1),
+                "own_axes": np.flatnonzero(~same_axes), "missing": None if exists.all() else ~exists}
+
+    @staticmethod
+    def _starts(keys):
+        # 排好序的 keys 中每一段相同值的起点
+        return np.concatenate([[0], np.flatnonzero(keys[1:] != keys[:-1]) + 1]) if len(keys) else np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def _ranges(ptr, nodes):
+        # CSR 邻接数组中 nodes 的所有邻接项的位置
+        lengths = ptr[nodes + 1] - ptr[nodes]
+        return np.repeat(ptr[nodes] - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+    @staticmethod
+    def _levelize(n, src, dst):
+        # 用 NumPy 做 Kahn 拓扑分层。在环上的引脚（组合逻辑环）层号为 -1, 不会被传播到。
+        level = np.full(n, -1, dtype=np.int64)
+        if not n:
+            return level
+        order = np.argsort(src, kind="stable")
+        src, dst = src[order], dst[order]
+        ptr = np.searchsorted(src, np.arange(n + 1))
+        indeg = np.bincount(dst, minlength=n)
+        frontier = np.flatnonzero(indeg == 0)
+        l = 0
+        while len(frontier):
+            level[frontier] = l
+            succ = dst[Timer._ranges(ptr, frontier)]
+            indeg -= np.bincount(succ, minlength=n)
+            frontier = np.unique(succ[indeg[succ] == 0])
+            l += 1
+        return level
+
+    # 传播
+    def update_timing(self, incremental=True):
+        """
+        先从输入端口出发逐层向前传播 arrival time 和 slew, 再从输出端口和 flipflop 的约束出发逐层向后传播 required time.
+        所有工艺角和四列 (early/late x rise/fall) 在同一次遍历中一起算。
+
+        Parameters
+        ----------
+        incremental : bool
+                为 True 时只重算自上次更新以来受网表修改和断言修改影响的引脚；为 False 时重建时序图，所有引脚从头传播。
+                第一次调用、调用过 invalidate、或者网表被整体修改过 (见 Netlist.invalidate) 时总是全量的。
+                改动涉及的引脚、删掉的引脚或者传播到的引脚超过还在网表中的引脚的 INCREMENTAL_SHARE 时，也改为全量的。
+
+        Returns
+        -------
+        Timer
+                self, 结果在 self.arrival, self.slews 和 self.required 中。
+        """
+        t0 = time.perf_counter()
+        mark, nodes = self.netlist.dirty_since(self._mark)
+        incremental = incremental and nodes is not None and self._graph is not None and self._state is not None
+        budget = None
+        if incremental:
+            live = self._graph["live"]
+            n_live = int(live.sum())
+            budget = INCREMENTAL_SHARE * n_live
+            # 删掉的引脚太多时重建一次，把它们从 self.pins 中去掉
+            incremental = len(live) - n_live <= budget and self._touched(nodes, budget) <= budget
+        if incremental:
+            self._mark = mark
+            seeds = self._patch(nodes)
+        else:
+            self._build()
+            seeds = None
+        t1 = time.perf_counter()
+        n_forward, back_seeds = self._forward(seeds, budget)
+        if n_forward is None:
+            # 传播到的引脚太多，剩下的不如全量传播 (时序图已经修补好了，不用重建)
+            seeds = None
+            n_forward, back_seeds = self._forward()
+        t2 = time.perf_counter()
+        n_backward = self._backward(None if seeds is None else np.concatenate([seeds, back_seeds]), budget)
+        if n_backward is None:
+            seeds = None
+            n_backward = self._backward()
+        t3 = time.perf_counter()
+
+        # 存储时 early 列取了负号，这里还原
+        shape = (len(self.corners), len(self.pins), 4)
+        state = self._state
+        with np.errstate(invalid="ignore"):
+            self.arrival = state["at"].reshape(shape) * _SIGN
+            self.slews = state["slew"].reshape(shape) * _SIGN
+            self.required = state["rat"].reshape(shape) * -_SIGN
+        for x in (self.arrival, self.slews, self.required):
+            x[~np.isfinite(x)] = np.nan
+        self.live = self._graph["live"].copy()
+        self._stale = False
+        self.stats.update(incremental=seeds is not None, forward_pins=n_forward, backward_pins=n_backward,
+                          build_seconds=t1 - t0, forward_seconds=t2 - t1, backward_seconds=t3 - t2)
+        return self
+
+    def _touched(self, nodes, budget):
+        # 修补之前估计改动涉及的引脚数：被修改的 gate 的引脚、被修改的 net 上的引脚和断言变了的端口，超过 budget 就不用再数了
+        g = self.netlist.graph
+        count = len(self._dirty) + len(self._dirty_ports)
+        for n in nodes:
+            if count > budget:
+                break
+            if n in self._gate_pins:
+                count += len(self._gate_pins[n])
+            elif n in g:
+                attr = g.nodes[n]
+                if attr.get("type") in ("gate", "flipflop"):
+                    count += len(attr.get("fanin", ())) + len(attr.get("fanout", ()))
+                else:
+                    count += len(g.pred[n]) + len(g.succ[n])
+        return count
+
+    def _sources(self, pins, at, slew):
+        # 把 pins 的 arrival time 和 slew 设回初值：输入端口为断言的值，其余为 -inf (还没有被传播到)
+        keys = (pins[:, None] * 4 + np.arange(4)).ravel()
+        at[:, keys] = slew[:, keys] = -np.inf
+        for p in pins[self._graph["is_input"][pins]]:
+            port = self.pins[p]
+            at[:, 4 * p:4 * p + 4] = _SIGN * self.pi_at.get(port, np.zeros(4))
+            slew[:, 4 * p:4 * p + 4] = _SIGN * self.pi_slew.get(port, np.zeros(4))
+        return keys
+
+    def _relax(self, batch, at, slew):
+        # 算出一批 arc 的延时 (cell arc 的存到 _state["cell_delay"])，目标引脚的 arrival time 和 slew 取各条 arc 的最大值
+        luts = self.luts
+        values = luts.lut_values.reshape(-1)
+        n_corners = len(self.corners)
+        net, cell = batch["net"], batch["cell"]
+        with np.errstate(invalid="ignore"):
+            si = slew[:, net["src"]] * net["sign"]
+            net_at = at[:, net["src"]] + net["sign"] * net["delay"]
+            net_slew = net["sign"] * np.sqrt(si * si + net["impulse"])
+            si = (slew[:, cell["src"]] * cell["sign"]).ravel()
+            valid = np.isfinite(si)
+            si = np.where(valid, si, 0.0)
+            index, weight = lut_weights(luts, cell["delay_table"], si, cell["load"])
+            d = np.where(valid, (values[index] * weight).sum(1), np.nan)
+            so = (values[index + cell["slew_shift"]] * weight).sum(1)
+            k = cell["own_axes"]
+            if len(k):
+                so[k] = lut_lookup(luts, cell["slew_table"][k], si[k], cell["load"][k])
+            d, so = d.reshape(n_corners, -1), so.reshape(n_corners, -1)
+            if cell["missing"] is not None:
+                d[cell["missing"]] = np.nan
+            cell_at = at[:, cell["src"]] + cell["sign"] * d
+            cell_slew = cell["sign"] * so
+            a = np.concatenate([net_at, cell_at], axis=1)
+            s = np.concatenate([net_slew, cell_slew], axis=1)
+            invalid = ~np.isfinite(a)
+            a[invalid] = s[invalid] = -np.inf
+            at[:, batch["keys"]] = np.maximum.reduceat(a, batch["starts"], axis=1)
+            slew[:, batch["keys"]] = np.maximum.reduceat(s, batch["starts"], axis=1)
+        self._state["cell_delay"][:, cell["arc"]] = d
+
+    def _pull(self, batch, rat):
+        # 一批 arc 给每个 (源引脚, 列) 的 required time 候选的最大值
+        delay = np.concatenate([batch["net"]["delay"], self._state["cell_delay"][:, batch["cell"]["arc"]]], axis=1)
+        with np.errstate(invalid="ignore"):
+            cand = rat[:, batch["dst"]] + batch["sign"] * delay
+        cand[np.isnan(cand)] = -np.inf
+        return batch["src_keys"], np.maximum.reduceat(cand[:, batch["src_order"]], batch["src_starts"], axis=1)
+
+    def _changed(self, old, new):
+        # 每个引脚 (四列、所有工艺角) 的值是否变了
+        return (old != new).reshape(len(self.corners), -1, 4).any(axis=(0, 2))
+
+    def _forward(self, seeds=None, budget=None):
+        # seeds 为空时所有引脚从头传播；否则从 seeds 出发，按层号从小到大重算，值没变的引脚不再往后传。
+        # 返回 (重算的引脚数, 延时变了的 cell arc 的源引脚)；重算的引脚超过 budget 时中途放弃，返回 (None, None)
+        G = self._graph
+        n_corners = len(self.corners)
+        if seeds is None:
+            width = 4 * len(self.pins)
+            self._state = state = {"at": np.full((n_corners, width), -np.inf), "slew": np.full((n_corners, width), -np.inf),
+                                   "cell_delay": np.full((n_corners, len(G["cell"]["alive"])), np.nan)}
+            at, slew = state["at"], state["slew"]
+            self._sources(G["inputs"], at, slew)
+            for batch in self._schedule():
+                self._relax(batch, at, slew)
+            return len(self.pins), None
+
+        state = self._state
+        at, slew, cell_delay = state["at"], state["slew"], state["cell_delay"]
+        self._adjacency()
+        level = G["level"]
+        # 在环上的引脚不会被传播到
+        self._sources(seeds[level[seeds] < 0], at, slew)
+        pending = defaultdict(list)          # {层号: [引脚]}
+        self._push(pending, seeds)
+        back = [np.zeros(0, dtype=np.int64)]
+        count = 0
+        while pending:
+            pins = np.unique(np.concatenate(pending.pop(min(pending))))
+            count += len(pins)
+            if budget is not None and count > budget:
+                return None, None
+            keys = (pins[:, None] * 4 + np.arange(4)).ravel()
+            old_at, old_slew = at[:, keys], slew[:, keys]
+            self._sources(pins, at, slew)
+            batch = self._batch(pins, "fanin")
+            if batch is not None:
+                arcs = batch["cell"]["arc"]
+                old_delay = cell_delay[:, arcs]
+                self._relax(batch, at, slew)
+                new_delay = cell_delay[:, arcs]
+                diff = ((old_delay != new_delay) & ~(np.isnan(old_delay) & np.isnan(new_delay))).any(axis=0)
+                back.append(G["cell"]["rows"][arcs[diff], 0])
+            changed = pins[self._changed(old_at, at[:, keys]) | self._changed(old_slew, slew[:, keys])]
+            if len(changed):
+                self._push(pending, self._neighbors(changed, "fanout")[2])
+        return count, np.concatenate(back)
+
+    def _push(self, pending, pins):
+        # 按层号把引脚放进待处理的桶里
+        level = self._graph["level"][pins]
+        keep = level >= 0
+        pins, level = pins[keep], level[keep]
+        if not len(pins):
+            return
+        order = np.argsort(level, kind="stable")
+        pins, level = pins[order], level[order]
+        bounds = np.append(self._starts(level), len(level))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            pending[int(level[a])].append(pins[a:b])
+
+    def _base_rat(self, at, slew):
+        # required time 的初值：输出端口的断言，和 flipflop 上 setup/hold 检查给出的值。
+        # required time 存储时 late 列取负号 (late 取最小值)，同样全部用 np.maximum 归约
+        G = self._graph
+        n_corners, width = at.shape
+        rat = np.full((n_corners, width), -np.inf)
+        for p in G["outputs"]:
+            if self.pins[p] in self.po_rat:
+                rat[:, 4 * p:4 * p + 4] = -_SIGN * self.po_rat[self.pins[p]]
+
+        alive = G["check"]["alive"]
+        checks, tables = G["check"]["rows"][alive], G["check"]["tables"][alive]
+        if len(checks):
+            # setup: rat_late(D) = at_early(CK) + 周期 - setup(slew_late(D), slew_early(CK))
+            # hold:  rat_early(D) = at_late(CK) + hold(slew_early(D), slew_late(CK))
+            # 时钟引脚的另一个 split 也得到一个 required time, 使它的 slack 与这个检查的 slack 相同，这样约束可以沿时钟树往回传
+            period = self.clock[1] if self.clock is not None else 0.0
+            d, ck, split, edge = checks[:, 0], checks[:, 1], checks[:, 2], checks[:, 3]
+            ck_col = 2 * (1 - split) + edge
+            ck_at = at[:, ck * 4 + ck_col] * _SIGN[ck_col]
+            ck_slew = slew[:, ck * 4 + ck_col] * _SIGN[ck_col]
+            base = np.arange(n_corners)[:, None] * width
+            with np.errstate(invalid="ignore"):
+                for tr in (RISE, FALL):
+                    col = 2 * split + tr
+                    d_at = at[:, d * 4 + col] * _SIGN[col]
+                    d_slew = slew[:, d * 4 + col] * _SIGN[col]
+                    t = tables[:, tr * n_corners:(tr + 1) * n_corners].T
+                    valid = np.isfinite(d_slew) & np.isfinite(ck_slew) & (t >= 0)
+                    c = lut_lookup(self.luts, np.where(valid, t, 0).ravel(), np.where(valid, d_slew, 0.0).ravel(),
+                                   np.where(valid, ck_slew, 0.0).ravel()).reshape(n_corners, -1)
+                    c = np.where(split == LATE, period - c, c)
+                    r = np.where(valid & np.isfinite(ck_at), -_SIGN[col] * (ck_at + c), -np.inf)
+                    np.maximum.at(rat.reshape(-1), (base + d * 4 + col).ravel(), r.ravel())
+                    r = np.where(valid & np.isfinite(d_at), -_SIGN[ck_col] * (d_at - c), -np.inf)
+                    np.maximum.at(rat.reshape(-1), (base + ck * 4 + ck_col).ravel(), r.ravel())
+        return rat
+
+    def _backward(self, seeds=None, budget=None):
+        # seeds 为空时所有引脚从头传播；否则从 seeds 和初值变了的引脚出发，按层号从大到小重算，值没变的引脚不再往前传。
+        # 返回重算的引脚数；超过 budget 时中途放弃，返回 None
+        G, state = self._graph, self._state
+        base = self._base_rat(state["at"], state["slew"])
+        if seeds is None:
+            rat = base.copy()
+            for batch in reversed(self._schedule()):
+                keys, v = self._pull(batch, rat)
+                rat[:, keys] = np.maximum(rat[:, keys], v)
+            state.update(rat=rat, base=base)
+            return len(self.pins)
+
+        rat = state["rat"]
+        seeds = np.concatenate([seeds, np.flatnonzero(self._changed(state["base"], base))])
+        state["base"] = base
+        level = G["level"]
+        cyclic = seeds[level[seeds] < 0]
+        rat[:, (cyclic[:, None] * 4 + np.arange(4)).ravel()] = base[:, (cyclic[:, None] * 4 + np.arange(4)).ravel()]
+        pending = defaultdict(list)
+        self._push(pending, seeds)
+        count = 0
+        while pending:
+            pins = np.unique(np.concatenate(pending.pop(max(pending))))
+            count += len(pins)
+            if budget is not None and count > budget:
+                return None
+            keys = (pins[:, None] * 4 + np.arange(4)).ravel()
+            old = rat[:, keys]
+            rat[:, keys] = base[:, keys]
+            batch = self._batch(pins, "fanout")
+            if batch is not None:
+                src_keys, v = self._pull(batch, rat)
+                rat[:, src_keys] = np.maximum(rat[:, src_keys], v)
+            changed = pins[self._changed(old, rat[:, keys])]
+            if len(changed):
+                self._push(pending, self._neighbors(changed, "fanin")[2])
+        return count
+
+    # 查询
+    def _corner(self, corner):
+        if corner is None:
+            return 0
+        return self.corners.index(corner) if isinstance(corner, str) else corner
+
+    def at(self, pin, corner=None):
+        """引脚的四列 arrival time (E/R, E/F, L/R, L/F)，没有被传播到时为 nan. corner 为工艺角名或下标，默认第一个。"""
+        return self.arrival[self._corner(corner), self.pin_index[pin]]
+
+    def slew(self, pin, corner=None):
+        """引脚的四列 slew."""
+        return self.slews[self._corner(corner), self.pin_index[pin]]
+
+    def rat(self, pin, corner=None):
+        """引脚的四列 required arrival time, 不在任何约束路径上时为 nan."""
+        return self.required[self._corner(corner), self.pin_index[pin]]
+
+    def slack(self, pin, corner=None):
+        """引脚的四列 slack：early 为 at - rat, late 为 rat - at."""
+        c, p = self._corner(corner), self.pin_index[pin]
+        return (self.required[c, p] - self.arrival[c, p]) * _SIGN
+
+    @property
+    def slacks(self):
+        """(C, N, 4) 的 slack."""
+        return (self.required - self.arrival) * _SIGN
+
+    def report(self, op, args):
+        """
+        按 TAU15 .ops 的语法查询第一个工艺角，可以直接作为 OpsRunner 的 reporter, 例如 report("report_at", ["-pin", "nx1", "-late", "-fall"]).
+        网表或断言在上次更新之后被修改过时，先做一次增量更新。默认是 early rise. 不支持的操作返回 None.
+        """
+        if self.stale:
+            self.update_timing()
+        query = {"report_at": self.at, "report_rat": self.rat, "report_slack": self.slack, "report_slew": self.slew}.get(op)
+        if query is None:
+            return None
+        pin = args[args.index("-pin") + 1]
+        col = 2 * ("-late" in args) + ("-fall" in args)
+        return float(query(pin)[col])
+
+    def write_reports(self, out_dir):
+        """
+        按 TAU19 的输出格式，为每个工艺角写出 at.<工艺角>.txt 和 slews.<工艺角>.txt. 被删掉的引脚 (self.live 为 False) 不输出。
+
+        Returns
+        -------
+        list of pathlib.Path
+                写出的文件。
+        """
+        out_dir = Path(out_dir)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        live = np.flatnonzero(self.live)
+        pins = [self.pins[p] for p in live]
+        for c, corner in enumerate(self.corners):
+            for kind, title, values in (("at", "Arrival time", self.arrival), ("slews", "Slew", self.slews)):
+                path = out_dir / f"{kind}.{corner}.txt"
+                with open(path, 'w') as f:
+                    f.write(format_report(title, values[c, live], pins))
+                files.append(path)
+        return files
+
+if __name__ == "__main__":
+    import sys
+    from graphize import HeterDiG_GateWireNodePinEdge
+    from libparser import read_liberty
+    from opsrunner import OpsRunner
+
+    # python timer.py [benchmarks/TAU15/c17] [输出目录]: 用 Early/Late 两个库做一次时序分析，打印每个引脚的 arrival time, slew 和 slack,
+    # 给出输出目录时再按 TAU19 的格式写出 at.default.txt 和 slews.default.txt.
+    # 有 .ops 脚本时再执行一遍，比较每次查询前增量更新和全量重算的用时
+    design_dir = Path(sys.argv[1] if len(sys.argv) > 1 else Path(__file__).parent / "benchmarks/TAU15/c17")
+    name = design_dir.name
+    libs = (read_liberty(design_dir / f"{name}_Early.lib"), read_liberty(design_dir / f"{name}_Late.lib"))
+    timing = parse_timing(design_dir / f"{name}.timing")
+
+    def load():
+        netlist = HeterDiG_GateWireNodePinEdge(name)
+        netlist.build(design_dir / f"{name}.v", vlib=[design_dir / f"{name}_Early.lib"])
+        netlist.read_spef(design_dir / f"{name}.spef")
+        return netlist
+
+    timer = Timer(load(), libs)
+    timer.apply_timing(timing)
+    timer.update_timing()
+    for title, values in (("Arrival time", timer.arrival[0]), ("Slew", timer.slews[0]), ("Slack", timer.slacks[0])):
+        print(format_report(title, values, timer.pins))
+    if len(sys.argv) > 2:
+        print("写出", [str(p) for p in timer.write_reports(sys.argv[2])])
+    print(timer.stats)
+
+    ops = design_dir / f"{name}.ops"
+    if ops.is_file():
+        results = dict()
+        for incremental in (False, True):
+            runner = OpsRunner(load())
+            timer = Timer(runner.netlist, libs, ports=runner.ports)
+            timer.apply_timing(timing)
+            timer.update_timing()
+            seconds, pins = [], []
+
+            def reporter(op, args):
+                if timer.stale:
+                    t0 = time.perf_counter()
+                    timer.update_timing(incremental)
+                    seconds.append(time.perf_counter() - t0)
+                    pins.append(timer.stats["forward_pins"] + timer.stats["backward_pins"])
+                return timer.report(op, args)
+
+            runner.reporter = reporter
+            runner.run(ops)
+            results[incremental] = [r[2] for r in runner.reports]
+            print(f"{'增量' if incremental else '全量'}: {len(seconds)} 次更新，共 {sum(seconds)*1000:.2f} ms, "
+                  f"平均每次重算 {np.mean(pins):.1f} / {len(timer.pins)} 个引脚")
+            results[incremental, "seconds"] = sum(seconds)
+        same = all(a == b or (a is not None and b is not None and np.isclose(a, b, equal_nan=True)) for a, b in zip(results[False], results[True]))
+        print(f"{name}.ops: 增量更新比全量重算快 {results[False, 'seconds'] / results[True, 'seconds']:.2f} 倍，查询结果{'一致' if same else '不一致'}")
@@ -1,29 +1,390 @@
 import re
+import os
+import sys
+import codecs
+import mmap
+import gc
 from pathlib import Path
-from itertools import groupby
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from libparser import read_liberty
+
+# 解析结果的格式版本。解析规则或 gate 元组的格式有改动时要加一，buildcache 会据此让旧的缓存失效。
+PARSER_VERSION = 1
+
+# 每次从网表文件中读入的字符数。峰值内存只取决于这个值和最长的那条语句，而与文件大小无关。
+CHUNK_SIZE = 1 << 20
+# 小于这个字节数的网表即使指定了 workers 也串行解析
+PARALLEL_MIN_SIZE = 1 << 22
+
+_COMMENT = re.compile(r"//[^\n]*(?=\n)|/\*.*?\*/", re.DOTALL)
+_ENDMODULE = re.compile(r"^endmodule\b\s*")
+_COMMENT_MARK = re.compile(rb"/\*|//")
+_MODULE_NAME = re.compile(r"(\w+)")
+_GATE_TYPE = re.compile(r"[a-zA-Z0-9]+_*X\d+")
+_CELL_SPLIT = re.compile(r"([a-zA-Z0-9]*)_*[a-zA-Z0-9](\d+)")
+_INSTANCE = re.compile(r"\s*([\w_]+)\s*\(\s*(\..*?\))\s*\)\s*$", re.DOTALL)
+_INSTANCE_NAME = re.compile(r"\s*(\w+)\s*\(")
+_PIN = re.compile(r"\.\s*(\w+)\s*\(\s*([^\s()]*)\s*\)")
+_DECLARATIONS = ("input", "output", "wire")
+_VLIB_MODULE = re.compile(r"(?<![\w\\])(module|primitive)\s+\\?(\w+)")
+_VLIB_PORT = re.compile(r"(?<![\w\\])(input|output|inout)\s+([^;]*)$")
+# Liberty / verilog 中的方向关键字 -> gate 引脚元组中的方向标记
+PIN_DIRECTIONS = {"input": "in", "output": "out", "inout": "inout", "internal": "internal"}
+
+@contextmanager
+def gc_paused():
+    """
+    在批量创建大量小对象（gate 列表、引脚元组等）期间暂停循环垃圾回收。
+    这些对象之间没有循环引用，而频繁触发的分代回收会反复扫描已经建好的几百万个对象。
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
 def flatten(nested_list, io_flag=1):
     """展平一个嵌套列表，列表元素是字符串也可以。同时去除英文逗号和空格"""
-    if io_flag == 0: 
+    if io_flag == 0:
         return (elem.replace(".", "").replace(" ", "") for sublist in nested_list for elem in (flatten(sublist) if isinstance(sublist, list) else [sublist]))
     else:
         return [elem.replace(".", "").replace(" ", "") for sublist in nested_list for elem in (flatten(sublist) if isinstance(sublist, list) else [sublist])]
 
-def verilog_parser(path, io_flag=1, vlib=None): 
-    """ 
+def instance_post_process(x):
+    """
+    把初步读到的 gate 中的引脚信息和 gate 功能提取出来，完全以 列表类型 来输入输出。
+    x 形如 ('CLKBUF_X2', 'inst_19', '.A(net_17), .Z(net_18)')，
+    返回 ['inst_19', 'CLKBUF_X2', ('CLKBUF', '2'), ('A', 'net_17'), ('Z', 'net_18')]
+    """
+    x = flatten(list(map(lambda y: y.split(","), x)));
+    return [x[1], x[0], re.match(r"([a-zA-Z0-9]*)_*[a-zA-Z0-9](\d+)",x[0]).groups()] + [x[i] if i<2 else re.match(r'(\w*)\((\w*)\)',x[i]).groups() for i in range(2,len(x))]
+
+# cell 类型 -> (cell 类型, (功能, 驱动强度)) 的缓存。一个工艺库里的 cell 类型不过几百种，
+# 同一种 cell 的所有 gate 共享同一个 cell 字符串和同一个元组，既省去了重复的正则匹配，也省内存。
+_cell_types = {}
+
+def split_cell_type(cell):
+    """
+    把 cell 类型拆成功能和驱动强度，例如 "INV_X2" -> ("INV", "2")，结果按 cell 类型缓存。
+
+    Returns
+    -------
+    (str, tuple of str) or None
+            缓存中的 cell 类型字符串及其拆分结果。不是 gate 类型（形如 XXX_X2）的名称返回 None.
+    """
+    try:
+        return _cell_types[cell]
+    except KeyError:
+        entry = None
+        if _GATE_TYPE.fullmatch(cell):
+            entry = (cell, _CELL_SPLIT.match(cell).groups())
+        _cell_types[cell] = entry
+        return entry
+
+def decode_instance(cell, rest):
+    """
+    一次扫描解码一条例化语句，得到实例名、cell 类型、功能/驱动强度拆分和所有的 引脚-线网 对。
+
+    Parameters
+    ----------
+    cell : str
+            语句的第一个词，即 cell 类型，如 "CLKBUF_X2"
+    rest : str
+            语句的剩余部分，如 "inst_19 ( .A(net_17), .Z(net_18) )"
+
+    Returns
+    -------
+    list or None
+            形如 ['inst_19', 'CLKBUF_X2', ('CLKBUF', '2'), ('A', 'net_17'), ('Z', 'net_18')]。
+            cell 不是 gate 类型或语句无法解析时返回 None.
+    """
+    entry = split_cell_type(cell)
+    if entry is None:
+        return None
+    m = _INSTANCE_NAME.match(rest)
+    if m is None:
+        return None
+    return [m.group(1), entry[0], entry[1], *_PIN.findall(rest, m.end())]
+
+def read_liberty_pin_directions(path):
+    """
+    从 Liberty (.lib) 文件中读出每个 cell 每个引脚的方向。解析由 libparser.read_liberty 完成，因此同样会用到它的二进制缓存。
+
+    Returns
+    -------
+    dict = {str cell_type: {str pin: str direction}}
+            direction 取 "in", "out", "inout" 或 "internal"
+    """
+    return read_liberty(path).pin_directions()
+
+def read_verilog_pin_directions(path):
+    """
+    从 verilog 工艺库（例如 NangateOpenCellLibrary.v）中读出每个 module 每个端口的方向。
+    primitive (UDP) 里的端口声明会被忽略。
+
+    Returns
+    -------
+    dict = {str cell_type: {str pin: str direction}}
+            direction 取 "in", "out" 或 "inout"
+    """
+    table = dict()
+    current = None    # 当前所在的 module 的端口表
+    for s in iter_statements(path):
+        m = _VLIB_MODULE.search(s)
+        if m:
+            current = table.setdefault(m.group(2), dict()) if m.group(1) == "module" else None
+            continue
+        m = _VLIB_PORT.search(s)
+        if m and current is not None:
+            for pin in m.group(2).split(","):
+                current[pin.strip()] = PIN_DIRECTIONS[m.group(1)]
+    return table
+
+def read_vlib(vlib):
+    """
+    读取一个或多个工艺库，返回引脚方向表 {cell_type: {pin: direction}}，供 verilog_parser 和 build 做 O(1) 查询。
+    以 .lib 结尾的文件按 Liberty 格式读，其余按 verilog 工艺库读。多个库中同名的 cell 以后读的为准。
+
+    Parameters
+    ----------
+    vlib : str, pathlib.Path, dict or iterable of them
+            工艺库路径。如果已经是一个方向表 (dict)，则原样返回。
+
+    Returns
+    -------
+    dict = {str cell_type: {str pin: str direction}}
+    """
+    if isinstance(vlib, dict):
+        return vlib
+    if isinstance(vlib, (str, Path)):
+        vlib = [vlib]
+    table = dict()
+    for path in vlib:
+        if str(path).endswith(".lib"):
+            table.update(read_liberty_pin_directions(path))
+        else:
+            table.update(read_verilog_pin_directions(path))
+    return table
+
+def annotate_pin_directions(gate, pin_dirs):
+    """
+    按引脚方向表给 gate 的每个引脚元组补上方向，例如 ('A', 'net_17') -> ('A', 'net_17', 'in')。
+    只有当 gate 的 cell 类型和所有引脚都能在表中查到时才会补充，否则 gate 保持原样，留给 build 去猜。
+    """
+    dirs = pin_dirs.get(gate[1])
+    if dirs:
+        try:
+            gate[3:] = [(pin, net, dirs[pin]) for pin, net in gate[3:]]
+        except KeyError:
+            pass
+    return gate
+
+def iter_statements(path, chunk_size=CHUNK_SIZE, start=0, end=None):
+    """
+    逐块读取网表文件，依次产生其中以分号结尾的语句。
+    产生的语句已经去掉了注释、结尾的分号和 endmodule 关键字，且所有连续空白都被压缩成了单个空格。
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+            网表文件路径。
+    chunk_size : int
+            每次读入的字符数。
+    start, end : int
+            只读取文件中 [start, end) 这一段字节。end 为 None 时读到文件末尾。
+            并行解析时每个进程各读一段，分段点由 split_points 给出。
+
+    Yields
+    ------
+    str
+            形如 "CLKBUF_X2 inst_19 ( .A(net_17), .Z(net_18) )" 的语句。
+    """
+    pending = ""    # 已读入、已去掉注释、但还没遇到分号的语句片段，长度不超过最长的一条语句
+    tail = ""       # 还没读完的注释（// 之后还没遇到换行，或 /* 之后还没遇到 */），和下一块拼起来再删
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remain = float("inf") if end is None else end - start
+        while True:
+            raw = f.read(int(min(chunk_size, remain)))
+            remain -= len(raw)
+            chunk = decoder.decode(raw, final=not raw)
+            if raw and not chunk:
+                continue
+
+            if chunk:
+                text = _COMMENT.sub("", tail + chunk)
+                # 完整的注释都删掉之后，剩下的第一个注释符号就是跨块的注释的开头，从它开始的部分留到下一块再处理。
+                # 块末尾单独的 / 可能是被切开的注释符号，也先留着
+                cut = min((i for i in (text.find("//"), text.find("/*")) if i >= 0), default=len(text))
+                if cut == len(text) and text.endswith("/"):
+                    cut -= 1
+                text, tail = text[:cut], text[cut:]
+            else:
+                # 文件末尾的 // 注释没有换行；读到文件末尾仍未闭合的 /* 注释直接丢弃
+                text = _COMMENT.sub("", tail + "\n")
+                unclosed = text.find("/*")
+                if unclosed >= 0:
+                    text = text[:unclosed]
+
+            pending += text
+            *statements, pending = pending.split(";")
+            for s in statements:
+                s = _ENDMODULE.sub("", " ".join(s.split()))
+                if s:
+                    yield s
+
+            if not chunk:
+                break
+
+def verilog_records(path, chunk_size=CHUNK_SIZE, start=0, end=None, pin_dirs=None):
+    """
+    以生成器的形式逐条产生网表中的记录。每次只在内存中保留一条语句。
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+            网表文件路径。
+    chunk_size : int
+            每次读入的字符数。
+    start, end : int
+            只解析文件中 [start, end) 这一段字节，参见 iter_statements.
+    pin_dirs : dict
+            read_vlib 返回的引脚方向表。指定了的话每个 gate 的引脚元组都会带上方向（见 annotate_pin_directions）。
+
+    Yields
+    ------
+    (kind, payload) : tuple
+            kind 是 "module", "input", "output", "wire", "gate" 之一。
+            + kind 为 "module" 时, payload 是模块名, 如 "s27"
+            + kind 为 "input", "output", "wire" 时, payload 是该语句声明的 wire 名称列表, 如 ["G1"]
+            + kind 为 "gate" 时, payload 形如 ['inst_19', 'CLKBUF_X2', ('CLKBUF', '2'), ('A', 'net_17'), ('Z', 'net_18')]
+            不认识的语句会被直接忽略。
+    """
+    for s in iter_statements(path, chunk_size, start, end):
+        head, _, rest = s.partition(" ")
+        if head in _DECLARATIONS:
+            yield head, [x.strip() for x in rest.split(",")]
+        elif head == "module":
+            yield head, _MODULE_NAME.match(rest).group(1)
+        else:
+            gate = decode_instance(head, rest)
+            if gate is not None:
+                if pin_dirs is not None:
+                    annotate_pin_directions(gate, pin_dirs)
+                yield "gate", gate
+
+def _comment_state(data, start, end, state=None):
+    """
+    从 start 扫描到 end, 返回扫描完之后所在的注释：None 表示不在注释里，b"*/" 表示在 /* */ 注释里，b"\\n" 表示在 // 注释里。
+    state 是 start 处所在的注释。只在注释符号之间跳转，不逐行扫描。
+    """
+    pos = start
+    while pos < end:
+        if state is None:
+            m = _COMMENT_MARK.search(data, pos, end)
+            if m is None:
+                return None
+            state, pos = (b"*/" if m.group() == b"/*" else b"\n"), m.end()
+        else:
+            i = data.find(state, pos, end)
+            if i < 0:
+                return state
+            state, pos = None, i + len(state)
+    return state
+
+def split_points(path, n):
+    """
+    把网表文件按字节大致均分成 n 段，并把每个分段点都挪到某个以分号结尾的行之后，
+    保证每一段都只包含完整的语句。为了不切进注释里，含有注释符号的行和跨行的 /* */ 注释里的行都不会被选作分段点。
+
+    Returns
+    -------
+    list of int
+            升序的分段点，首尾分别是 0 和文件大小。相邻两个分段点构成一段 [start, end).
+    """
+    size = os.path.getsize(path)
+    points = [0]
+    if not size:
+        return points
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for i in range(1, n):
+            pos = max(size * i // n, points[-1])
+            if pos:
+                pos = data.find(b"\n", pos) + 1 or size    # 跳过被切断的那一行
+            # 上一个分段点一定不在注释里，从它扫描过来就知道 pos 是否落在注释里
+            state = _comment_state(data, points[-1], pos)
+            while pos < size:
+                end = data.find(b"\n", pos) + 1 or size
+                line = data[pos:end]
+                inside = state
+                state = _comment_state(data, pos, end, state)
+                pos = end
+                if inside is None and line.rstrip().endswith(b";") and b"//" not in line and b"/*" not in line and b"*/" not in line:
+                    break
+            if pos > points[-1]:
+                points.append(pos)
+    if points[-1] < size:
+        points.append(size)
+    return points
+
+def _parse_range(args):
+    # 进程池的工作函数，必须定义在模块顶层才能被 pickle.
+    path, chunk_size, start, end, pin_dirs = args
+    with gc_paused():
+        return list(verilog_records(path, chunk_size, start, end, pin_dirs))
+
+def parallel_verilog_records(path, workers, chunk_size=CHUNK_SIZE, n_splits=None, pin_dirs=None):
+    """
+    verilog_records 的多进程版本。文件在分号处被切成 n_splits 段，交给 workers 个进程分别解析，
+    再按文件中的先后顺序依次产生记录，因此产生的记录顺序与串行解析完全相同。
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+            网表文件路径。
+    workers : int
+            进程数。
+    chunk_size : int
+            每个进程每次读入的字符数。
+    n_splits : int
+            文件被切成的段数，默认是 workers 的 4 倍，以便各进程的负载更均衡。
+    pin_dirs : dict
+            引脚方向表，同 verilog_records.
+
+    Yields
+    ------
+    (kind, payload) : tuple
+            同 verilog_records.
+    """
+    points = split_points(path, n_splits or 4 * workers)
+    tasks = [(path, chunk_size, start, end, pin_dirs) for start, end in zip(points[:-1], points[1:])]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # executor.map 按提交顺序返回结果，这就保证了合并后的 gate 顺序与串行时一致
+        for records in executor.map(_parse_range, tasks):
+            yield from records
+
+def verilog_parser(path, io_flag=1, vlib=None, chunk_size=CHUNK_SIZE, workers=1):
+    """
     功能
     -------
     对例化网表文件进行解析，并返回结果。只能解析非常简单的例化网表，文件内容格式可以参考 TAU15, TAU19 或 ISPD13 benchmark circuits.
     简而言之，其中的每个例化网表中只有 wire, input, output, submodule 这四种语句，均以分号作为结尾，且仅有一个顶层模块。此外，这样的简单网表还满足：
     + No hierarchy, no buses, no behavioral keywords
     + Single clock domain
-    + Cell pins are only connected with wires 
+    + Cell pins are only connected with wires
     + Inputs and outputs are implicitly connected to wires with the same name
     + No unconnected pins, no escape characters in names
     + No power or ground nets
-    
+
     理论上 wire 和 net 的概念应当有所区别。但我们总是用名为 wire 的变量指代 net 或 wire.
-    
+
+    文件是按块流式读取的（见 verilog_records），不会一次性读入整个文件。
+    io_flag = 0 时, gates 是一个边读文件边解析的生成器, 此时峰值内存只取决于 chunk_size 和最长的那条语句。
+
     Parameters
     ----------
     path : str or pathlib.Path
@@ -31,16 +392,23 @@ def verilog_parser(path, io_flag=1, vlib=None):
     io_flag : bool
             0 表示以 生成器类型 返回, 1 表示以 列表类型 返回.
             实验下来，生成器 IO 比 列表 IO 快 5~9 倍。
-    vlib : str or pathlib.Path 【相应功能待实现】
-            指定用来规定引脚关系的 verilog submodule 工艺库，例如 NangateOpenCellLibrary.v
-            如果指定了，则会自动为其更新引脚信息。不指定则默认为 None
-    
+    vlib : str, pathlib.Path, dict or list of them
+            指定用来规定引脚关系的工艺库，可以是 verilog submodule 工艺库（例如 NangateOpenCellLibrary.v），
+            也可以是 Liberty 库（例如 s27_Early.lib），或者是 read_vlib 已经读好的引脚方向表。
+            如果指定了，则会自动为其更新引脚信息，即在引脚元组末尾加上 "in" 或 "out". 不指定则默认为 None
+    chunk_size : int
+            每次从文件中读入的字符数，默认为 1M.
+    workers : int
+            解析所用的进程数，默认为 1, 即在当前进程里串行解析。
+            大于 1 时文件会在分号处被切成若干段并行解析（见 parallel_verilog_records），得到的 gate 顺序与串行解析相同。
+            文件小于 PARALLEL_MIN_SIZE 时仍然串行解析，因为此时启动进程池的开销比解析本身还大。
+
     Returns
     -------
     module_name : str
             网表的设计名，即顶层模块名
     inputs : list or generator of str
-            包含每个 input 端口 的 wire 名称。 
+            包含每个 input 端口 的 wire 名称。
     outputs : list or generator of str
             包含每个 output 端口 的 wire 名称。
     wires : list or generator of str
@@ -48,66 +416,119 @@ def verilog_parser(path, io_flag=1, vlib=None):
     gates : list or generator of sublist
             每个 sublist 都代表一个 gate (或称 submodule).
             例如，网表中的一行 "CLKBUF_X2 inst_19 ( .A(net_17), .Z(net_18) );" 将会转换为一个 sublist 为 ['inst_19', 'CLKBUF_X2', ('CLKBUF', '2'), ('A', 'net_17'), ('Z', 'net_18')]
-            
-    """
-    def split_flatten(nested_list, io_flag=1):
-        # 忽略换行符，用逗号分离出不同的成分，再将得到的嵌套列表展平，
-        # 最后去除每个字符串中多余的空格，以及开头的第一个英文句号
-        if io_flag == 0:
-            nested_list = flatten((x.replace('\n','').split(',') for x in nested_list), io_flag)
-            return (x.strip().lstrip(".") for x in nested_list)
+            如果指定了 vlib, 则会转换为 ['inst_19', 'CLKBUF_X2', ('CLKBUF', '2'), ('A', 'net_17', 'in'), ('Z', 'net_18', 'out')]
+
+    """
+    pin_dirs = read_vlib(vlib) if vlib is not None else None
+    module_name = None
+    inputs, outputs, wires, gates = [], [], [], []
+    declared = {"input": inputs, "output": outputs, "wire": wires}
+    if workers > 1 and os.path.getsize(path) >= PARALLEL_MIN_SIZE:
+        records = parallel_verilog_records(path, workers, chunk_size, pin_dirs=pin_dirs)
+    else:
+        records = verilog_records(path, chunk_size, pin_dirs=pin_dirs)
+
+    # 先读完第一个 gate 之前的 module, input, output 和 wire 声明
+    first_gate = None
+    for kind, payload in records:
+        if kind == "gate":
+            first_gate = payload
+            break
+        elif kind == "module":
+            if module_name is None:
+                module_name = payload
         else:
-            nested_list = flatten([x.replace('\n','').split(',') for x in nested_list])
-            return [x.strip().lstrip(".") for x in nested_list]
-
-    def instance_post_process(x):
-        # 把初步读到的 gates 中的引脚信息和 gate 功能提取出来
-        # 完全以 列表类型 来输入输出。
-        x = flatten(list(map(lambda y: y.split(","), x)));
-        return [x[1], x[0], re.match(r"([a-zA-Z0-9]*)_*[a-zA-Z0-9](\d+)",x[0]).groups()] + [x[i] if i<2 else re.match(r'(\w*)\((\w*)\)',x[i]).groups() for i in range(2,len(x))] 
-        # return [x[1], re.match(r"([a-zA-Z0-9]*)_*X(\d+)",x[0]).groups()] + [x[i] if i<2 else re.match(r'(\w*)\((\w*)\)',x[i]).groups() for i in range(2,len(x))] 
-    
-    with open(path, 'r') as f:
-        content = f.read()
-        
-    pattern = r'(?P<type>module|wire|input|output|(?:[a-zA-Z0-9]+)_*X(?:\d+))\s+(?P<description>[^;]+)\s*;'
-    matches = groupby(re.findall(pattern, content), key=lambda x: x[0] if x[0] in ("wire","input","module","output") else "gate")
-    # 此处 matches 变成一个只有 5 个元素的生成器。第一个元素形如 ('module', <itertools._grouper at 0x26db6c359a0>)，后面则是 input, output, wire 和 gate.
+            declared[kind].extend(payload)
+
+    def gate_stream():
+        # 剩下的几乎都是 gate. 偶尔出现在 gate 之后的声明语句仍然会被追加到对应的列表里。
+        if first_gate is not None:
+            yield first_gate
+        for kind, payload in records:
+            if kind == "gate":
+                yield payload
+            elif kind in declared:
+                declared[kind].extend(payload)
 
     if io_flag == 0:
-        # 这里必须用 list(next(matches)[1]) 而不能用 next(matches)[1]。
-        # 因为如果用一个 母生成器 的元素来生成另一个 子生成器。那么一旦 母生成器 在其他地方被 next 了，那么 子生成器 的 状态也会发生变化
-        module_name = re.findall(r"(\w+)\s*\(", next(next(matches)[1])[1])[0]
-        inputs = split_flatten((x[1] for x in list(next(matches)[1])), io_flag)
-        outputs = split_flatten((x[1] for x in list(next(matches)[1])), io_flag)
-        wires = split_flatten((x[1] for x in list(next(matches)[1])), io_flag)
-        gates = ((x[0],) + re.match(r'\s*([\w_]+)\s*\(\s*(\..*?\))\s*\)\s*', x[1], re.DOTALL).groups() for x in list(next(matches)[1]))
-        
+        return module_name, (x for x in inputs), (x for x in outputs), (x for x in wires), gate_stream()
     else:
-        module_name = re.findall(r"(\w+)\s*\(", next(next(matches)[1])[1])[0]
-        inputs = split_flatten([x[1] for x in next(matches)[1]], io_flag)
-        outputs = split_flatten([x[1] for x in next(matches)[1]], io_flag)
-        wires = split_flatten([x[1] for x in next(matches)[1]], io_flag)
-        gates = [(x[0],) + re.match(r'\s*([\w_]+)\s*\(\s*(\..*?\))\s*\)\s*', x[1], re.DOTALL).groups() for x in next(matches)[1]]
-
-    # 把每个引脚的信息后处理一下，并且把 gate 的功能性前缀提取出来，如 INV_X2 提取为 ("INV","2")
-    gates = (instance_post_process(x) for x in gates) if io_flag == 0 else [instance_post_process(x) for x in gates]
-    
-    return module_name, inputs, outputs, wires, gates
-    
+        with gc_paused():
+            gates = list(gate_stream())
+        return module_name, inputs, outputs, wires, gates
+
+def benchmark_instance_decoder(paths, repeat=5):
+    """
+    例化语句解码的微基准测试：对比旧的 正则匹配 + instance_post_process 与 decode_instance 每秒能解码的 gate 数。
+    只计解码本身的时间，读文件和切分语句的时间不计入。
+
+    Parameters
+    ----------
+    paths : iterable of str or pathlib.Path
+            要测试的网表文件。
+    repeat : int
+            重复次数，取最快的一次。
+
+    Returns
+    -------
+    dict = {str path: (float old_rate, float new_rate)}
+            每个文件上新旧两种解码方式的 gates/s.
+    """
+    import time
+
+    def old_decode(head, rest):
+        if _GATE_TYPE.fullmatch(head):
+            m = _INSTANCE.match(rest)
+            if m:
+                return instance_post_process((head,) + m.groups())
+
+    results = {}
+    for path in paths:
+        statements = [s.partition(" ") for s in iter_statements(path)]
+        statements = [(head, rest) for head, _, rest in statements if head not in _DECLARATIONS and head != "module"]
+        rates = []
+        for decode in (old_decode, decode_instance):
+            _cell_types.clear()
+            best = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                n = sum(1 for head, rest in statements if decode(head, rest) is not None)
+                best = min(best, time.perf_counter() - t0)
+            rates.append(n / best)
+        results[str(path)] = tuple(rates)
+        print(f"{Path(path).name:>12}: {n:>6} gates, 旧解码 {rates[0]:>10.0f} gates/s, 新解码 {rates[1]:>10.0f} gates/s, 加速 {rates[1]/rates[0]:.2f}x")
+    return results
+
 if __name__ == "__main__":
+    import time
+
+    # python vparser.py --bench 会在 benchmarks 自带的设计上跑一遍例化语句解码的微基准测试
+    if len(sys.argv) > 1 and sys.argv[1] == "--bench":
+        benchmarks = Path(__file__).parent / "benchmarks"
+        benchmark_instance_decoder(sorted(benchmarks.glob("TAU15/*/*.v")) + sorted(benchmarks.glob("TAU19/*/design/*.v")))
+        sys.exit()
+
     # io_flag = 0 表示以 生成器 类型作为 IO 类型。io_flag = 1 表示以 List 类型作为 IO 类型。
     # 实验下来，生成器 IO Flow 比 列表 IO Flow 大概会快 5~9 倍。
     io_flag = 1
 
-    # 第一个文件较大（一百多 MB，2300多万行），第二个文件很小（几 kb）
-    file_name = r"Q:\PDKs&Benchmark&etc\Benchmarks\TAU15\vga_lcd_iccad_eval\vga_lcd_iccad.v"
-    #file_name = r"Q:\PDKs&Benchmark&etc\Benchmarks\TAU15\s27\s27.v"
+    # 可以通过命令行传入网表路径，例如 TAU15 的 vga_lcd_iccad.v（一百多 MB，2300多万行）。
+    # 不传则使用 benchmarks 里自带的 s27.v（几 kb）。第二个参数是解析所用的进程数。
+    if len(sys.argv) > 1:
+        file_name = sys.argv[1]
+    else:
+        file_name = Path(__file__).parent / "benchmarks/TAU15/s27/s27.v"
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
 
     path = Path(file_name)
-    module_name, inputs, outputs, wires, gates = verilog_parser(path,io_flag)
+    t0 = time.perf_counter()
+    module_name, inputs, outputs, wires, gates = verilog_parser(path,io_flag,workers=workers)
+    if io_flag == 0:
+        # 生成器只有在被消费时才会真正去读文件
+        n_gates = sum(1 for _ in gates)
+    t1 = time.perf_counter()
 
-    if io_flag == 1:  
+    if io_flag == 1:
         print("------------------------------")
         print("|######| Design: " + module_name + " |######|\n ------------------------------")
         print("Input ports are listed as follows (8 items at most): " )
@@ -122,5 +543,11 @@ if __name__ == "__main__":
         print("Gates are listed as follows (8 items at most): " )
         print(gates[0:min(8,len(gates))])
         print("------------------------------")
-    else:                     
-        pass
\ No newline at end of file
+        n_gates = len(gates)
+    print(f"解析 {n_gates} 个 gate 用时 {t1-t0:.3f} s (文件大小 {path.stat().st_size/2**20:.2f} MB, {workers} 个进程)")
+    try:
+        # 只有 Unix 上有 resource 模块。Linux 上 ru_maxrss 的单位是 KB.
+        import resource
+        print(f"主进程峰值内存 {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/2**10:.2f} MB")
+    except ImportError:
+        pass